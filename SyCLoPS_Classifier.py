@@ -7,13 +7,22 @@ print('Please change the constants and files names accordingly in the first part
 import pandas as pd 
 import numpy as np
 import xarray as xr
-import math
+import os
 import time
 from scipy.spatial import cKDTree
-from scipy import stats
+from scipy.ndimage import maximum_filter1d
 import multiprocess as ma
-import cftime
-import warnings
+import itertools
+import shutil
+import glob
+import datetime
+import tempfile
+import hashlib
+import ctypes
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.csv as pacsv
+from SyCLoPS_io import CALENDARS,TRACK_FLAGS,time_fields,track_hours,hours_isotime,isotime_hours,blobstats_cache,read_blobstats,read_blobstats_after,share_arrays,attach_arrays,shared_dir,open_report,start_stage,end_stage #Shared with optional/Blob_idtag.py
 
 #--------Constants and File Naming (Change Accordingly)-------#
 nprocess=64 # Number of processors to use for parallel computation in this program
@@ -23,71 +32,395 @@ InputFileName=f'input_track/SyCLoPS_input_{model_data_name}.parquet' #Choose the
 SizeBlobStatFile=f'blobstats/{model_data_name}_size_blob_stats.txt' #Enter a filename for the output of TE's BlobStats. 
 QStrackFileName=f'other_info/{model_data_name}_QS_track_info.csv' #Choose a filename for the output quasi-stationary track information. This file will be generated by the program.
 ClassifiedOutFile=f'classified_track/SyCLoPS_classified_{model_data_name}.parquet' #Choose the output filename of the final classified dataset.
+ClassifiedDatasetDir=None #Also write the classified catalog as a hive-partitioned parquet dataset in this directory (year=YYYY/part-0.parquet, see write_dataset), e.g., f'classified_track/SyCLoPS_classified_{model_data_name}'. None writes no dataset.
+DatasetByFamily=False #Partition the dataset by the label family of Short_Label (see LABEL_FAMILY) within each year too (year=YYYY/family=tropical/part-0.parquet).
+DatasetRowGroup=100000 #Maximum number of nodes in a row group of the dataset files
 ZSFile='ZSfile_general.nc' #The universal invariant surface geopotential file provided by the program. No need to change this.
 max_gap_hour=12 #the default max_gap setting in StitchNodes. No need to change in most cases.
-grid_res=0.25 * 0.25 #LAT x LON, the CMIP model nominal resolution in deg^2, or the approximate area of Healpix grid cells in deg^2.
+ConnectivityFile=None #The TE connectivity file of an unstructured grid (e.g., HEALPix; connectivity_file in SyCLoPS_main.py) when ZSFile is on that grid (ZS values in the cell order of the file). None: ZSFile is on a lat-lon grid.
+grid_res=0.25 * 0.25 #LAT x LON, the CMIP model nominal resolution in deg^2, or the approximate area of Healpix grid cells in deg^2. None with ConnectivityFile uses the mean cell area of the connectivity file.
+Calendar=None #Calendar of the model data: 'standard', 'noleap' (or '365_day'), 'all_leap' (or '366_day') or '360_day'. None uses 'standard', or '360_day' if any date is not a Gregorian date.
+TimeWindow=None #Classify the catalog in time windows of this many months (e.g., 12 for yearly windows) to bound the memory use for long records. None loads the whole catalog at once.
+AppendMode=False #Extend the existing catalogs (InputFileName and ClassifiedOutFile) instead of classifying the whole record: only the tracks in TETrackFile that may continue past the last time of the catalogs and the new tracks are read and classified (TETrackFile and SizeBlobStatFile must cover these tracks). TETrackFile is scanned for its track IDs and times only, and the catalog row groups and dataset years without replaced tracks are copied as they are (see open_tracks).
+QSTrackMapping=False #Proposed change, off by default (it changes the QS tags of the original program): match the QS tracks through the TID renumbering (each output track takes the QS parameters of the StitchNodes track it was split from). By default, the QS tracks (StitchNodes track_id) are matched against the renumbered output TIDs, as in the original program. AppendMode reproduces the QS tags of a whole run only with True.
+TrackInfoString=False #Write Track_Info as strings (e.g., "Track_TC_EXT") instead of the integer bitmask of track tags (see TRACK_FLAGS in SyCLoPS_io.py) in the classified catalog.
+CheckpointDir='checkpoints' #A directory for the checkpoints of the LPSAREA and QS sections, which are reloaded when their inputs (files and parameters) are unchanged. None disables checkpoints.
+ReportFile=f'other_info/{model_data_name}_run_report.jsonl' #The run report: one JSON line per section (and time window) with its wall/CPU time, peak memory and throughput (see start_stage). None writes no report.
+DaskScheduler=None #Run blob pairing, the zsmax/zsper of off-grid nodes and the QS track statistics as partitioned tasks on a dask cluster instead of the worker pool: 'local' starts a LocalCluster of nprocess workers, or give the scheduler file (e.g., from dask_mpi, see optional/Blob_idtag.py) or the address of a running scheduler. None uses the worker pool.
+ProfileStages=[] #Sections to run under cProfile for the run report, e.g., ['lpsarea','qs']. The profile stats are saved next to ReportFile.
+SweepFile=None #A CSV file of classification threshold sets (see THRESHOLDS) for a threshold sweep, e.g., f'other_info/{model_data_name}_sweep_thresholds.csv'. None runs no sweep.
+SweepOutFile=f'other_info/{model_data_name}_sweep_counts.csv' #The output of the threshold sweep: node counts of each adjusted label and counts of tagged tracks for every threshold set.
+SweepLabelFile=None #Optionally, a parquet file for the adjusted labels and Track_Info of every node with each threshold set (one column each per set). None skips it.
+LowMemory=False #Low-memory mode for large catalogs: only the StitchNodes (and BlobStats) columns used by the classification and the outputs are read, in compact dtypes (see LOWMEM_DTYPES and LOWMEM_COLUMNS),
+#the StitchNodes file is read through its parquet cache column by column (see stream_tracks), the track kinematics run in chunks of whole tracks (see track_kinematics_chunks),
+#temporary arrays are released as soon as they are used, and the kept nodes are taken column by column (see take_rows) instead of copying the node table.
+#The catalogs have the same columns in the compact dtypes (labels of nodes within float32 precision of a threshold may differ from a default run).
 #------------------Functions--------------------#
-# The track_spread function below calculates the track spread of each track.
-# Track spread is the standard deviation of the distance between each node in a track and the first track node
+#Radii (degrees of great-circle distance) of the terrain neighbourhoods of a node (the highest ZS, ZSMX, and the lower-terrain ratio, zsper) and of the blob pairing.
+#They are part of the LPSAREA and QS checkpoint keys (see stage_key) and of the names of the terrain rasters saved next to the ZS file.
+ZSMAX_RADIUS=1
+ZSPER_RADIUS=5.0
+BLOB_RADIUS=5
+
+# The round_to_nearest5 function below rounds a number to the nearest multiple of 5 (used in the TC condition).
 def round_to_nearest5(x):
     return round(x / 5) * 5
 
-def track_spread(k): 
-    T=cKDTree(list(zip(X[FST[k]:LST[k]+1],Y[FST[k]:LST[k]+1],Z[FST[k]:LST[k]+1])))
-    distspr=np.std(T.query((X[FST[k]],Y[FST[k]],Z[FST[k]]),k=LST[k]-FST[k]+1)[0])/(np.pi/180)
-    return distspr
-
-def track_percor(k): #Calculates the Pearson correlation coefficient of all the nodes within a track
-    with warnings.catch_warnings():
-        warnings.filterwarnings(action='ignore', message='An input array is constant; the correlation coefficient is not defined')
-        percor=abs(stats.pearsonr(LON[FST[k]:LST[k]+1], LAT[FST[k]:LST[k]+1]).statistic)
-        if math.isnan(percor):
-            percor=0
-        return percor
-
-def zsmax(k): #Calculates the maximum surface geopotential within 1 degree of an LPS node
-    idx = Tz.query_ball_point((X[k],Y[k],Z[k]),r=1*(np.pi/180))
-    zmax=dszsnf[idx].max()
-    return zmax
-
-def zsper(k): #Calculates a lower-terrain ratio to adjust raw LPS size (area).
-    idx = Tz.query_ball_point((X[k],Y[k],Z[k]),r=5.0*(np.pi/180))
-    zper=len(np.where(dszsnf[idx]<7000)[0])/len(dszsnf[idx])
-    return zper
-
-#The blobpairing function below outputs a blob index and a node index in tuples
-def blobpairing(k):
-    nodepair=[]
+#The track_stats function below computes the QS track parameters of all tracks in a single pass with segment reductions over the flat node arrays:
+#the track linearity (absolute Pearson correlation coefficient between LON and LAT), the track spread (standard deviation of the distance
+#between each node in a track and the first track node, in degrees) and the inland ratio. Track k spans the nodes from FST[k] to LST[k].
+def track_stats(FST,LST,LON,LAT,X,Y,Z,ZSMX):
+    n=LST-FST+1
+    seg=np.repeat(np.arange(len(FST)),n)
+    pos=np.arange(n.sum())-np.repeat(np.cumsum(n)-n,n)+np.repeat(FST,n) #Node index of each segment element
+    segsum=lambda v: np.bincount(seg,weights=v,minlength=len(FST))
+    #Track spread: standard deviation of the distances between each node and the first track node
+    dist=np.sqrt((X[pos]-X[FST][seg])**2+(Y[pos]-Y[FST][seg])**2+(Z[pos]-Z[FST][seg])**2)
+    dmean=segsum(dist)/n
+    distspr=np.sqrt(segsum((dist-dmean[seg])**2)/n)/(np.pi/180)
+    #Track linearity: absolute Pearson correlation coefficient between LON and LAT (0 if either is constant)
+    lon=LON[pos];lat=LAT[pos]
+    lonc=lon-(segsum(lon)/n)[seg];latc=lat-(segsum(lat)/n)[seg]
+    sxx=segsum(lonc**2);syy=segsum(latc**2);sxy=segsum(lonc*latc)
+    start=np.cumsum(n)-n
+    const=(np.minimum.reduceat(lon,start)==np.maximum.reduceat(lon,start))|(np.minimum.reduceat(lat,start)==np.maximum.reduceat(lat,start))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        percor=np.where(const,0,np.minimum(np.abs(sxy/np.sqrt(sxx*syy)),1.0))
+    percor[np.isnan(percor)]=0
+    #Inland ratio: fraction of nodes with ZSMX>150
+    zsmx_ratio=segsum((ZSMX[pos]>150).astype(float))/n
+    return percor,distspr,zsmx_ratio
+
+#The zs_tree function below builds the KDTree of the ZS grid points in spherical coordinates (X,Y,Z) with array operations.
+#The grid points are cached in an .npz file next to the ZS file (plain arrays, loaded without pickle) and the tree is rebuilt from them
+#as long as the ZS file's path, size and modification time are unchanged.
+#With a connectivity file (connect), lonz and latz are the coordinates of the grid cells instead of the grid axes.
+def zs_tree(ZSFile,lonz,latz,connect=None):
+    cachefile=os.path.splitext(ZSFile)[0]+('_connect' if connect else '')+'_kdtree.npz'
+    key=repr((os.path.abspath(ZSFile),os.path.getsize(ZSFile),os.path.getmtime(ZSFile))+((os.path.abspath(connect),os.path.getmtime(connect)) if connect else ()))
+    if os.path.exists(cachefile):
+        try:
+            with np.load(cachefile,allow_pickle=False) as f:
+                if str(f['key'])==key:
+                    return cKDTree(f['pts'])
+        except Exception:
+            pass
+    LONZ,LATZ=np.meshgrid(lonz,latz) if connect is None else (lonz,latz) #Same point order as looping over latz and then lonz
+    pts=np.column_stack(((np.cos(LONZ)*np.cos(LATZ)).ravel(),(np.sin(LONZ)*np.cos(LATZ)).ravel(),np.sin(LATZ).ravel()))
     try:
-        NodeTimeArr=np.array(NodeTimeidx.loc[BlobTime[k]])
-    except KeyError:
-        return nodepair
-    if NodeTimeArr.size>0:
-        T=cKDTree(list(zip(X[NodeTimeArr],Y[NodeTimeArr],Z[NodeTimeArr])))
-        dft=dfin0.iloc[NodeTimeArr] #At the same timestep for blobs and nodes
-        for i2 in BlobTimeidx[k]: 
-            #First, pair blobs with nodes that are within 5 degrees GCD of their centroids:
-            idx=T.query_ball_point((Xb[i2],Yb[i2],Zb[i2]),r=5*(np.pi/180))
-            if len(idx)>1:        
-                node=dfin0.MSLP.iloc[NodeTimeArr[idx]].idxmin()
-                nodepair.append((i2,node))
-            elif len(idx)==1:
-                node=NodeTimeArr[idx[0]]
-                nodepair.append((i2,node))
-            else:
-                #If blobs are not paired with any nodes at this point, pair nodes that are bounded by the extent of the blobs:
-                if dfblob.maxlon[i2]-dfblob.minlon[i2]>180:
-                    nid=dft[((dft.LON>=350)&(dft.LON<360))|((dft.LON>=0)&(dft.LON<=10))\
-                        &(dft.LAT>=dfblob.minlat[i2])&(dft.LAT<=dfblob.maxlat[i2])].index.values
-                else:
-                    nid=dft[(dft.LON>=dfblob.minlon[i2])&(dft.LON<=dfblob.maxlon[i2])\
-                        &(dft.LAT>=dfblob.minlat[i2])&(dft.LAT<=dfblob.maxlat[i2])].index.values
-                if len(nid)>0:
-                    node=dfin0.MSLP.iloc[nid].idxmin()
-                    nodepair.append((i2,node))
-    else:
+        with open(cachefile,'wb') as f:
+            np.savez(f,key=np.array(key),pts=pts)
+    except OSError:
         pass
-    return nodepair
+    return cKDTree(pts)
+
+#The terrain_rasters function below computes zsmax and zsper for every grid point of a global regular lat-lon ZS grid at once.
+#The ball of grid points around a grid point is the same for all grid points in a latitude row (shifted in longitude),
+#so each row is computed with circular sliding windows along the longitudes. Returns None if the grid is not global and regular.
+def terrain_rasters(Tz,zsgrid,lonzdeg):
+    nlat,nlon=zsgrid.shape
+    dlon=360/nlon
+    if np.any(np.abs((np.diff(lonzdeg)%360)-dlon)>1e-6):
+        return None
+    low=(zsgrid<7000).astype(np.int64)
+    zsmxgrid=np.full(zsgrid.shape,-np.inf,dtype=zsgrid.dtype)
+    zsprgrid=np.zeros(zsgrid.shape)
+    for i in range(nlat):
+        for r,isper in ((ZSMAX_RADIUS*(np.pi/180),False),(ZSPER_RADIUS*(np.pi/180),True)):
+            idx=np.array(Tz.query_ball_point(Tz.data[i*nlon],r=r))
+            rows=idx//nlon
+            offs=(idx%nlon+nlon//2)%nlon-nlon//2 #Signed longitude offsets from the center grid point
+            for rr in np.unique(rows):
+                o=offs[rows==rr];w=np.abs(o).max()
+                full=len(o)>=nlon #The whole latitude row is in the ball
+                if not full and len(o)!=2*w+1:
+                    return None
+                if isper and full:
+                    zsprgrid[i]+=low[rr].sum()
+                elif isper:
+                    cs=np.concatenate(([0],np.cumsum(np.concatenate((low[rr][nlon-w:],low[rr],low[rr][:w])))))
+                    zsprgrid[i]+=cs[2*w+1:]-cs[:nlon]
+                elif full:
+                    zsmxgrid[i]=np.maximum(zsmxgrid[i],zsgrid[rr].max())
+                else:
+                    zsmxgrid[i]=np.maximum(zsmxgrid[i],maximum_filter1d(zsgrid[rr],size=2*w+1,mode='wrap'))
+            if isper:
+                zsprgrid[i]=zsprgrid[i]/len(idx)
+    return zsmxgrid.flatten(),zsprgrid.flatten()
+
+#The read_connectivity function below reads a TE connectivity file (the number of cells, then one line per cell: "lon, lat, area, n, neighbor 1, ..., neighbor n").
+#It returns the cell longitudes and latitudes (degrees), the cell areas (sr) and the neighbors of each cell as CSR arrays (indptr, 0-based indices).
+def read_connectivity(connect):
+    with open(connect) as f:
+        ncell=int(f.readline())
+        lines=f.read().split('\n')[:ncell]
+    nfield=np.fromiter((l.count(',')+1 for l in lines),dtype=np.int64,count=ncell)
+    flat=np.array(','.join(lines).split(','),dtype=float)
+    start=np.cumsum(nfield)-nfield
+    nn=flat[start+3].astype(np.int64)
+    indptr=np.concatenate(([0],np.cumsum(nn)))
+    indices=flat[np.repeat(start+4-indptr[:-1],nn)+np.arange(indptr[-1])].astype(np.int64)
+    if len(indices)>0 and indices.min()>=1: #TE writes 1-based cell indices
+        indices-=1
+    return flat[start],flat[start+1],flat[start+2],indptr,indices
+
+#The connect_rasters function below computes zsmax and zsper of every cell of an unstructured grid, as terrain_rasters does for lat-lon grids.
+#zsmax: the cells within 1 degree of each cell are collected by a breadth-first search over the neighbors that stops at the cells outside the ball
+#(blocks of cells at a time with sparse matrices), so no ball query over all cells is needed. zsper: the numbers of all cells and of the cells
+#with ZS < 7000 within 5 degrees are counted with the KDTrees of the cells (no lists of cells are built).
+def connect_rasters(lonzdeg,latzdeg,indptr,indices,zs,block=4096):
+    from scipy.sparse import csr_matrix
+    ncell=len(zs)
+    A=csr_matrix((np.ones(len(indices),dtype=np.float32),indices,indptr),shape=(ncell,ncell))
+    lon=lonzdeg%360*(np.pi/180);lat=latzdeg*(np.pi/180)
+    XYZ=np.column_stack((np.cos(lon)*np.cos(lat),np.sin(lon)*np.cos(lat),np.sin(lat)))
+    r=ZSMAX_RADIUS*(np.pi/180)
+    zsmxgrid=np.empty(ncell,dtype=zs.dtype)
+    for b0 in range(0,ncell,block):
+        cells=np.arange(b0,min(ncell,b0+block));nb=len(cells)
+        S=csr_matrix((np.ones(nb,dtype=np.float32),(np.arange(nb),cells)),shape=(nb,ncell)) #Cells in the ball of each cell of the block
+        F=S #Cells reached in the last step
+        while F.nnz>0:
+            G=(F@A).tocoo()
+            keep=np.sum((XYZ[cells[G.row]]-XYZ[G.col])**2,axis=1)<=r*r
+            G=csr_matrix((np.ones(keep.sum(),dtype=np.float32),(G.row[keep],G.col[keep])),shape=(nb,ncell))
+            G.data[:]=1
+            F=G-G.multiply(S);F.eliminate_zeros()
+            S=S+F
+        S.sort_indices()
+        zsmxgrid[cells]=np.maximum.reduceat(zs[S.indices],S.indptr[:-1])
+    r=ZSPER_RADIUS*(np.pi/180)
+    nall=cKDTree(XYZ).query_ball_point(XYZ,r,return_length=True,workers=-1)
+    nlow=cKDTree(XYZ[zs<7000]).query_ball_point(XYZ,r,return_length=True,workers=-1) if np.any(zs<7000) else 0
+    return zsmxgrid,nlow/nall
+
+#The zsgrid_index function below returns the flattened ZS grid index of each LPS node, or -1 if a node does not sit on a grid point.
+def zsgrid_index(LON,LAT,lonzdeg,latzdeg):
+    ilon=np.full(len(LON),-1);ilat=np.full(len(LAT),-1)
+    for arr,grid,out in ((LON%360,lonzdeg%360,ilon),(LAT,latzdeg,ilat)):
+        order=np.argsort(grid)
+        pos=np.clip(np.searchsorted(grid[order],arr),1,len(grid)-1)
+        near=np.where(np.abs(grid[order][pos-1]-arr)<=np.abs(grid[order][pos]-arr),pos-1,pos)
+        hit=np.abs(grid[order][near]-arr)<1e-4
+        out[hit]=order[near[hit]]
+    return np.where((ilon>=0)&(ilat>=0),ilat*len(lonzdeg)+ilon,-1)
+
+#The load_terrain_rasters function below memory-maps the zsmax/zsper rasters saved next to the ZS file,
+#or computes and saves them first if they are missing or older than the ZS file (or the connectivity file, connect, with its arrays cells from read_connectivity).
+def load_terrain_rasters(ZSFile,Tz,zsgrid,lonzdeg,connect=None,cells=None):
+    base=os.path.splitext(ZSFile)[0]+('_connect' if connect else '')
+    files=(base+f'_zsmax_r{ZSMAX_RADIUS}.npy',base+f'_zsper_r{ZSPER_RADIUS}.npy')
+    if all(os.path.exists(f) and os.path.getmtime(f)>=max(os.path.getmtime(d) for d in [ZSFile]+([connect] if connect else [])) for f in files):
+        return tuple(np.load(f,mmap_mode='r') for f in files)
+    rasters=terrain_rasters(Tz,zsgrid,lonzdeg) if connect is None else connect_rasters(*cells[:2],*cells[3:],zsgrid)
+    if rasters is None:
+        print("The ZS grid is not a global regular lat-lon grid. zsmax and zsper will be computed for each node.")
+        return None,None
+    try:
+        for f,arr in zip(files,rasters):
+            np.save(f,arr)
+    except OSError:
+        return rasters
+    return tuple(np.load(f,mmap_mode='r') for f in files)
+
+#The terrain_lookup function below reads zsmax/zsper (func='zsmax' or 'zsper') of each LPS node from a raster by its grid index.
+#Nodes that do not sit on a grid point (or all nodes if there is no raster) fall back to ball queries of the ZS tree (see terrain_ball)
+#in the worker pool (see terrain_task) or on the dask cluster (DaskScheduler).
+def terrain_lookup(raster,func):
+    out=np.empty(len(ZSidx),dtype=raster.dtype if raster is not None else dszsnf.dtype)
+    ongrid=(ZSidx>=0) if raster is not None else np.zeros(len(ZSidx),dtype=bool)
+    if raster is not None:
+        out[ongrid]=raster[ZSidx[ongrid]]
+    if np.any(~ongrid) and DaskScheduler is not None:
+        client=dask_client()
+        chunks=np.array_split(np.where(~ongrid)[0],min(np.sum(~ongrid),4*n_workers()))
+        out[~ongrid]=np.concatenate(client.gather([client.submit(terrain_ball,zsdata[0],zsdata[1],np.column_stack((X[ks],Y[ks],Z[ks])),func,pure=False) for ks in chunks]))
+    elif np.any(~ongrid):
+        files=share_arrays(shmdir,XYZ=np.vstack((X,Y,Z)))
+        chunks=np.array_split(np.where(~ongrid)[0],min(np.sum(~ongrid),nprocess*8))
+        out[~ongrid]=np.concatenate(worker_pool().map(terrain_task,[(func,files,ks) for ks in chunks]))
+        os.remove(files['XYZ'])
+    return out
+
+#The worker_pool function below starts the pool of nprocess workers the first time it is needed and returns the same pool for all stages (LPSAREA and QS)
+#and time windows of the run. The workers are forked after the ZS data are loaded: dszsnf is memory-mapped (see share_arrays) and Tz is only read,
+#so the workers share these pages with the main process, and the node coordinates of each call are memory-mapped too (see terrain_task).
+def worker_pool():
+    global pool
+    if pool is None:
+        pool=ma.Pool(nprocess)
+    return pool
+
+#The dask_client function below connects to the dask cluster of DaskScheduler the first time it is needed and returns the same client for the whole run (see worker_pool).
+#The ZS tree and values are sent to every worker once (zsdata).
+def dask_client():
+    global client,zsdata
+    if client is None:
+        from distributed import Client
+        if DaskScheduler=='local':
+            client=Client(n_workers=nprocess,threads_per_worker=1)
+        elif os.path.isfile(DaskScheduler):
+            client=Client(scheduler_file=DaskScheduler)
+        else:
+            client=Client(DaskScheduler)
+        zsdata=client.scatter([Tz,np.asarray(dszsnf)],broadcast=True)
+    return client
+
+#The n_workers function below returns the number of workers of the run (for the run report).
+def n_workers():
+    if client is not None:
+        return len(client.scheduler_info()['workers'])
+    return nprocess if pool is not None else 1
+
+#The terrain_ball function below computes zsmax (func='zsmax': the highest ZS within ZSMAX_RADIUS) or zsper (the lower-terrain ratio: the fraction of the grid points
+#within ZSPER_RADIUS with ZS < 7000, which adjusts the raw LPS size) of the points XYZ from the ZS tree and values.
+#It takes all its data as arguments, so it runs as a dask task or in a pool worker (see terrain_lookup).
+def terrain_ball(Tz,dszsnf,XYZ,func):
+    idx=Tz.query_ball_point(XYZ,r=(ZSMAX_RADIUS if func=='zsmax' else ZSPER_RADIUS)*(np.pi/180))
+    if func=='zsmax':
+        return np.array([dszsnf[i].max() for i in idx],dtype=dszsnf.dtype)
+    return np.array([len(np.where(dszsnf[i]<7000)[0])/len(dszsnf[i]) for i in idx])
+
+#The blobpairing_dask function below runs blobpairing_batch on the dask cluster in partitions of whole timesteps (blobs only pair with nodes at their times,
+#so the pairs are the same as in one batch) and returns the paired node index of each blob (-1 if unpaired).
+def blobpairing_dask(dfnode,dfblob,NodeXYZ,BlobXYZ):
+    ntime=np.asarray(dfnode.HOURS);btime=np.asarray(dfblob.time)
+    utime=np.unique(btime)
+    paired=np.full(len(dfblob),-1,dtype=np.int64)
+    if len(utime)==0:
+        return paired
+    client=dask_client()
+    futures=[];parts=[]
+    for ts in np.array_split(utime,min(len(utime),4*n_workers())):
+        nmask=(ntime>=ts[0])&(ntime<=ts[-1]);bmask=(btime>=ts[0])&(btime<=ts[-1])
+        if not nmask.any():
+            continue
+        parts.append((np.where(nmask)[0],bmask))
+        futures.append(client.submit(blobpairing_batch,dfnode[['HOURS','LON','LAT','MSLP']][nmask],dfblob[['time','minlat','maxlat','minlon','maxlon']][bmask],
+                                     NodeXYZ[nmask],BlobXYZ[bmask],pure=False))
+    for (nid,bmask),pb in zip(parts,client.gather(futures)):
+        paired[bmask]=np.where(pb>=0,nid[pb],-1)
+    return paired
+
+#The track_stats_dask function below runs track_stats on the dask cluster in partitions of whole tracks and returns the same track parameters.
+def track_stats_dask(FST,LST,LON,LAT,X,Y,Z,ZSMX):
+    if len(FST)==0:
+        return track_stats(FST,LST,LON,LAT,X,Y,Z,ZSMX)
+    client=dask_client()
+    futures=[]
+    for p in np.array_split(np.arange(len(FST)),min(len(FST),4*n_workers())):
+        a=FST[p].min();b=LST[p].max()+1
+        futures.append(client.submit(track_stats,FST[p]-a,LST[p]-a,LON[a:b],LAT[a:b],X[a:b],Y[a:b],Z[a:b],ZSMX[a:b],pure=False))
+    return tuple(np.concatenate(r) for r in zip(*client.gather(futures)))
+
+#The terrain_task function below runs terrain_ball (func='zsmax' or 'zsper') in a pool worker for the nodes ks, with the node coordinates (X,Y,Z) mapped from files.
+def terrain_task(args):
+    func,files,ks=args
+    XYZ=attach_arrays(files)['XYZ']
+    return terrain_ball(Tz,dszsnf,XYZ[:,ks].T,func)
+
+#The blobpairing_batch function below pairs all blobs with nodes in bulk and returns the paired node index of each blob (-1 if unpaired).
+#Each blob is paired with the lowest-MSLP node within BLOB_RADIUS of its centroid at its timestep, or else with the lowest-MSLP node inside its extent,
+#as the former per-timestep loop did: blobs and nodes are sorted by time once, each timestep is queried in one batch,
+#and the MSLP-argmin and the bounding-box fallback are vectorized. Ties in MSLP go to the node with the smaller index
+#(the per-timestep loop took the first node in the order of the ball query).
+def blobpairing_batch(dfnode,dfblob,NodeXYZ,BlobXYZ):
+    nnode=len(dfnode);nblob=len(dfblob)
+    paired=np.full(nblob,-1,dtype=np.int64)
+    #Shared integer time keys for nodes and blobs, then one sort by time:
+    tkey=np.unique(np.concatenate([np.asarray(dfnode.HOURS),np.asarray(dfblob.time)]),return_inverse=True)[1]
+    norder=np.argsort(tkey[:nnode],kind='stable');ntime=tkey[:nnode][norder]
+    border=np.argsort(tkey[nnode:],kind='stable');btime=tkey[nnode:][border]
+    utime,bstart=np.unique(btime,return_index=True)
+    bend=np.append(bstart[1:],nblob)
+    nstart=np.searchsorted(ntime,utime,side='left');nend=np.searchsorted(ntime,utime,side='right')
+    LONn=dfnode.LON.to_numpy();LATn=dfnode.LAT.to_numpy()
+    MSLPn=dfnode.MSLP.to_numpy(dtype=float);MSLPn=np.where(np.isnan(MSLPn),np.inf,MSLPn)
+    minlat=dfblob.minlat.to_numpy();maxlat=dfblob.maxlat.to_numpy()
+    minlon=dfblob.minlon.to_numpy();maxlon=dfblob.maxlon.to_numpy()
+    pb_list=[];pn_list=[]
+    for g in range(len(utime)):
+        if nend[g]==nstart[g]:
+            continue
+        nid=norder[nstart[g]:nend[g]];bid=border[bstart[g]:bend[g]]
+        #First, pair blobs with nodes that are within 5 degrees GCD of their centroids:
+        T=cKDTree(NodeXYZ[nid])
+        idx=T.query_ball_point(BlobXYZ[bid],r=BLOB_RADIUS*(np.pi/180))
+        cnt=np.fromiter(map(len,idx),dtype=np.int64,count=len(bid))
+        if cnt.sum()>0:
+            pb_list.append(np.repeat(bid,cnt))
+            pn_list.append(nid[np.fromiter(itertools.chain.from_iterable(idx),dtype=np.int64,count=cnt.sum())])
+        #If blobs are not paired with any nodes at this point, pair nodes that are bounded by the extent of the blobs:
+        fb=bid[cnt==0]
+        if len(fb)>0:
+            lon=LONn[nid][None,:];lat=LATn[nid][None,:]
+            inlat=(lat>=minlat[fb][:,None])&(lat<=maxlat[fb][:,None])
+            wrap=(maxlon[fb]-minlon[fb]>180)[:,None]
+            #The dateline case keeps the operator precedence of the former loop (the 350-360 band is not bounded by latitude):
+            box=np.where(wrap,((lon>=350)&(lon<360))|((lon>=0)&(lon<=10)&inlat),
+                        (lon>=minlon[fb][:,None])&(lon<=maxlon[fb][:,None])&inlat)
+            bi,ni=np.nonzero(box)
+            pb_list.append(fb[bi]);pn_list.append(nid[ni])
+    if len(pb_list)==0:
+        return paired
+    pb=np.concatenate(pb_list);pn=np.concatenate(pn_list)
+    #Vectorized MSLP-argmin: the first pair of each blob after sorting by (blob, MSLP, node index)
+    order=np.lexsort((pn,MSLPn[pn],pb))
+    pb=pb[order];pn=pn[order]
+    first=np.ones(len(pb),dtype=bool);first[1:]=pb[1:]!=pb[:-1]
+    paired[pb[first]]=pn[first]
+    return paired
+
+#The read_columns function below reads the columns (all if None) of a parquet file (pf, a pq.ParquetFile) or of its row group one at a time into a table
+#with one block per column, so only one column is held twice (as Arrow and numpy data) while reading in the low-memory mode.
+def read_columns(pf,columns=None,group=None):
+    columns=pf.schema_arrow.names if columns is None else columns
+    read=(lambda c: pf.read(columns=[c])) if group is None else (lambda c: pf.read_row_group(group,columns=[c]))
+    return pd.DataFrame({c:read(c).column(0).to_numpy() for c in columns},copy=False)
+
+#The blob_sums function below sums the sizes and IKEs (None if the blobs have no IKE) of the blobs in dfblob by their paired nodes (paired, -1 if unpaired).
+#(The paired blobs are selected by a mask on the summed column only, not by copying the blob table.)
+def blob_sums(dfblob,paired):
+    ispaired=paired!=-1
+    sizesum=dfblob['blobsize'][ispaired].groupby(paired[ispaired]).sum()
+    ikesum=dfblob['ike'][ispaired].groupby(paired[ispaired]).sum() if 'ike' in dfblob.columns else None
+    return sizesum,ikesum
+
+#The paired_blob_sums function below pairs the blobs of a BlobStats file with the nodes (HOURS, LON, LAT and MSLP of dfnode, and NodeXYZ) in chunks of blobs read from its parquet cache
+#(the LPSAREA section in the low-memory mode, see LowMemory), and returns the blob sums of blob_sums and the number of blobs.
+#The pairing of a blob does not depend on the other blobs, so the chunks give the same pairs as the whole table, and each chunk is paired with the nodes
+#in its time range only. The blobs of the last time of a chunk are carried over to the next chunk, so the blobs of a node are summed together.
+#The candidate pairs of blobpairing_batch take most of the memory of blob pairing, so they are bounded by the chunk size (batch_size blobs).
+def paired_blob_sums(dfnode,NodeXYZ,blobfile,calendar,batch_size=100000):
+    pf=pq.ParquetFile(blobstats_cache(blobfile,calendar,1<<20,False),**LOWMEM_PARQUET) #(converted in small blocks if the cache is not there yet)
+    cols=[c for c in ['time','centlon','centlat','minlat','maxlat','minlon','maxlon','blobsize','ike'] if c in pf.schema_arrow.names]
+    HOURS=dfnode.HOURS.to_numpy();sizesum=[];ikesum=[];nblob=0;carry=None
+    norder=np.argsort(HOURS,kind='stable');ntime=HOURS[norder]
+    groups=(read_columns(pf,cols,g) for g in range(pf.num_row_groups))
+    for batch in itertools.chain((rg.iloc[i:i+batch_size] for rg in groups for i in range(0,len(rg),batch_size)),[None]):
+        if batch is None:
+            df=carry
+        else:
+            df=batch.reset_index(drop=True) if carry is None else pd.concat([carry,batch],ignore_index=True)
+            last=df.time.to_numpy()==df.time.iloc[-1]
+            carry=df[last].reset_index(drop=True);df=df[~last].reset_index(drop=True)
+        if df is None or len(df)==0:
+            continue
+        nblob+=len(df)
+        m=np.sort(norder[np.searchsorted(ntime,df.time.min(),side='left'):np.searchsorted(ntime,df.time.max(),side='right')]) #Nodes in the time range of the chunk
+        paired=np.full(len(df),-1,dtype=np.int64)
+        if len(m)>0:
+            LonB=df.centlon.to_numpy();LatB=df.centlat.to_numpy()
+            BlobXYZ=np.column_stack((np.cos(LonB*(np.pi/180))*np.cos(LatB*(np.pi/180)),np.sin(LonB*(np.pi/180))*np.cos(LatB*(np.pi/180)),np.sin(LatB*(np.pi/180))))
+            dfm=pd.DataFrame({c:dfnode[c].to_numpy()[m] for c in ['HOURS','LON','LAT','MSLP']})
+            p=(blobpairing_batch if DaskScheduler is None else blobpairing_dask)(dfm,df,NodeXYZ[m],BlobXYZ)
+            paired=np.where(p>=0,m[np.maximum(p,0)],-1)
+        s,k=blob_sums(df,paired)
+        sizesum.append(s);ikesum.append(k)
+        release_memory()
+    sizesum=pd.concat(sizesum).groupby(level=0).sum() if len(sizesum)>0 else pd.Series(dtype=float)
+    ikesum=pd.concat(ikesum).groupby(level=0).sum() if len(ikesum)>0 and ikesum[0] is not None else None
+    return sizesum,ikesum,nblob
 
 def calculate_bearing(lat1, lon1, lat2, lon2):
     lat1 = np.radians(lat1)
@@ -113,6 +446,921 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
     return R * c
 
+#The shift_in_track function below shifts an array by n positions (like groupby('TID').shift(n)) using the track boundaries of the sorted nodes.
+#pos is the position of each node in its track and tlen is the length of the track of each node.
+def shift_in_track(v,n,pos,tlen):
+    out=np.full(len(v),np.nan)
+    if n>0:
+        out[n:]=v[:-n]
+        out[pos<n]=np.nan
+    else:
+        out[:n]=v[-n:]
+        out[pos>=tlen+n]=np.nan
+    return out
+
+#The track_kinematics function below performs the jumpy node removal and false connection track splitting on flat arrays.
+#Nodes are sorted once by track and time, and previous/next nodes are taken from the track boundaries instead of groupby.
+#It returns the row index (of the input arrays) of the kept nodes in the sorted order, their new TIDs, distance, direction and distance_2steps.
+def track_kinematics(TID,HOURS,LAT,LON,MSLPCC55,TropFlag,convrate,range_dist,max_gap_hour):
+    order=np.lexsort((HOURS,TID))
+    tid=np.asarray(TID)[order];lat=np.asarray(LAT,dtype=float)[order];lon=np.asarray(LON,dtype=float)[order]
+    first=np.ones(len(tid),dtype=bool);first[1:]=tid[1:]!=tid[:-1]
+    start=np.nonzero(first)[0];tlen=np.diff(np.append(start,len(tid)))
+    pos=np.arange(len(tid))-np.repeat(start,tlen);tlen=np.repeat(tlen,tlen)
+    ## Distance, direction and 2-step distance in one pass:
+    prev_lat=shift_in_track(lat,1,pos,tlen);prev_lon=shift_in_track(lon,1,pos,tlen)
+    distance=haversine(prev_lat,prev_lon,lat,lon)
+    direction=calculate_bearing(prev_lat,prev_lon,lat,lon)
+    del prev_lat,prev_lon #(The temporary arrays below are released as soon as they are used to bound the peak memory.)
+    distance_2steps=haversine(shift_in_track(lat,2,pos,tlen),shift_in_track(lon,2,pos,tlen),lat,lon)
+    dist_shift1=shift_in_track(distance,1,pos,tlen)
+    dist_shift_s1=shift_in_track(distance_2steps,-1,pos,tlen)
+    dist_shift_n1=shift_in_track(distance,-1,pos,tlen)
+    jumpy_mask = (distance > 3 * dist_shift_s1) & (distance > 333)| \
+    (dist_shift_n1 > 3 * dist_shift_s1) & (dist_shift_n1 > 333)
+    del dist_shift_s1
+    dir_shift1=shift_in_track(direction,1,pos,tlen)
+    jumpy_mask|=(distance > 3 * dist_shift1) & (np.abs(direction - dir_shift1) > 90) & (distance > 333)
+    del dir_shift1
+    dist_shift_n2=shift_in_track(distance,-2,pos,tlen)
+    jumpy_mask|=((distance > 3 * dist_shift1) & (dist_shift_n1 > 3 * dist_shift_n2) & (distance > 333))| \
+    ((distance > 5 * dist_shift1) & (distance > 5 * dist_shift_n1) & (distance > 333/convrate))
+    del dist_shift1,dist_shift_n1,dist_shift_n2
+    ## Remove jumpy nodes and recompute distances only where the previous node has changed:
+    kept=np.nonzero(~jumpy_mask)[0]
+    newprev=np.full(len(kept),-1);newprev[1:]=kept[:-1]
+    newprev[np.append(True,tid[kept][1:]!=tid[kept][:-1])[:len(kept)]]=-1 #(The slice keeps the mask empty if no node is kept, e.g., an empty window)
+    distance=distance[kept];direction=direction[kept];distance_2steps=distance_2steps[kept]
+    del jumpy_mask
+    changed=np.nonzero(newprev!=np.where(pos[kept]>0,kept-1,-1))[0]
+    hasprev=changed[newprev[changed]>=0]
+    distance[changed]=np.nan
+    distance[hasprev]=haversine(lat[newprev[hasprev]],lon[newprev[hasprev]],lat[kept[hasprev]],lon[kept[hasprev]])
+    ## Break up tracks:
+    hours=np.asarray(HOURS,dtype=float)[order]
+    time_gap=np.full(len(kept),np.nan)
+    time_gap[newprev>=0]=hours[kept[newprev>=0]]-hours[newprev[newprev>=0]]
+    split=((distance > 333/convrate) & (np.asarray(TropFlag)[order][kept] == 1)) | (time_gap > max_gap_hour) | (distance > range_dist*111)
+    newtid=np.cumsum((newprev<0)|split)-1
+    ## Keep tracks with enough nodes with MSLPCC55>100:
+    track_counts=np.bincount(newtid,weights=(np.asarray(MSLPCC55)[order][kept]>100))
+    valid=(track_counts>=round(7*convrate+0.01))[newtid]
+    newtid=np.cumsum(np.append(True,newtid[valid][1:]!=newtid[valid][:-1]))-1 if valid.any() else newtid[valid]
+    return order[kept[valid]],newtid,distance[valid],direction[valid],distance_2steps[valid]
+
+#The track_kinematics_chunks function below runs track_kinematics on chunks of whole tracks (about chunk nodes each, in TID order) and joins the results,
+#so the temporary arrays are bounded by the chunk size (the low-memory mode, see LowMemory). The tracks of a chunk do not depend on the other tracks,
+#and the chunks follow the TID order, so the results are the same as those of one call (chunk=None).
+def track_kinematics_chunks(TID,HOURS,LAT,LON,MSLPCC55,TropFlag,convrate,range_dist,max_gap_hour,chunk=None):
+    if chunk is None:
+        return track_kinematics(TID,HOURS,LAT,LON,MSLPCC55,TropFlag,convrate,range_dist,max_gap_hour)
+    utid,counts=np.unique(TID,return_counts=True)
+    ends=np.searchsorted(np.cumsum(counts),np.arange(chunk,len(TID),chunk),side='right')+1 #A chunk ends with the track of its chunk-th node
+    bounds=np.unique(utid[ends[ends<len(utid)]])
+    out=[];offset=0
+    for lo,hi in zip(np.append(utid[:1],bounds),np.append(bounds,utid[-1:]+1)):
+        sel=np.flatnonzero((TID>=lo)&(TID<hi))
+        rows,newtid,distance,direction,distance_2steps=track_kinematics(TID[sel],HOURS[sel],LAT[sel],LON[sel],MSLPCC55[sel],TropFlag[sel],convrate,range_dist,max_gap_hour)
+        out.append((sel[rows],newtid+offset,distance,direction,distance_2steps));offset+=len(np.unique(newtid))
+    return tuple(np.concatenate(a) for a in zip(*out)) if len(out)>0 else track_kinematics(TID,HOURS,LAT,LON,MSLPCC55,TropFlag,convrate,range_dist,max_gap_hour)
+
+#Label lookup table. The int8 label code of a node is the index of its (short label, full name) pair in this table.
+LABEL_TABLE=[
+    ("NLB", "Non-labeled"),
+    ("HATHL", "High-altitude Thermal Low"),
+    ("HAL", "High-altitude Low"),
+    ("DOTHL", "Deep (Orographic) Thermal Low"),
+    ("THL", "Thermal Low"),
+    ("DSD", "Dry Disturbance"),
+    ("DST", "Tropical Disturbance"),
+    ("TC", "Tropical Cyclone"),
+    ("TD(MD)", "Tropical Depression(Monsoon Depression)"),
+    ("TD", "Tropical Depression"),
+    ("TLO(ML)", "Tropical Low (Monsoon Low)"),
+    ("TLO", "Tropical Low"),
+    ("SS(STLC)", "Subtropical Tropical-like Cyclone (Subtropical Storm)"),
+    ("PL(PTLC)", "Polar Low (Polar Tropical-like Cyclone)"),
+    ("SC", "Subtropical Cyclone"),
+    ("EX", "Extratropical Cyclone"),
+    ("DSE", "Extratropical Disturbance"),
+    ("HTC", "Hybrid Tropical Cyclone"),
+]
+SHORT_LABELS=np.array([s for s,f in LABEL_TABLE],dtype=object)
+FULL_NAMES=np.array([f for s,f in LABEL_TABLE],dtype=object)
+LABEL_CODE={s:np.int8(i) for i,s in enumerate(SHORT_LABELS)}
+
+#The classification decision tree as a rule table: (short label, conditions), where '~' negates a condition. The first matching rule wins;
+#nodes that match no rule are Non-labeled. HTC nodes are taken out of the extratropical branch, and PL wins over STLC where the (regional)
+#WS200PMX criteria of both are met. In modes 2 and 3 the TLC condition is all False, which leaves SC, EX and DSE in the extratropical branch.
+LABEL_RULES=[
+    ("HATHL", ["hal","midupptk"]), # High-altitude Branch
+    ("HAL", ["hal","~midupptk"]),
+    ("DSD", ["~hal","dry","~lowtk"]), # Dryness Branch
+    ("DOTHL", ["~hal","dry","lowtk","cv"]),
+    ("THL", ["~hal","dry","lowtk","~cv"]),
+    ("DST", ["~hal","~dry","trop","~cv"]), # Tropical Branch
+    ("TC", ["~hal","~dry","cv","trop","tc"]),
+    ("TD(MD)", ["~hal","~dry","cv","trop","~tc","td","md"]),
+    ("TD", ["~hal","~dry","cv","trop","~tc","td","~md"]),
+    ("TLO(ML)", ["~hal","~dry","cv","trop","~tc","~td","md"]),
+    ("TLO", ["~hal","~dry","cv","trop","~tc","~td","~md"]),
+    ("DSE", ["~hal","~dry","~trop","~cv"]), # Extratropical Branch
+    ("HTC", ["~hal","~dry","cv","trop_htc","~trop","tc"]),
+    ("PL(PTLC)", ["~hal","~dry","~trop","cv","tlc","pl"]),
+    ("SS(STLC)", ["~hal","~dry","~trop","cv","tlc","stlc"]),
+    ("SC", ["~hal","~dry","~trop","cv","~tlc","sc"]),
+    ("EX", ["~hal","~dry","~trop","cv","~tlc","~sc"]),
+]
+
+#The compile_rule function below compiles a list of conditions into a (care, value) bit pair over the condition names,
+#so that a node matches the conditions if (bits & care) == value, where bits is the node's packed conditions (see node_bits).
+def compile_rule(conds,names):
+    care=0;value=0
+    for c in conds:
+        b=1<<names.index(c.lstrip('~'))
+        care|=b
+        if not c.startswith('~'):
+            value|=b
+    return care,value
+
+#The node_bits function below packs the boolean condition arrays (a dict keyed by the condition names) into one integer per node.
+def node_bits(conds,names):
+    bits=np.zeros(len(conds[names[0]]),dtype=np.uint32)
+    for i,c in enumerate(names):
+        bits|=np.asarray(conds[c],dtype=bool).astype(np.uint32)<<np.uint32(i)
+    return bits
+
+#The classify_nodes function below labels all nodes with a single lookup: the rule table is evaluated once for every combination of the
+#conditions, and each node takes the int8 label code of its packed conditions. It returns the label codes and the packed conditions.
+def classify_nodes(conds,rules=LABEL_RULES):
+    names=sorted({c.lstrip('~') for lab,cs in rules for c in cs})
+    combos=np.arange(2**len(names),dtype=np.uint32)
+    table=np.zeros(len(combos),dtype=np.int8)
+    unset=np.ones(len(combos),dtype=bool)
+    for lab,cs in rules:
+        care,value=compile_rule(cs,names)
+        m=unset&((combos&care)==value)
+        table[m]=LABEL_CODE[lab];unset&=~m
+    bits=node_bits(conds,names)
+    return table[bits],bits,names
+
+#The rule_mask function below returns the nodes that match a list of conditions from their packed conditions.
+def rule_mask(bits,names,conds):
+    care,value=compile_rule(conds,names)
+    return (bits&np.uint32(care))==np.uint32(value)
+
+#The label_codes function below returns the label codes whose short label contains the given string.
+def label_codes(s):
+    return np.array([i for i,lab in enumerate(SHORT_LABELS) if s in lab],dtype=np.int8)
+
+#Label family of each short label, for partitioning the classified dataset (see write_dataset).
+LABEL_FAMILY={'NLB':'none','HATHL':'high_altitude','HAL':'high_altitude','DOTHL':'thermal','THL':'thermal','DSD':'disturbance','DST':'disturbance','DSE':'disturbance',
+              'TC':'tropical','TD(MD)':'tropical','TD':'tropical','TLO(ML)':'tropical','TLO':'tropical','HTC':'tropical',
+              'SS(STLC)':'tropical_like','PL(PTLC)':'tropical_like','SC':'extratropical','EX':'extratropical'}
+
+#The track_counts function below counts the nodes in each mask for every track in one grouped aggregation. TID must be sorted (tracks are contiguous).
+#It returns the track IDs, the (track x mask) counts and the track index of every node for broadcasting track values back to the nodes.
+def track_counts(TID,masks):
+    utid,tstart,tinv=np.unique(TID,return_index=True,return_inverse=True)
+    counts=np.column_stack([np.add.reduceat(np.asarray(m,dtype=np.int64),tstart) if len(TID)>0 else np.asarray(m,dtype=np.int64) for m in masks]) #(one mask at a time)
+    return utid,counts,tinv
+
+#The track_info_strings function below renders Track_Info bitmasks as the "Track_TC_EXT"-style strings.
+def track_info_strings(track_info):
+    vals,inv=np.unique(track_info,return_inverse=True)
+    names=np.array(["Track"+"".join('_'+tag for tag,flag in TRACK_FLAGS.items() if v&flag) for v in vals],dtype=object)
+    return names[inv]
+
+#The transition_flags function below identifies the extratropical transition (EXT) and tropical transition (TT) nodes of TC-like tracks.
+#It uses the first/last TC (or HTC) node index of each track and lookahead windows of round(6*convrate) nodes, so its cost is linear in the number of nodes.
+#TID must be sorted (tracks are contiguous). istc and isds mark nodes whose short label contains 'TC' and 'DS'.
+def transition_flags(TID,istc,isds,TropFlag,atctrack,htctrack,convrate):
+    idx=np.arange(len(TID))
+    #Per-track first and last TC node index (-1 if none) over all tracks, then taken for the TC-like tracks:
+    utid,tstart=np.unique(TID,return_index=True)
+    k=np.searchsorted(utid,atctrack)
+    start=tstart[k];end=np.append(tstart[1:],len(TID))[k]
+    fst_tc=np.minimum.reduceat(np.where(istc,idx,len(TID)),tstart)[k] if len(TID)>0 else start
+    lst_tc=np.maximum.reduceat(np.where(istc,idx,-1),tstart)[k] if len(TID)>0 else start
+    fst_tc[fst_tc>=len(TID)]=-1
+    #EXT nodes: the first non-tropical, non-DS node within round(6*convrate) nodes after the last TC node,
+    #if the node 2*convrate steps before the last TC node is tropical.
+    win=lst_tc[:,None]+np.arange(1,round(6*convrate)+1)[None,:]
+    inwin=(win<end[:,None])&(lst_tc[:,None]>=0)
+    winc=np.clip(win,0,len(TID)-1)
+    cand=inwin&(TropFlag[winc]==0)&~isds[winc]
+    back=np.clip(lst_tc-round(2*convrate),0,len(TID)-1)
+    hasext=cand.any(axis=1)&(TropFlag[back]==1)&(lst_tc-round(2*convrate)>=start)
+    ext=winc[np.arange(len(win)),cand.argmax(axis=1)]
+    #HTC tracks are a subset of the TC-like tracks (both in ascending TID order), and their EXT nodes are listed again as in the track-by-track version.
+    ishtc=np.isin(atctrack,htctrack)
+    extflag=np.concatenate([ext[hasext],ext[hasext&ishtc]]).astype(int)
+    #TT nodes: the first TC node of a track if any node before it is non-tropical.
+    cz=np.concatenate(([0],np.cumsum(TropFlag==0)))
+    hastt=(fst_tc>=0)&(cz[np.maximum(fst_tc,0)]-cz[start]>0)
+    ttflag=fst_tc[hastt].astype(int)
+    return extflag,ttflag
+
+#The sandwiched_runs function below finds runs of nodes with cat==1 whose length is between jmin and jmax and that are sandwiched by at least
+#as many nodes with cat==2 on each side, using the run-length encoding of cat. Runs must lie in one of the tracks given by their sorted first/last
+#node indices (fi, li) with the left-hand nodes inside the track (the right-hand nodes may run past the track end, as in the window-by-window loops).
+#It returns the start and length of the runs whose MSLP deviates by no more than 500 Pa from the linear interpolation across the run.
+def sandwiched_runs(cat,fi,li,MSLP,jmin,jmax):
+    n=len(cat)
+    rs=np.concatenate(([0][:n],np.flatnonzero(np.diff(cat))+1)).astype(int) #Run starts (none if there are no nodes)
+    rl=np.diff(np.append(rs,n)) #Run lengths
+    rc=cat[rs]
+    r=np.flatnonzero((rc==1)&(rl>=jmin)&(rl<=jmax))
+    r=r[(r>0)&(r<len(rs)-1)]
+    r=r[(rc[r-1]==2)&(rl[r-1]>=rl[r])&(rc[r+1]==2)&(rl[r+1]>=np.minimum(rl[r],n-rs[r+1]))]
+    st=rs[r];L=rl[r]
+    if len(fi)==0: #No tracks to smooth
+        return st[:0],L[:0]
+    k=np.searchsorted(fi,st,side='right')-1
+    ok=k>=0
+    k=np.maximum(k,0)
+    ok&=(st-L>=np.asarray(fi)[k])&(st+L<=np.asarray(li)[k])
+    st=st[ok];L=L[ok]
+    keep=np.zeros(len(st),dtype=bool)
+    for j in np.unique(L):
+        g=np.flatnonzero(L==j)
+        vals=MSLP[(st[g]-1)[:,None]+np.arange(j+2)[None,:]]
+        interp=np.repeat(vals[:,:1],j+2,axis=1)
+        slope=vals[:,0]!=vals[:,-1] #Flat rows are interpolated as constants, as np.linspace does for a single row
+        if slope.any():
+            interp[slope]=np.linspace(vals[slope,0],vals[slope,-1],j+2,axis=1)
+        keep[g]=np.abs(vals-interp).max(axis=1)<=500
+    return st[keep],L[keep]
+
+#The smooth_labels function below adjusts (smooths) the labels of TDs in stable TC periods and TDs/TLOs in stable MS periods
+#with run-length encodings of the label code sequences (see sandwiched_runs). TID must be sorted (tracks are contiguous).
+#It returns the adjusted label codes, which are the same labels as the window-by-window loops give.
+def smooth_labels(code,TID,MSLP,atctrack,mstrack,convrate):
+    jmax=round(8*convrate+1)-1
+    code=np.array(code,dtype=np.int8)
+    runpos=lambda st,L: np.repeat(st,L)+np.arange(L.sum())-np.repeat(np.cumsum(L)-L,L)
+    # TD runs sandwiched by TC nodes in TC-like tracks (all windows are checked against the original labels):
+    fi=np.searchsorted(TID,atctrack,side='left');li=np.searchsorted(TID,atctrack,side='right')-1
+    cat=np.where(np.isin(code,label_codes('TD')),1,np.where(np.isin(code,label_codes('TC')),2,0))
+    st,L=sandwiched_runs(cat,fi,li,MSLP,1,jmax)
+    code[runpos(st,L)]=LABEL_CODE['TC']
+    # TD/TLO runs sandwiched by monsoonal nodes in MS tracks (shorter runs first, as relabeled nodes count as monsoonal nodes for longer runs):
+    fi=np.searchsorted(TID,mstrack,side='left');li=np.searchsorted(TID,mstrack,side='right')-1
+    cat=np.where(np.isin(code,[LABEL_CODE['TD'],LABEL_CODE['TLO']]),1,np.where(np.isin(code,label_codes('M')),2,0))
+    for j in range(1,jmax+1):
+        st,L=sandwiched_runs(cat,fi,li,MSLP,j,j)
+        pos=runpos(st,L)
+        code[pos]=np.where(code[pos]==LABEL_CODE['TD'],LABEL_CODE['TD(MD)'],LABEL_CODE['TLO(ML)'])
+        cat[pos]=2
+    return code
+
+#The hal_precondition function below gives the high-altitude pre-condition used for checking the RH unit. Z850 is not necessary if data contains missing values.
+def hal_precondition(dfin):
+    try:
+        return ((dfin.Z850!=dfin.Z850) | (abs(dfin.T850)>1e14) |(dfin.Z850-dfin.ZS<10)) & ~(dfin.MSLP<=92500)
+    except:
+        return (dfin.T850!=dfin.T850) | (abs(dfin.T850)>1e14) | (dfin.T850==0)
+
+#Classification thresholds that can be varied in a threshold sweep (see SweepFile), with their default values (the TC thresholds for 250 hPa data in THRESHOLDS_250).
+#grid_res None uses the grid_res constant. TC condition: MSLPCC20 > round_to_nearest5(tc_cc20_slope*grid_res+tc_cc20_intercept) and UPPTKCC < tc_upptkcc;
+#TLC condition: LPSAREA <= tlc_area and MSLPCC20 > tlc_cc20; QS tracks: Track Linearity < qs_linearity, Track Spread < qs_spread and Track Inland Ratio > qs_inland.
+THRESHOLDS={'grid_res':None,'tc_cc20_slope':-85,'tc_cc20_intercept':220,'tc_upptkcc':-107.8,'tlc_area':5.5e5,'tlc_cc20':190,'qs_linearity':0.55,'qs_spread':3,'qs_inland':0.65}
+THRESHOLDS_250=dict(THRESHOLDS,tc_cc20_slope=-107,tc_cc20_intercept=247,tc_upptkcc=-117.6)
+
+#The node_conditions function below gives the node conditions of the classification (keyed by the condition names of LABEL_RULES) with the thresholds P.
+#Only the TC and TLC conditions depend on P, so the other conditions are taken from base if given (the conditions of the default run in a threshold sweep).
+def node_conditions(dfin,P,base=None):
+    res=min(max(grid_res if P['grid_res'] is None else P['grid_res'],0.25*0.25),1.5*1.5)
+    cond_tc=(dfin.MSLP<=92500) | ((dfin.UPPTKCC<P['tc_upptkcc']*zgconv) & (dfin.LOWTKCC<0) & (dfin.MSLPCC20>round_to_nearest5(P['tc_cc20_slope']*res+P['tc_cc20_intercept']))) #Tropical Cyclone Condition
+    if modenum<2:
+        cond_tlc= (dfin.MIDTKCC<0) & (dfin.LOWTKCC<0) & (((dfin.LPSAREA<=P['tlc_area']) & (dfin.MSLPCC20>P['tlc_cc20']) & (dfin.LPSAREA>0)) | ((dfin.MSLPCC20>420) & (dfin.mslcc_ratio>0.5))) #TLC Condition
+    else:
+        cond_tlc=np.zeros(len(dfin),dtype=bool) #No TLC in the simplified extratropical branch
+    #The alternative TLC condition without using the embedded TLC criterion (See Sec. 5.3)
+    #cond_tlc= (dfin.MIDTKCC<0) & (dfin.LOWTKCC<0) & (dfin.LPSAREA<=7e5) & (dfin.MSLPCC20>145) & (dfin.LPSAREA>0)
+    if base is not None:
+        return dict(base,tc=cond_tc,tlc=cond_tlc)
+    try:
+        cond_hal=(dfin.Z850-dfin.ZS<100*zgconv) & ~(dfin.MSLP<=92500) #High-altitude Condition. Z850 is not necessary for classification if data contains missing values (typically 1e20 or 1e15) or NaN. T850 will be used.
+    except:
+        cond_hal=(dfin.T850!=dfin.T850) | (abs(dfin.T850)>1e14) | (dfin.T850==0)
+    cond_cv=(((dfin.VO500AVG>0) & (dfin.LAT>=0.0)) | ((dfin.VO500AVG<0) & (dfin.LAT<0.0))) #Cyclonic Condition
+    cond_dry=dfin.RH850AVG<=60*rhconv #Dryness Condition
+    if data250=='Y' or data250=='y':
+        cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<13) & (dfin.T850>280)
+        cond_trop_htc=(dfin.RH100MAX>5*rhconv) & (dfin.DEEPSHEAR<13) & (dfin.T850>280)
+    else:
+        cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<18) & (dfin.T850>280) #Default Tropical Condition
+        cond_trop_htc=(dfin.RH100MAX>5*rhconv) & (dfin.DEEPSHEAR<18) & (dfin.T850>280)
+    cond_td=(dfin.MSLPCC55>160) & (dfin.UPPTKCC<0)  #Tropical Depression Condition
+    cond_md=(dfin.RH850AVG>85*rhconv) & (dfin.U850DIFF>0)  #Monsoon System Condition
+    WS200PMXadj=0
+    if data250=='Y' or data250=='y':
+        WS200PMXadj=5
+    if isregion=='N' or isregion=='n':
+        cond_sc=(dfin.LOWTKCC<0)&(dfin.Z500CC>0)&(dfin.WS200PMX>30+WS200PMXadj) #SC Condition
+    else:
+        # The alternative criteria to replace WS200MAX criteria for SC condition in regional models (See SI text S4):
+        cond_sc=(dfin.LOWTKCC<0)&(dfin.Z500CC>0)&((dfin.WS200PMX>30+WS200PMXadj)|(dfin.DEEPSHEAR>12))
+        #OR (dfin.LOWTKCC<0)&(dfin.Z500CC>0)&((dfin.WS200PMX>30+WS200PMXadj)|((dfin.T850>273)&(dfin.DEEPSHEAR>14)))
+    if (isregion=='Y' or isregion=='y'):
+    # The alternative criteria to replace WS200MAX criteria for TLC condition in regional models (See SI text S4):
+        cond_stlc=(dfin.WS200PMX>=25+WS200PMXadj)|(dfin.DEEPSHEAR>11)
+        # OR cond_stlc=(dfin.WS200PMX>=25+WS200PMXadj)|((dfin.DEEPSHEAR>11)&(dfin.T850>273))
+        cond_pl=(dfin.WS200PMX<25+WS200PMXadj)|(dfin.DEEPSHEAR<=11)
+        # OR cond_pl=(dfin.WS200PMX<25+WS200PMXadj)|((dfin.DEEPSHEAR<=11)&(dfin.T850<=273))
+    else: #The default condition
+        cond_stlc=dfin.WS200PMX>=25+WS200PMXadj
+        cond_pl=dfin.WS200PMX<25+WS200PMXadj
+    return {'hal':cond_hal,'midupptk':(dfin.MIDTKCC<0)|(dfin.UPPTKCC<0),'dry':cond_dry,'lowtk':dfin.LOWTKCC<0,'cv':cond_cv,'trop':cond_trop,
+            'trop_htc':cond_trop_htc,'tc':cond_tc,'td':cond_td,'md':cond_md,'tlc':cond_tlc,'stlc':cond_stlc,'pl':cond_pl,'sc':cond_sc}
+
+#The track_labels function below labels the tracks of a window from the label codes and packed conditions of its nodes (see classify_nodes) with the thresholds P.
+#It returns the Track_Info flags of the nodes (QS tags are added by flush_windows), the TC-like and MS tracks for the label smoothing and the QS tracks of dfinfo.
+def track_labels(TID,label_code,bits,names,TropFlag,P,dfinfo):
+    #Node counts of TC, TC/HTC, monsoonal, TLC, TLC-STLC and TLC-PL nodes of every track in one pass, broadcast back to the nodes as Track_Info flags
+    tlc=rule_mask(bits,names,["~hal","~dry","~trop","cv","tlc"]) #nodes that satisfy TLC Condition
+    utid,counts,tinv=track_counts(TID,[label_code==LABEL_CODE['TC'],
+                                       rule_mask(bits,names,["~hal","~dry","cv","trop_htc","tc"]), #TC or HTC nodes
+                                       rule_mask(bits,names,["~hal","~dry","cv","trop","~tc","md"]), #Monsoonal nodes
+                                       tlc,tlc&rule_mask(bits,names,["stlc"]),tlc&rule_mask(bits,names,["pl"])])
+    if data250=='Y' or data250=='y':
+        istc=counts[:,0]>=round(6*convrate);isatc=counts[:,1]>=round(6*convrate)
+    else:
+        istc=counts[:,0]>=round(8*convrate);isatc=counts[:,1]>=round(8*convrate)
+    ishtc=isatc&~istc #HTC tracks that are not labeled as TC tracks
+    isms=counts[:,2]>=round(10*convrate)
+    atctrack=utid[isatc];htctrack=utid[ishtc];mstrack=utid[isms]
+    track_flag=TRACK_FLAGS['TC']*istc+TRACK_FLAGS['HT']*ishtc+TRACK_FLAGS['MS']*isms
+    # TLC tracks (STLC and PL tracks)
+    if modenum<=1:
+        istlc=counts[:,3]>=round(2*convrate)
+        track_flag+=TRACK_FLAGS['SS(STLC)']*(istlc&(counts[:,4]>0))+TRACK_FLAGS['PL(PTLC)']*(istlc&(counts[:,5]>0))
+    # QS Track (tagged by flush_windows)
+    qstrack=[]
+    if modenum==0 or modenum==2:
+        qstrack=pd.unique(dfinfo[(dfinfo["Track Linearity"]<P['qs_linearity'])&(dfinfo["Track Spread"]<P['qs_spread'])&(dfinfo["Track Inland Ratio"]>P['qs_inland'])].TID)
+    track_info=track_flag.astype(np.uint8)[tinv]
+    ## Identifying extratropical transition (EXT) and tropical transition (TT) Nodes
+    extflag,ttflag=transition_flags(TID,np.isin(label_code,label_codes('TC')),np.isin(label_code,label_codes('DS')),
+                                    TropFlag,atctrack,htctrack,convrate)
+    track_info[extflag]|=TRACK_FLAGS['EXT']
+    track_info[ttflag]|=TRACK_FLAGS['TT']
+    return track_info,atctrack,mstrack,qstrack
+
+#The read_sweep function below reads the threshold sets of a threshold sweep from the CSV file SweepFile: one row per set, with a column for each threshold
+#to vary (see THRESHOLDS) and an optional 'name' column. Thresholds that are missing or left blank take their default values.
+def read_sweep(sweepfile,defaults):
+    dfs=pd.read_csv(sweepfile)
+    unknown=[c for c in dfs.columns if c!='name' and c not in defaults]
+    if len(unknown)>0:
+        raise ValueError("Unknown thresholds in "+sweepfile+": "+", ".join(unknown)+". Thresholds that can be varied: "+", ".join(defaults))
+    names=dfs['name'].astype(str).tolist() if 'name' in dfs.columns else ['v'+str(i) for i in range(len(dfs))]
+    if len(set(names))<len(names):
+        raise ValueError("Duplicate threshold set names in "+sweepfile)
+    sets=[dict(defaults,**{c:float(r[c]) for c in dfs.columns if c!='name' and r[c]==r[c]}) for i,r in dfs.iterrows()]
+    return names,sets
+
+#Column types of the StitchNodes CSV file (other columns are inferred). All float columns stay float64: the diagnostics are compared with Python float
+#thresholds, and a float32 value next to a threshold may round onto it (NumPy 2 compares them in float32), so the labels would change. See LOWMEM_DTYPES.
+TRACK_DTYPES={'track_id':np.int64,'year':np.int64,'month':np.int64,'day':np.int64,'hour':np.int64,'i':np.int64,'j':np.int64,
+              'lon':np.float64,'lat':np.float64,'MSLP':np.float64,'MSLPCC20':np.float64,'MSLPCC55':np.float64,'WS':np.float64,'WS925':np.float64,'Z850':np.float64,'ZS':np.float64,
+              'DEEPSHEAR':np.float64,'UPPTKCC':np.float64,'MIDTKCC':np.float64,'LOWTKCC':np.float64,'Z500CC':np.float64,'VO500AVG':np.float64,
+              'RH100MAX':np.float64,'RH850AVG':np.float64,'T850':np.float64,'U850DIFF':np.float64,'WS200PMX':np.float64,'WS250PMX':np.float64}
+
+#Column types of the low-memory mode (LowMemory): the StitchNodes columns above with the float columns in float32 (except the node positions,
+#which blob pairing and the track distances use) and the integer columns in int32 (int16 for the time fields). Only the columns of LOWMEM_COLUMNS are read.
+LOWMEM_ROWS=250000 #Rows per chunk of the tables converted to Arrow (the track cache and the catalogs) and of the track kinematics in the low-memory mode
+LOWMEM_PARQUET=dict(pre_buffer=False,buffer_size=1<<20) #Parquet files are read in small buffered reads instead of whole column chunks in the low-memory mode
+LOWMEM_DTYPES={c:(np.int16 if c in ('year','month','day','hour') else np.int32 if t==np.int64 else t if c in ('lon','lat') else np.float32) for c,t in TRACK_DTYPES.items()}
+
+#StitchNodes columns read by each section in the low-memory mode: the node times and the output columns, the conditions of the main classification,
+#blob pairing and the TLC Condition (LPSAREA, modes 0 and 1) and the track parameters (QS, modes 0 and 2). Columns of no section (e.g., WS250PMX) are not read.
+LOWMEM_COLUMNS={'catalog':['track_id','year','month','day','hour','i','j','lon','lat','MSLP','WS','WS925','ZS'],
+                 'classification':['MSLP','MSLPCC20','MSLPCC55','Z850','ZS','T850','DEEPSHEAR','UPPTKCC','MIDTKCC','LOWTKCC','Z500CC','VO500AVG',
+                                   'RH100MAX','RH850AVG','U850DIFF','WS200PMX','lat','lon'],
+                 'lpsarea':['lon','lat','MSLP','MIDTKCC','LOWTKCC','MSLPCC20','MSLPCC55'],
+                 'qs':['lon','lat']}
+
+#The mode_columns function below returns the StitchNodes columns read in the low-memory mode for the sections of the mode (modenum).
+def mode_columns():
+    sections=['catalog','classification']+(['lpsarea'] if modenum<=1 else [])+(['qs'] if modenum==0 or modenum==2 else [])
+    return {c for s in sections for c in LOWMEM_COLUMNS[s]}
+
+#The track_dtypes function below returns the StitchNodes column types of the run (see LowMemory).
+def track_dtypes():
+    if not LowMemory:
+        return TRACK_DTYPES
+    cols=mode_columns()
+    return {c:t for c,t in LOWMEM_DTYPES.items() if c in cols}
+
+#The track_columns function below tells whether a StitchNodes column is read (all columns, or those of mode_columns and ISOTIME in the low-memory mode).
+def track_columns(c):
+    return not LowMemory or c.strip() in mode_columns() or c.strip()=='ISOTIME'
+
+#The take_rows function below returns the rows of df (e.g., the kept nodes) as a new table. In the low-memory mode, the columns are moved one at a time,
+#so only one column is held twice instead of the whole table.
+def take_rows(df,rows):
+    if not LowMemory:
+        return df.iloc[rows].reset_index(drop=True)
+    return pd.DataFrame({c:df.pop(c).to_numpy()[rows] for c in list(df.columns)},copy=False) #(copy=False keeps one block per column)
+
+#The release_memory function below returns the memory freed by the classifier to the system in the low-memory mode: the unused memory kept by the Arrow
+#memory pool and the free pages of the C heap (glibc only), so the memory use after each section follows the data that are still in use.
+def release_memory():
+    if not LowMemory:
+        return
+    pa.default_memory_pool().release_unused()
+    try:
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError,AttributeError):
+        pass
+
+#The track_calendar function below returns the calendar of the dates: Calendar if it is set, otherwise 'standard', or '360_day' if any date is not a Gregorian date (e.g., Feb 30).
+def track_calendar(year,month,day):
+    if Calendar is not None:
+        return CALENDARS[Calendar]
+    mon=((np.asarray(year)-1970)*12+np.asarray(month)-1).astype('M8[M]')
+    t=mon.astype('M8[D]')+(np.asarray(day)-1).astype('m8[D]')
+    return 'standard' if np.all((t.astype('M8[M]')==mon)&(np.asarray(day)>=1)) else '360_day'
+
+#The add_isotime function below adds the HOURS column (see track_hours) to raw StitchNodes rows and combines the four time columns to form the ISOTIME column.
+def add_isotime(dfin,calendar):
+    dfin['HOURS']=track_hours(*time_fields(dfin),calendar)
+    if 'ISOTIME' in dfin.columns:
+        return dfin
+    t=hours_isotime(dfin.HOURS,calendar)
+    if t.dtype==object: # In case of using cftime for 360_day calendar
+        dfin['ISOTIME']=t;dfin['ISOTIME']=dfin['ISOTIME'].astype(str)
+    else:
+        dfin.insert(5, 'ISOTIME', t)
+    return dfin.drop(columns=['year','month','day','hour'])
+
+#The track_csv_options function below returns the column names of a StitchNodes CSV file and the options of the Arrow CSV reader with the column types of the run
+#(see track_dtypes) for the columns where use is True (see track_columns).
+def track_csv_options(csvfile,use=track_columns):
+    dtypes=track_dtypes()
+    with open(csvfile) as f:
+        names=[c.strip() for c in f.readline().split(',')]
+    return names,dict(read_options=pacsv.ReadOptions(column_names=names,skip_rows=1),
+                      convert_options=pacsv.ConvertOptions(column_types={c:pa.from_numpy_dtype(dtypes[c]) for c in names if c in dtypes},
+                                                           null_values=pacsv.ConvertOptions().null_values+[' nan'],include_columns=[c for c in names if use(c)]))
+
+#The read_tracks function below reads a StitchNodes CSV file with the multithreaded Arrow CSV reader and the column types above, and forms the ISOTIME column.
+#The formatted table is cached in a parquet file next to the CSV file and reused as long as the CSV file's path, size and modification time are unchanged.
+#It returns the table and its calendar.
+def read_tracks(csvfile):
+    cachefile=os.path.splitext(csvfile)[0]+'_cache.parquet'
+    dtypes=track_dtypes()
+    key=str((os.path.abspath(csvfile),os.path.getsize(csvfile),os.stat(csvfile).st_mtime_ns,sorted((c,np.dtype(t).name) for c,t in dtypes.items()),Calendar)+(('LowMemory',) if LowMemory else ()))
+    if os.path.exists(cachefile):
+        try:
+            meta=pq.read_schema(cachefile).metadata
+            if meta.get(b'csvkey')==key.encode():
+                if LowMemory: #The columns are read one at a time (see read_columns)
+                    dfin=read_columns(pq.ParquetFile(cachefile,**LOWMEM_PARQUET));release_memory()
+                    return dfin,meta[b'calendar'].decode()
+                return pd.read_parquet(cachefile),meta[b'calendar'].decode()
+        except Exception:
+            pass
+    options=track_csv_options(csvfile)[1]
+    if LowMemory: #The cache is formed block by block, and the table is read from it as in a cached run (see stream_tracks)
+        try:
+            calendar=stream_tracks(csvfile,cachefile,key,options)
+            dfin=read_columns(pq.ParquetFile(cachefile,**LOWMEM_PARQUET));release_memory()
+            return dfin,calendar
+        except OSError:
+            pass #(e.g., the directory of the CSV file is read-only: the table is formed in memory below)
+    if not LowMemory:
+        table=pacsv.read_csv(csvfile,**options)
+        dfin=table.to_pandas()
+    else:
+        #The CSV file is streamed in blocks (only the parsed compact columns are held), and the Arrow buffers are released as they are converted.
+        table=pa.Table.from_batches(list(pacsv.open_csv(csvfile,**options)))
+        dfin=table.to_pandas(self_destruct=True,split_blocks=True)
+    del table
+    calendar=track_calendar(*time_fields(dfin)[:3])
+    dfin=add_isotime(dfin,calendar).rename(columns={"lon": "LON", "lat": "LAT","track_id":"TID"})
+    try:
+        chunk=max(len(dfin),1) if not LowMemory else LOWMEM_ROWS #The cache is written in chunks of rows in the low-memory mode
+        for i in range(0,max(len(dfin),1),chunk):
+            table=pa.Table.from_pandas(dfin.iloc[i:i+chunk],preserve_index=False)
+            if i==0:
+                writer=pq.ParquetWriter(cachefile,table.schema.with_metadata({**table.schema.metadata,b'csvkey':key.encode(),b'calendar':calendar.encode()}))
+            writer.write_table(table.replace_schema_metadata(writer.schema.metadata))
+        writer.close()
+    except OSError:
+        pass
+    release_memory()
+    return dfin,calendar
+
+#The stream_tracks function below writes the parquet cache of read_tracks (cachefile, with the cache key) in the low-memory mode without holding the whole table:
+#the CSV file is streamed in blocks to a temporary parquet file while its calendar is found (see track_calendar), then each row group of that file
+#is formatted (see add_isotime) and written to the cache file. It returns the calendar.
+def stream_tracks(csvfile,cachefile,key,options,block_size=1<<24):
+    tmpfile=cachefile+'.tmp';calendar=None
+    options['read_options'].block_size=block_size
+    try:
+        reader=pacsv.open_csv(csvfile,**options)
+        with pq.ParquetWriter(tmpfile,reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                c=track_calendar(*time_fields(batch.to_pandas())[:3]);calendar=c if calendar in (None,'standard') else calendar
+        calendar=calendar or track_calendar(*[np.zeros(0,dtype=np.int64)]*3)
+        pf=pq.ParquetFile(tmpfile,**LOWMEM_PARQUET);writer=None
+        for g in range(pf.num_row_groups) if pf.num_row_groups>0 else [None]:
+            df=add_isotime(read_columns(pf,None,g),calendar).rename(columns={"lon": "LON", "lat": "LAT","track_id":"TID"})
+            table=pa.Table.from_pandas(df,schema=writer.schema if writer is not None else None,preserve_index=False)
+            if writer is None:
+                writer=pq.ParquetWriter(cachefile,table.schema.with_metadata({**table.schema.metadata,b'csvkey':key.encode(),b'calendar':calendar.encode()}))
+            writer.write_table(table.replace_schema_metadata(writer.schema.metadata))
+            df=table=None;release_memory()
+        writer.close()
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+    return calendar
+
+#The file_key function below gives the fingerprint (path, size and modification time) of a file for the cache and checkpoint keys.
+def file_key(path):
+    return (os.path.abspath(path),os.path.getsize(path),os.stat(path).st_mtime_ns)
+
+#The terrain_key function below gives the settings that decide the terrain neighbourhoods of the nodes for the checkpoint keys:
+#the connectivity file of an unstructured ZS grid (None for a lat-lon grid) and the radii of ZSMX and zsper.
+def terrain_key():
+    return (file_key(ConnectivityFile) if ConnectivityFile is not None else None,ZSMAX_RADIUS,ZSPER_RADIUS)
+
+#The stage_key function below gives the checkpoint name of a classifier section: the section name and a hash of its inputs
+#(file fingerprints, parameters and arrays such as the StitchNodes rows of the nodes), so any change of the inputs gives a new checkpoint.
+def stage_key(stage,*inputs):
+    h=hashlib.sha1()
+    for x in inputs:
+        h.update(np.ascontiguousarray(x).tobytes() if isinstance(x,np.ndarray) else repr(x).encode())
+    return stage+'_'+h.hexdigest()[:20]
+
+#The load_checkpoint function below reads the parts (data frames) of a checkpoint saved by save_checkpoint in CheckpointDir, or returns None if any part is missing.
+def load_checkpoint(key,*parts):
+    if CheckpointDir is None:
+        return None
+    files=[os.path.join(CheckpointDir,key+'_'+p+'.parquet') for p in parts]
+    try:
+        return [pd.read_parquet(f) for f in files] if all(os.path.exists(f) for f in files) else None
+    except Exception:
+        return None
+
+#The save_checkpoint function below saves the parts (data frames) of a checkpoint to CheckpointDir. Each part is written to a temporary file first,
+#so an interrupted run never leaves a partial checkpoint behind.
+def save_checkpoint(key,**parts):
+    if CheckpointDir is None:
+        return
+    try:
+        os.makedirs(CheckpointDir,exist_ok=True)
+        for p,df in parts.items():
+            f=os.path.join(CheckpointDir,key+'_'+p+'.parquet')
+            df.to_parquet(f+'.tmp',index=False);os.replace(f+'.tmp',f)
+    except OSError:
+        pass
+
+#The node_time function below returns the node times of raw StitchNodes rows in hours (see track_hours),
+#and the month number (year*12+month-1) of each node for splitting the catalog into time windows.
+def node_time(df,calendar):
+    year,month,day,hour=time_fields(df)
+    return track_hours(year,month,day,hour,calendar),year*12+month-1
+
+#The split_windows function below streams the StitchNodes CSV file in chunks of rows and splits the catalog into time windows of nmonth months
+#by the first node of each track. Tracks are never split: the rows of a track that crosses a chunk boundary are carried over to the next chunk,
+#and a track whose first node falls in an earlier window than the current one stays in the current window (windows are contiguous in TID).
+#Each window is saved to a parquet file in tmpdir. The BlobStats file (if given) is streamed to parquet files with their time ranges.
+#It returns the windows (file, first row, and the TID and first/last node time of each track), the blob files, the column dtypes of the whole CSV file,
+#the max RH850AVG of non-high-altitude nodes for the RH unit check, and the calendar (see track_calendar) of the whole CSV file.
+def split_windows(csvfile,blobfile,nmonth,tmpdir,chunksize=1000000):
+    windows=[];dtypes={};rhmax=[];parts=[];carry=None;cur=-1;prevtid=-np.inf;nrow=0;row0=0;nongreg=False
+    def flush():
+        w=pd.concat(parts,ignore_index=True)
+        year,month,day,hour=time_fields(w)
+        t=((year*100+month)*100+day)*100+hour #Node times as YYYYMMDDHH numbers until the calendar is known
+        fst=np.flatnonzero(np.append(True,np.diff(w.track_id.to_numpy())!=0))
+        lst=np.append(fst[1:],len(w))-1
+        windows.append({'file':os.path.join(tmpdir,f'window{len(windows):05d}.parquet'),'row0':row0,
+                        'tid':w.track_id.to_numpy()[fst],'tstart':t[fst],'tend':t[lst]})
+        w.to_parquet(windows[-1]['file'])
+    for chunk in itertools.chain(pd.read_csv(csvfile,na_values=' nan',chunksize=chunksize,usecols=track_columns),[None]):
+        if chunk is None: #End of file: the carried-over track is complete
+            df=carry
+        else:
+            chunk.columns=chunk.columns.str.strip()
+            chunk=chunk.astype({c:track_dtypes()[c] for c in chunk.columns if c in track_dtypes()})
+            for c in chunk.columns:
+                dtypes[c]=chunk[c].dtype if c not in dtypes or dtypes[c]==chunk[c].dtype else np.result_type(dtypes[c],chunk[c].dtype)
+            df=chunk if carry is None else pd.concat([carry,chunk],ignore_index=True)
+            carry=df[df.track_id==df.track_id.iloc[-1]];df=df.iloc[:len(df)-len(carry)]
+        if df is None or len(df)==0:
+            continue
+        tid=df.track_id.to_numpy()
+        if np.any(np.diff(tid)<0) or tid[0]<=prevtid:
+            raise ValueError("Track IDs must be in ascending order in "+csvfile+" to classify it in time windows.")
+        prevtid=tid[-1]
+        rhmax.append(df.RH850AVG[~hal_precondition(df)].max())
+        if Calendar is None:
+            nongreg=nongreg or track_calendar(*time_fields(df)[:3])=='360_day'
+        #Window key of each track by its first node (never decreasing along the TID order), and the rows where new windows start:
+        fst=np.flatnonzero(np.append(True,np.diff(tid)!=0))
+        year,month=time_fields(df.iloc[fst])[:2]
+        key=np.maximum(np.maximum.accumulate((year*12+month-1)//nmonth),cur)
+        prev=0
+        for c in fst[key>np.append(cur,key[:-1])]:
+            if c>prev:
+                parts.append(df.iloc[prev:c])
+            if len(parts)>0:
+                flush();parts=[]
+            row0=nrow+c;prev=c
+        parts.append(df.iloc[prev:])
+        cur=key[-1];nrow+=len(df)
+    if len(parts)>0:
+        flush()
+    calendar=CALENDARS[Calendar] if Calendar is not None else '360_day' if nongreg else 'standard'
+    for w in windows:
+        for c in ('tstart','tend'):
+            w[c]=track_hours(w[c]//1000000,w[c]//10000%100,w[c]//100%100,w[c]%100,calendar)
+    blobs=[]
+    if blobfile is not None:
+        for batch in pq.ParquetFile(blobstats_cache(blobfile,calendar)).iter_batches(batch_size=chunksize):
+            dfblob=batch.to_pandas()
+            blobs.append({'file':os.path.join(tmpdir,f'blob{len(blobs):05d}.parquet'),'tmin':dfblob.time.min(),'tmax':dfblob.time.max()})
+            dfblob.to_parquet(blobs[-1]['file'])
+    return windows,blobs,dtypes,pd.Series(rhmax,dtype=float).max(),calendar
+
+#The read_window function below reads the nodes of window k with the column dtypes of the whole CSV file and their row
+#index in the CSV file. It also returns the halo nodes (HOURS, LON, LAT, MSLP and the row index "ind" of the other nodes at the node times of window k),
+#which blob pairing needs as all nodes at a time compete for the blobs at that time, and the blobs at the node times of window k.
+def read_window(windows,blobs,dtypes,calendar,k):
+    w=windows[k]
+    dfin=pd.read_parquet(w['file']).astype(dtypes)
+    rows=w['row0']+np.arange(len(dfin))
+    halo=[]
+    t=node_time(dfin,calendar)[0];tmin=t.min();tmax=t.max()
+    for j in range(len(windows)):
+        if j==k or windows[j]['tstart'].min()>tmax or windows[j]['tend'].max()<tmin:
+            continue
+        cols=[c for c in ['year','month','day','hour','ISOTIME','lon','lat','MSLP'] if c in dtypes]
+        df=pd.read_parquet(windows[j]['file'],columns=cols).astype({c:dtypes[c] for c in cols})
+        tj=node_time(df,calendar)[0]
+        m=np.flatnonzero(np.isin(tj,t))
+        halo.append(pd.DataFrame({'HOURS':tj[m],'LON':df.lon.to_numpy()[m],'LAT':df.lat.to_numpy()[m],'MSLP':df.MSLP.to_numpy()[m],'ind':windows[j]['row0']+m}))
+    dfhalo=pd.concat(halo,ignore_index=True) if len(halo)>0 else None
+    dfblob=None
+    if len(blobs)>0:
+        dfblob=[pd.read_parquet(b['file']) for b in blobs if b['tmin']<=tmax and b['tmax']>=tmin] or [pd.read_parquet(blobs[0]['file']).iloc[:0]]
+        dfblob=pd.concat([df[np.isin(df.time.to_numpy(),t)] for df in dfblob],ignore_index=True)
+    return dfin,rows,dfhalo,dfblob
+
+#The write_parquet function below appends df to the parquet file path, opening a writer with the schema of the first non-empty table written to it.
+#close_parquet closes the writers (an empty table is written to the files that only had empty tables).
+#The options (e.g., use_dictionary) are passed to the writer, and row_group_size to every write.
+def write_parquet(writers,path,df,row_group_size=None,**options):
+    if len(df)==0:
+        writers.setdefault(path,df)
+        return
+    chunk=len(df) if not LowMemory else LOWMEM_ROWS #The low-memory mode converts the table to Arrow in chunks of rows
+    for i in range(0,len(df),chunk):
+        if isinstance(writers.get(path),pq.ParquetWriter):
+            table=pa.Table.from_pandas(df.iloc[i:i+chunk],schema=writers[path].schema,preserve_index=False)
+        else:
+            table=pa.Table.from_pandas(df.iloc[i:i+chunk],preserve_index=False)
+            writers[path]=pq.ParquetWriter(path,table.schema,**options)
+        writers[path].write_table(table,row_group_size=row_group_size)
+
+#The write_dataset function below appends the classified nodes df to the hive-partitioned parquet dataset root, with one file per year (and label family, see DatasetByFamily).
+#The nodes are sorted by ISOTIME (then TID) in each write, so the row groups cover short time ranges, and their min/max statistics let readers skip them,
+#e.g., pd.read_parquet(root,filters=[('year','>=',2005),('year','<=',2010),('Short_Label','==','TC')]).
+#The label columns are dictionary-encoded with all the short labels (SHORT_LABELS) as the dictionary, so all the files have the same schema.
+def write_dataset(writers,root,df):
+    if len(df)==0:
+        return
+    labels=[c for c in ['Short_Label','Adjusted_Label'] if c in df.columns]
+    df=df.assign(**{c:pd.Categorical(df[c],categories=SHORT_LABELS) for c in labels}).sort_values(['ISOTIME','TID'],kind='stable')
+    t=df.ISOTIME.to_numpy()
+    keys={'year':t.astype('M8[Y]').astype(int)+1970 if t.dtype.kind=='M' else pd.Series(t).str[:4].astype(int).to_numpy()} #ISOTIME strings for other calendars
+    if DatasetByFamily:
+        keys['family']=pd.Series(df.Short_Label.astype(object)).map(LABEL_FAMILY).to_numpy()
+    for key,part in df.groupby([pd.Series(v,index=df.index,name=k) for k,v in keys.items()],sort=True):
+        key=key if isinstance(key,tuple) else (key,)
+        path=os.path.join(root,*[k+'='+str(v) for k,v in zip(keys,key)])
+        os.makedirs(path,exist_ok=True)
+        write_parquet(writers,os.path.join(path,'part-0.parquet'),part,row_group_size=DatasetRowGroup,
+                      use_dictionary=labels+(['Track_Info'] if part.Track_Info.dtype==object else []),write_statistics=True)
+
+#copy_parquet appends the rows of the parquet file src that are not in the tracks droptid to the parquet file path, one row group at a time.
+#The row groups without these tracks (by their TID statistics, see row_group_range) are copied as they are, without converting them to data frames.
+def copy_parquet(writers,path,src,droptid):
+    f=pq.ParquetFile(src)
+    for i in range(f.num_row_groups):
+        r=row_group_range(f,i,'TID')
+        if r is not None and not np.any((droptid>=r[0])&(droptid<=r[1])):
+            table=f.read_row_group(i)
+            if not isinstance(writers.get(path),pq.ParquetWriter):
+                writers[path]=pq.ParquetWriter(path,table.schema)
+            writers[path].write_table(table)
+            continue
+        df=f.read_row_group(i).to_pandas()
+        write_parquet(writers,path,df[~np.isin(df.TID.to_numpy(),droptid)])
+
+#The copy_dataset function below writes the nodes of the classified catalog src that are not in the tracks droptid to the dataset (see write_dataset) in the append mode.
+#The year partitions of the old dataset (olddataset) before the first node time of the replaced tracks and of the classified tracks (tfirst) are linked to the dataset
+#as they are, and only the nodes of the later years are written.
+def copy_dataset(writers,dataset,olddataset,src,droptid,tfirst,calendar):
+    f=pq.ParquetFile(src)
+    for i in range(f.num_row_groups):
+        r=row_group_range(f,i,'TID')
+        if r is None or np.any((droptid>=r[0])&(droptid<=r[1])):
+            df=read_columns(f,['TID','ISOTIME'],i);t=df.ISOTIME.to_numpy()[np.isin(df.TID.to_numpy(),droptid)]
+            tfirst=min(tfirst,isotime_hours(t,calendar).min()) if len(t)>0 else tfirst
+    year0=-np.inf if not os.path.isdir(olddataset) else np.inf if tfirst==np.inf else int(str(hours_isotime([tfirst],calendar)[0])[:4])
+    for d in glob.glob(os.path.join(olddataset,'year=*')):
+        if int(os.path.basename(d)[5:])<year0:
+            shutil.copytree(d,os.path.join(dataset,os.path.basename(d)),copy_function=link_file)
+    t0=track_hours(year0,1,1,0,calendar) if np.isfinite(year0) else year0 #First hour of year0
+    for i in range(f.num_row_groups):
+        r=row_group_range(f,i,'ISOTIME')
+        if r is not None and isotime_hours(np.array([r[1]]),calendar)[0]<t0:
+            continue
+        df=f.read_row_group(i).to_pandas()
+        write_dataset(writers,dataset,df[~np.isin(df.TID.to_numpy(),droptid)&(isotime_hours(df.ISOTIME.to_numpy(),calendar)>=t0)])
+
+#The link_file function below links the file src to dst (or copies it if it cannot be linked, e.g., on another file system).
+def link_file(src,dst):
+    try:
+        os.link(src,dst)
+    except OSError:
+        shutil.copy2(src,dst)
+
+#The row_group_range function below returns the min and max of column col in row group i of the parquet file f from its statistics (None without statistics).
+#(Timestamps are returned as datetime64.)
+def row_group_range(f,i,col):
+    st=f.metadata.row_group(i).column(f.schema_arrow.get_field_index(col)).statistics
+    if st is None or not st.has_min_max:
+        return None
+    return tuple(np.datetime64(v,'us') if isinstance(v,datetime.datetime) else v for v in (st.min,st.max))
+
+def close_parquet(writers):
+    for path,writer in writers.items():
+        if isinstance(writer,pq.ParquetWriter):
+            writer.close()
+        else:
+            writer.to_parquet(path,index=False)
+
+#The track_summary function below scans a StitchNodes CSV file in blocks for the track IDs and node times (and the columns of the RH unit check, see hal_precondition) only,
+#so the append mode (AppendMode) finds the open tracks (see open_tracks) without converting the whole file. It returns the TID, the first row and the first and last
+#node times of each track, the max RH850AVG of non-high-altitude nodes and the calendar of the file, as split_windows does.
+def track_summary(csvfile,block_size=1<<24):
+    names,options=track_csv_options(csvfile,lambda c: c in ('track_id','year','month','day','hour','ISOTIME','RH850AVG','MSLP','T850','Z850','ZS'))
+    options['read_options'].block_size=block_size
+    parts=[];rhmax=[];nrow=0;nongreg=False;prevtid=-np.inf
+    for batch in pacsv.open_csv(csvfile,**options):
+        df=batch.to_pandas();tid=df.track_id.to_numpy()
+        if len(df)==0:
+            continue
+        if np.any(np.diff(tid)<0) or tid[0]<prevtid:
+            raise ValueError("Track IDs must be in ascending order in "+csvfile+" to extend the catalog in the append mode.")
+        prevtid=tid[-1]
+        rhmax.append(df.RH850AVG[~hal_precondition(df)].max())
+        if Calendar is None:
+            nongreg=nongreg or track_calendar(*time_fields(df)[:3])=='360_day'
+        year,month,day,hour=time_fields(df)
+        t=((year*100+month)*100+day)*100+hour #Node times as YYYYMMDDHH numbers until the calendar is known
+        fst=np.flatnonzero(np.append(True,np.diff(tid)!=0));lst=np.append(fst[1:],len(df))-1
+        parts.append(pd.DataFrame({'tid':tid[fst],'row0':nrow+fst,'tstart':t[fst],'tend':t[lst]}))
+        nrow+=len(df)
+    calendar=CALENDARS[Calendar] if Calendar is not None else '360_day' if nongreg else 'standard'
+    #(A track that runs across blocks starts in one block and ends in a later one.)
+    tracks=pd.concat(parts,ignore_index=True) if len(parts)>0 else pd.DataFrame({c:np.zeros(0,dtype=np.int64) for c in ['tid','row0','tstart','tend']})
+    tracks=tracks.groupby('tid',sort=False).agg(row0=('row0','first'),tstart=('tstart','first'),tend=('tend','last')).reset_index()
+    tracks={c:tracks[c].to_numpy() for c in tracks.columns}
+    for c in ('tstart','tend'):
+        tracks[c]=track_hours(tracks[c]//1000000,tracks[c]//10000%100,tracks[c]//100%100,tracks[c]%100,calendar)
+    return tracks,pd.Series(rhmax,dtype=float).max(),calendar
+
+#The catalog_ranges function below returns the TID and node time (hours) ranges of the row groups of a catalog from the row group statistics (see row_group_range),
+#or from the columns of the row groups without statistics.
+def catalog_ranges(catalog,calendar):
+    f=pq.ParquetFile(catalog);ranges=[]
+    for i in range(f.num_row_groups):
+        tid,t=row_group_range(f,i,'TID'),row_group_range(f,i,'ISOTIME')
+        if tid is None or t is None:
+            df=read_columns(f,['TID','ISOTIME'],i)
+            if len(df)==0:
+                continue
+            tid,t=(df.TID.min(),df.TID.max()),(df.ISOTIME.min(),df.ISOTIME.max())
+        ranges.append((*tid,*isotime_hours(np.array(t),calendar)))
+    return pd.DataFrame(ranges,columns=['tidmin','tidmax','tmin','tmax'])
+
+#The open_tracks function below marks (tracks['open']) the tracks of a StitchNodes file (see track_summary) that end later than max_gap_hour before the last node time
+#of the existing catalog (from the row group ranges of catalog_ranges), i.e., the tracks that StitchNodes may have continued with new data and the new tracks.
+#It returns the TID that the new tracks of the catalog start from.
+def open_tracks(tracks,ranges,max_gap_hour):
+    tracks['open']=tracks['tend']>(ranges.tmax.max()-max_gap_hour if len(ranges)>0 else -np.inf)
+    return ranges.tidmax.max()+1 if len(ranges)>0 else 0
+
+#The read_open_tracks function below reads the nodes of the open tracks (tracks['open'], see open_tracks) of a StitchNodes file and their row index in the file,
+#with the halo nodes and the blobs at their node times, as read_window does for a window. The file is parsed from the first track that reaches the first node time
+#of the open tracks on (the rows before it are skipped unparsed), and the blobs are read from the first node time on (see read_blobstats_after).
+def read_open_tracks(csvfile,blobfile,tracks,calendar,block_size=1<<24):
+    opentid=tracks['tid'][tracks['open']];tmin=tracks['tstart'][tracks['open']].min()
+    row0=tracks['row0'][tracks['tend']>=tmin].min()
+    names,options=track_csv_options(csvfile)
+    options['read_options'].skip_rows_after_names=int(row0);options['read_options'].block_size=block_size
+    nodes=[];noderows=[];halo=[];nrow=row0
+    for batch in pacsv.open_csv(csvfile,**options):
+        df=batch.to_pandas();rows=nrow+np.arange(len(df));nrow+=len(df)
+        m=np.isin(df.track_id.to_numpy(),opentid)
+        nodes.append(df[m]);noderows.append(rows[m])
+        t=node_time(df[~m],calendar)[0];h=np.flatnonzero(t>=tmin) #Nodes of the other tracks from the first node time on
+        halo.append(pd.DataFrame({'HOURS':t[h],'LON':df.lon.to_numpy()[~m][h],'LAT':df.lat.to_numpy()[~m][h],'MSLP':df.MSLP.to_numpy()[~m][h],'ind':rows[~m][h]}))
+    dfin=pd.concat(nodes,ignore_index=True);rows=np.concatenate(noderows)
+    t=node_time(dfin,calendar)[0]
+    dfhalo=pd.concat(halo,ignore_index=True);dfhalo=dfhalo[np.isin(dfhalo.HOURS.to_numpy(),t)].reset_index(drop=True)
+    dfblob=None
+    if blobfile is not None:
+        dfblob=read_blobstats_after(blobfile,tmin,calendar);dfblob=dfblob[np.isin(dfblob.time.to_numpy(),t)].reset_index(drop=True)
+    return dfin,rows,dfhalo,dfblob
+
+#The replaced_tracks function below returns the catalog tracks to replace in the append mode: those that share nodes with the open tracks (dfin, see read_open_tracks).
+#Only the row groups of the catalog that reach the first node time of the open tracks (see catalog_ranges) are read.
+def replaced_tracks(catalog,ranges,dfin,calendar):
+    opennode=pd.DataFrame({'HOURS':node_time(dfin,calendar)[0],'LON':dfin.lon.to_numpy(),'LAT':dfin.lat.to_numpy(),'MSLP':dfin.MSLP.to_numpy(dtype=np.float32)})
+    f=pq.ParquetFile(catalog);droptid=[np.array([],dtype=np.int64)]
+    for i in np.flatnonzero(ranges.tmax.to_numpy()>=opennode.HOURS.min()):
+        dfold=read_columns(f,['TID','ISOTIME','LON','LAT','MSLP'],i)
+        dfold['HOURS']=isotime_hours(dfold.ISOTIME.to_numpy(),calendar);dfold['MSLP']=dfold.MSLP.astype(np.float32) #(float32 in either mode, see LowMemory)
+        droptid.append(dfold.merge(opennode,on=['HOURS','LON','LAT','MSLP']).TID.to_numpy()) #(MSLP tells apart nodes of two tracks at one position)
+    return pd.unique(np.concatenate(droptid))
+
+#Columns of the classified catalog (those in the node table).
+CLASSIFIED_COLUMNS=['TID', 'LON', 'LAT', 'ISOTIME', 'MSLP', 'WS', 'WS925', 'ZS', 'Short_Label', 'Adjusted_Label', 'Tropical_Flag', 'Transition_Zone', 'Track_Info', 'LPSAREA', 'IKE', 'i', 'j', 'distance', 'direction']
+
+#The flush_windows function below completes the classification of the pending windows in order: QS track tags, label smoothing and output.
+#A window is completed once the windows after it hold at least nhalo nodes for the smoothing windows that run past its last track,
+#and all tracks with original TIDs up to its last TID have been processed (QS tags are looked up by TID, see QSTrackMapping), or when final is True.
+#The threshold sets of a threshold sweep (w['sweep'], with their QS tracks in sweepqs) are completed alongside and counted in sweepcounts (see sweep_counts).
+def flush_windows(pending,qstrack,lasttid,nhalo,final,writers,outfile,sweepqs=(),sweepcounts=None,dataset=None):
+    while len(pending)>0:
+        w=pending[0];dfin=w['dfin']
+        ahead=pending[1:]
+        if not final and (sum(len(a['dfin']) for a in ahead)<nhalo or (len(dfin)>0 and dfin.TID.values[-1]>lasttid)):
+            break
+        pending.pop(0)
+        st=start_stage('smoothing',window=w['window'])
+        TID=np.concatenate([dfin.TID.values]+[a['dfin'].TID.values for a in ahead])
+        MSLP=np.concatenate([dfin.MSLP.values]+[a['dfin'].MSLP.values for a in ahead])
+        # QS Track
+        if modenum==0 or modenum==2:
+            dfin['Track_Info']=dfin.Track_Info.values|(TRACK_FLAGS['QS']*np.isin(dfin.TID.values,qstrack)).astype(np.uint8)
+        # Adjusting (smoothing) Labels for TDs in stable TC periods and TDs/TLOs in stable MS periods.
+        adjusted_code=smooth_window(w,ahead,TID,MSLP)[:len(dfin)]
+        if sweepcounts is not None:
+            dfsweep=dfin[['TID','LON','LAT','ISOTIME']].copy()
+            counts=[sweep_counts(dfin.TID.values,adjusted_code,dfin.Track_Info.values)]
+            for v,s in enumerate(w['sweep']):
+                if modenum==0 or modenum==2:
+                    s['track_info']|=(TRACK_FLAGS['QS']*np.isin(dfin.TID.values,sweepqs[v])).astype(np.uint8)
+                code_v=smooth_window(s,[a['sweep'][v] for a in ahead],TID,MSLP)[:len(dfin)]
+                counts.append(sweep_counts(dfin.TID.values,code_v,s['track_info']))
+                dfsweep['Adjusted_Label_'+sweepnames[v]]=pd.Categorical.from_codes(code_v,SHORT_LABELS)
+                dfsweep['Track_Info_'+sweepnames[v]]=s['track_info']
+            sweepcounts.append(np.array(counts))
+            if SweepLabelFile is not None:
+                write_parquet(writers,SweepLabelFile,dfsweep)
+        end_stage(st,rows=len(dfin)*(1+len(w['sweep'])))
+        st=start_stage('output',window=w['window'])
+        ## Output the LPS classified catalog (label codes are written as short labels)
+        dfin['Short_Label']=SHORT_LABELS[dfin.Label_Code.values]
+        dfin['Adjusted_Label']=SHORT_LABELS[adjusted_code]
+        if TrackInfoString:
+            dfin['Track_Info']=track_info_strings(dfin.Track_Info.values)
+        available_columns = [col for col in CLASSIFIED_COLUMNS if col in dfin.columns]
+        dfout = dfin[available_columns]
+        write_parquet(writers,outfile,dfout)
+        if dataset is not None:
+            write_dataset(writers,dataset,dfout)
+        end_stage(st,rows=len(dfout))
+        ## Optionally, you can save it as a csv file:
+        #dfout.to_csv(ClassifiedOutFile_CSV)
+
+#The smooth_window function below smooths the label codes of a window (w['code']) with the nodes of the windows ahead (see smooth_labels).
+def smooth_window(w,ahead,TID,MSLP):
+    code=np.concatenate([w['code']]+[a['code'] for a in ahead])
+    atctrack=np.concatenate([w['atctrack']]+[a['atctrack'] for a in ahead])
+    mstrack=np.concatenate([w['mstrack']]+[a['mstrack'] for a in ahead])
+    return smooth_labels(code,TID,MSLP,atctrack,mstrack,convrate)
+
+#Columns of the threshold sweep output: node counts of each adjusted label, then counts of tracks with each Track_Info tag (tracks with EXT/TT nodes for EXT/TT).
+SWEEP_COLUMNS=list(SHORT_LABELS)+['Track_'+tag for tag in TRACK_FLAGS]
+
+#The sweep_counts function below counts the nodes of each adjusted label code and the tracks with each Track_Info tag of a window (see SWEEP_COLUMNS).
+def sweep_counts(TID,code,track_info):
+    tags=[len(np.unique(TID[(track_info&flag)>0])) for flag in TRACK_FLAGS.values()]
+    return np.append(np.bincount(code,minlength=len(SHORT_LABELS)),tags)
+
 #---------------Main Program Starts----------------#
 if __name__ == '__main__':
     #-------------User inputs and tips---------------#
@@ -197,442 +1445,338 @@ if __name__ == '__main__':
     convrate=3/int(timeres)
     range_dist=4.0/convrate #The range distance set in StitchNodes. Automatically adjusted by the time interval.
     
+    if ConnectivityFile is not None:
+        connectivity=read_connectivity(ConnectivityFile)
+        if grid_res is None:
+            grid_res=float(np.mean(connectivity[2]))*(180/np.pi)**2
+            print("The grid resolution from the mean cell area of the connectivity file:",round(grid_res,4),"deg^2")
     if grid_res<=0.25*0.25:
         grid_res=0.25*0.25
     elif grid_res>1.5*1.5:
         grid_res=1.5*1.5
         print("\nWarning: The grid resolution you entered is too coarse for tropical cyclone (TC) classification. The program will use 1.5 deg^2 as the lowest grid resolution for TC classification instead.\n")
+    defaults=THRESHOLDS
+    if data250=='Y' or data250=='y':
+        defaults=THRESHOLDS_250
+    #In a threshold sweep (SweepFile), every threshold set is classified along with the default run, reusing its LPSAREA, QS track information and track kinematics.
+    sweepnames,sweepsets=read_sweep(SweepFile,defaults) if SweepFile is not None else ([],[])
+    sweepqs=[np.array([],dtype=int) for P in sweepsets];sweepcounts=[]
+    if len(sweepsets)>0:
+        print(str(len(sweepsets))+" threshold sets in the threshold sweep")
+    total=open_report(ReportFile,'SyCLoPS_Classifier',ProfileStages,model_data_name=model_data_name,modenum=modenum,timeres=timeres,data250=data250,isregion=isregion,
+                      grid_res=grid_res,nprocess=nprocess,TimeWindow=TimeWindow,AppendMode=AppendMode,sweep_sets=len(sweepsets))
 
-    #---------------Data Preparation----------------#
-    print("\nData preparation and preprocessing starts...") ;startt=time.time()
-    # Conversion of the output TE csv file into the required format for classification
-    dfin = pd.read_csv(TETrackFile,na_values=' nan')
-    dfin.columns = dfin.columns.str.strip()
-    #Combine four time columns to form the ISOTIME column
-    if 'ISOTIME' not in dfin.columns:
+    if LowMemory:
+        #Arrow buffers are allocated from the C heap instead of the mimalloc/jemalloc pool, which keeps freed pages, so release_memory returns them to the system.
+        #Arrays above 128 KB are always memory-mapped by glibc (whose threshold otherwise grows as they are freed), so freed arrays do not leave holes in the heap.
+        pa.set_memory_pool(pa.system_memory_pool())
         try:
-            dfin.insert(5, 'ISOTIME', pd.to_datetime(dict(year=dfin.year, month=dfin.month, day=dfin.day,hour=dfin.hour)))
-        except: # In case of using cftime for 360_day calendar
-            dfin['ISOTIME'] = [cftime.Datetime360Day(y, m, d, h) for y, m, d, h in zip(dfin['year'], dfin['month'], dfin['day'], dfin['hour'])]
-            dfin['ISOTIME'] = dfin['ISOTIME'].astype(str)
-        dfin=dfin.drop(columns=['year','month','day','hour'])
-    
-    dfin=dfin.rename(columns={"lon": "LON", "lat": "LAT","track_id":"TID"})
-    # if 2<=modenum<=3:
-    #     dfin.to_parquet(InputFileName) #Save the final form of the input catalog
+            ctypes.CDLL(None).mallopt(-3,1<<17) #M_MMAP_THRESHOLD
+        except (OSError,AttributeError):
+            pass
+
+    #---------------Data Preparation----------------#
     #Open and read the constant surface geopotential variable of a climate dataset
     dszs=xr.open_dataset(ZSFile).ZS
-    lonz=dszs.longitude.to_numpy()%360*(np.pi/180)
-    latz=dszs.latitude.to_numpy()*(np.pi/180)
+    if ConnectivityFile is None:
+        lonzdeg=dszs.longitude.to_numpy();latzdeg=dszs.latitude.to_numpy()
+    else:
+        #On an unstructured grid, the cell coordinates are read from the connectivity file, and the ZS values are in the same cell order.
+        lonzdeg,latzdeg=connectivity[:2]
+        if dszs.size!=len(lonzdeg):
+            raise ValueError("ZSFile has "+str(dszs.size)+" values but the connectivity file has "+str(len(lonzdeg))+" cells")
+    lonz=lonzdeg%360*(np.pi/180)
+    latz=latzdeg*(np.pi/180)
     dszsnf=dszs.to_numpy().flatten()
     if np.max(dszsnf)<1e4:
         dszsnf=dszsnf*9.8
+    #Arrays read by the pool workers are memory-mapped from a RAM-backed directory, and one worker pool is started when first needed (see worker_pool).
+    #With DaskScheduler, these sections run as tasks on the dask cluster instead (see dask_client).
+    shmdir=shared_dir();pool=None;client=None;zsdata=None
+    dszsnf=attach_arrays(share_arrays(shmdir,dszsnf=dszsnf))['dszsnf']
     
-    #Identify the start and end index of each track
-    FST = np.unique(dfin.TID.values, return_index=1)[1]
-    LST=len(dfin)-np.unique(dfin.TID.values[::-1], return_index=1)[1]-1
-    #Convert longitudes and latitudes in both the input LPS catalog and blob stats dataset to the spherical coordinates (X,Y,Z) for implementing KDTrees:
-    LAT=np.array(dfin.LAT);LON=np.array(dfin.LON)%360
-    X=np.cos(LON*(np.pi/180))*np.cos(LAT*(np.pi/180))
-    Y=np.sin(LON*(np.pi/180))*np.cos(LAT*(np.pi/180))
-    Z=np.sin(LAT*(np.pi/180))
-    coordinates = []
-    for i in latz:
-        for j in lonz:
-            coordinates.append((np.cos(j) * np.cos(i),np.sin(j) * np.cos(i),np.sin(i)))
-    pts = np.array(coordinates)
-    Tz = cKDTree(pts) 
-    endt=time.time()
-    print("Time lapsed (s) for the data preparation section: "+ str(endt-startt)) 
-    
-    #--------------------LPSAREA--------------------#
-    if modenum==0 or modenum==1:
-        print("\nLPSAREA computation starts...") ;startt = time.time()
-        #Perform the functions to pair size blobs to LPS nodes and compute LPSAREA
-        #To save time, multiprocessing is recommended. Single-threaded may take ~2hrs for 9.5 million blobs/7.8 million nodes.
-        #Multiprocessing may take up more physical memroy (~ 7GB with 64 threads and 9.5 million blobs/7.8 million nodes)
-        #Open and format the size blob statistics file output by TE's BlobStats
-        dfblob=pd.read_csv(SizeBlobStatFile,sep="\t", header=None)
-        dfblob=dfblob.drop(dfblob.columns[[1]], axis=1)
-        #dfblob=pd.read_csv(SizeBlobStatFile,index_col=0)
-        try:
-            dfblob.columns=["blobid","time","centlon","centlat","minlat","maxlat","minlon","maxlon","blobsize","ike"]
-        except:
-            dfblob.columns=["blobid","time","centlon","centlat","minlat","maxlat","minlon","maxlon","blobsize"]
-        dfblob['time']=pd.to_datetime(dfblob['time'])
-        #Generate a list of node and blob index of each unique timestamp for the later blob pairing process
-        temp_index0=np.arange(0,len(dfin),1);dfin['ind']=temp_index0
-        NodeTimeidx=dfin.groupby(dfin['ISOTIME'])['ind'].apply(list)
-        temp_index1=np.arange(0,len(dfblob),1);dfblob['ind']=temp_index1
-        BlobTime=pd.unique(dfblob['time'])
-        BlobTimeidx=np.array(dfblob.groupby(dfblob['time'])['ind'].apply(list))
-        LonB=np.array(dfblob.centlon)
-        LatB=np.array(dfblob.centlat)
-        Xb=np.cos(LonB*(np.pi/180))*np.cos(LatB*(np.pi/180))
-        Yb=np.sin(LonB*(np.pi/180))*np.cos(LatB*(np.pi/180))
-        Zb=np.sin(LatB*(np.pi/180))
-        dfin0=dfin[['ISOTIME','LON','LAT','MSLP']]
-        with ma.Pool(nprocess) as pool_obj:
-            nodepair_list=pool_obj.map(blobpairing,range(len(BlobTime)))
-            zsperl=pool_obj.map(zsper,range(len(dfin)))
-        #processing the output tuple list and pair LSP nodes to blobs.
-        nodepair_list=[item for sublist in nodepair_list for item in sublist]
-        dfblob['paired_node']=-1
-        blobidx=[i[0] for i in nodepair_list] 
-        nodematched=[i[1] for i in nodepair_list]
-        dfblob.loc[blobidx,'paired_node']=nodematched #Indices of paried nodes of each blob
-
-        #Calculate the raw size of each LPS nodes by the sizes of paired blobs:
-        sizecol=np.round(dfblob[dfblob['paired_node']!=-1].groupby(dfblob['paired_node'])['blobsize'].sum()*1e-6)
-        dfin['RAWAREA']=0;dfin.loc[sizecol.index.values,'RAWAREA']=sizecol.values
-        try:
-            ikecol=np.round(dfblob[dfblob['paired_node']!=-1].groupby(dfblob['paired_node'])['ike'].sum()*1e-12)
-            dfin['IKE']=0; dfin.loc[ikecol.index.values,'IKE']=ikecol.values
-        except:
-            pass
-        #Adjust the raw LPS size to the final size (LPSAREA) according to the lower-terrain ratio:
-        zsind=np.where((np.array(zsperl) >= 0.3)&(np.array(zsperl) <= 0.7))[0]
-        adjsize=dfin.RAWAREA.copy()
-        adjsize[zsind]=dfin.RAWAREA[zsind]*2
-        dfin['LPSAREA']=adjsize
-        #dfin.to_parquet(InputFileName) #Save the final form of the input catalog
-        endt = time.time()
-        print("Time lapsed (s) for the LOWAREA section: "+ str(endt-startt))
-
-    #----------------------QS-----------------------#
-    #This part is reserved for computing information required for quasi-stationary (QS) track classification.
-    #Computation in this part requires longer processing time if single-threaded (~1 hr for 380 thousands tracks).
-    if modenum==0 or modenum==2:
-        print("\nQS parameters calculation starts ...") ;startt = time.time()
-        with ma.Pool(nprocess) as pool_obj: #Calcualte the track parameters for labeling QS tracks (parallel computing)
-            distspr_list=pool_obj.map(track_spread,range(len(FST)))
-            percor_list=pool_obj.map(track_percor,range(len(FST)))
-            zmax_list=pool_obj.map(zsmax,range(len(dfin)))
-        #To form a dataframe of track information for later use in labeling QS tracks.
-        dfin['ZSMX']=zmax_list
-        zsmx_ratio=dfin.groupby('TID')['ZSMX'].apply(lambda x: len(np.where(x>150)[0])/len(x))
-        infodic={'TID':pd.unique(dfin.TID),'Track Linearity':percor_list,'Track Spread':distspr_list,'Track Inland Ratio':zsmx_ratio}
-        dfinfo=pd.DataFrame(infodic)
-        #Save QS track information to a csv file for potential future usages:
-        #dfinfo.to_csv(QStrackFileName)
-        endt=time.time()
-        print("Time lapsed (s) for the QS section: "+ str(endt-startt))
-
-    #--------------Main Classification--------------#
-    ## Main Classification program starts (the whole process takes ~20 secs to complete for ~8 million nodes)
-    print("\nSyCLoPS main classification program starts ...") ;startt=time.time()
-    dfin['mslcc_ratio']=dfin.MSLPCC20/dfin.MSLPCC55
-    
-    ## Jumpy nodes removal and false connection track splitting
-    #Pre-conditions
-    try:
-        cond_hal=((dfin.Z850!=dfin.Z850) | (abs(dfin.T850)>1e14) |(dfin.Z850-dfin.ZS<10)) & ~(dfin.MSLP<=92500) #High-altitude Condition. Z850 is not necessary for classification if data contains missing values.
-    except:
-        cond_hal=(dfin.T850!=dfin.T850) | (abs(dfin.T850)>1e14) | (dfin.T850==0)    
-    #Convert RH unit if necessary
-    rhconv=1
-    if dfin.RH850AVG[~cond_hal].max()<2:
-        print("yes")
-        rhconv=0.01
-    if data250=='Y' or data250=='y':
-        cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<13) & (dfin.T850>280) 
-    else:
-        cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<18) & (dfin.T850>280)
-    
-    ## Denoting Binary tags for Tropical_Flag and Transition_Zone:
-    cond_trans=(cond_trop) & ((dfin.RH100MAX<55*rhconv) | (dfin.DEEPSHEAR>10)) & (abs(dfin.LAT)>15)
-    trans_flag=np.zeros(len(dfin))
-    trop_flag=np.zeros(len(dfin))
-    dfin['Transition_Zone']=trans_flag
-    dfin['Tropical_Flag']=trop_flag
-    dfin.loc[cond_trans, 'Transition_Zone']=1
-    dfin.loc[cond_trop,'Tropical_Flag']=1
-
-    ## Calculate direction and distance of each node to the previous node for jumpy track filtering and later use in track classification:
-    dfin = dfin.sort_values(by=['TID', 'ISOTIME'])
-    dfin['prev_lat'] = dfin.groupby('TID')['LAT'].shift(1)
-    dfin['prev_lon'] = dfin.groupby('TID')['LON'].shift(1)
-    dfin['distance'] = haversine(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
-    dfin['direction'] = calculate_bearing(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
-
-    dfin['prev_lat'] = dfin.groupby('TID')['LAT'].shift(2)
-    dfin['prev_lon'] = dfin.groupby('TID')['LON'].shift(2)
-    dfin['distance_2steps'] = haversine(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
-
-    dist_shift1 = dfin.groupby('TID')['distance'].shift(1)
-    dir_shift1 = dfin.groupby('TID')['direction'].shift(1)
-    dist_shift_s1 = dfin.groupby('TID')['distance_2steps'].shift(-1)
-    dist_shift_n1 = dfin.groupby('TID')['distance'].shift(-1)
-    dist_shift_n2 = dfin.groupby('TID')['distance'].shift(-2)
-
-    #Apply jumpy_mask
-    jumpy_mask = (dfin['distance'] > 3 * dist_shift_s1) & (dfin['distance'] > 333)| \
-    (dist_shift_n1 > 3 * dist_shift_s1) & (dist_shift_n1 > 333)| \
-    (dfin['distance'] > 3 * dist_shift1) & ((dfin['direction'] - dir_shift1).abs() > 90) & (dfin['distance'] > 333) | \
-    ((dfin['distance'] > 3 * dist_shift1) & (dist_shift_n1 > 3 * dist_shift_n2) & (dfin['distance'] > 333))| \
-    ((dfin['distance'] > 5 * dist_shift1) & (dfin['distance'] > 5 * dist_shift_n1) & (dfin['distance'] > 333/convrate))
-    
-    dfin = dfin[~jumpy_mask].copy()
-    dfin = dfin.sort_values(by=['TID', 'ISOTIME'])
-    dfin['prev_lat'] = dfin.groupby('TID')['LAT'].shift(1)
-    dfin['prev_lon'] = dfin.groupby('TID')['LON'].shift(1)
-    dfin['distance'] = haversine(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
-    dfin = dfin.drop(columns=['prev_lat', 'prev_lon'])
-
-    #Break up tracks
-    time_shift1 = dfin.groupby('TID')['ISOTIME'].shift(1)
-    time_gap = (dfin['ISOTIME'] - time_shift1).dt.total_seconds() / 3600
-    dfin['split'] = (((dfin['distance'] > 333/convrate) & (dfin['Tropical_Flag'] == 1)) | (time_gap > max_gap_hour) | (dfin['distance'] > range_dist*111)).astype(int)
-    dfin['sub_tid'] = dfin.groupby('TID')['split'].cumsum()
-    dfin['TID'] = dfin.groupby(['TID', 'sub_tid']).ngroup()
-    dfin = dfin.drop(columns=['split', 'sub_tid'])
-    track_counts = dfin[dfin['MSLPCC55'] > 100].groupby('TID').size()
-    valid_tids = track_counts[track_counts >= round(7*convrate+0.01)].index
-    dfin = dfin[dfin['TID'].isin(valid_tids)].copy()
-    dfin['TID'] = dfin.groupby('TID').ngroup()
-    dfin=dfin.reset_index(drop=True)
-    
-    dfin.to_parquet(InputFileName) #Save the final form of the input catalog
-    
-    ## Generate arrays of placeholder labels
-    Full_Name=np.array(["Non-labeled"]*len(dfin),dtype=object)
-    short_label=np.array(["NLB"]*len(dfin),dtype=object)
-    
-    ## Conditions
-    try:
-        cond_hal=(dfin.Z850-dfin.ZS<100*zgconv) & ~(dfin.MSLP<=92500) #High-altitude Condition. Z850 is not necessary for classification if data contains missing values (typically 1e20 or 1e15) or NaN. T850 will be used.
-    except:
-        cond_hal=(dfin.T850!=dfin.T850) | (abs(dfin.T850)>1e14) | (dfin.T850==0)    
-    cond_cv=(((dfin.VO500AVG>0) & (dfin.LAT>=0.0)) | ((dfin.VO500AVG<0) & (dfin.LAT<0.0))) #Cyclonic Condition
-    cond_dry=dfin.RH850AVG<=60*rhconv #Dryness Condition
-    if data250=='Y' or data250=='y':
-        cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<13) & (dfin.T850>280) 
-        cond_trop_htc=(dfin.RH100MAX>5*rhconv) & (dfin.DEEPSHEAR<13) & (dfin.T850>280) 
-        cond_tc=(dfin.MSLP<=92500) | ((dfin.UPPTKCC<-117.6*zgconv) & (dfin.LOWTKCC<0) & (dfin.MSLPCC20>round_to_nearest5(-107*grid_res+247)))
-    else:
-        cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<18) & (dfin.T850>280) #Default Tropical Condition
-        cond_trop_htc=(dfin.RH100MAX>5*rhconv) & (dfin.DEEPSHEAR<18) & (dfin.T850>280) 
-        cond_tc=(dfin.MSLP<=92500) | ((dfin.UPPTKCC<-107.8*zgconv) & (dfin.LOWTKCC<0) & (dfin.MSLPCC20>round_to_nearest5(-85*grid_res+220))) #Default Tropical Cyclone Condition  
-    cond_td=(dfin.MSLPCC55>160) & (dfin.UPPTKCC<0)  #Tropical Depression Condition
-    cond_md=(dfin.RH850AVG>85*rhconv) & (dfin.U850DIFF>0)  #Monsoon System Condition
-    if modenum<2:
-        cond_tlc= (dfin.MIDTKCC<0) & (dfin.LOWTKCC<0) & (((dfin.LPSAREA<=5.5e5) & (dfin.MSLPCC20>190) & (dfin.LPSAREA>0)) | ((dfin.MSLPCC20>420) & (dfin.mslcc_ratio>0.5))) #TLC Condition
-    #The alternative TLC condition without using the embedded TLC criterion (See Sec. 5.3)
-    #cond_tlc= (dfin.MIDTKCC<0) & (dfin.LOWTKCC<0) & (dfin.LPSAREA<=7e5) & (dfin.MSLPCC20>145) & (dfin.LPSAREA>0)
-    WS200PMXadj=0
-    if data250=='Y' or data250=='y':
-        WS200PMXadj=5
-    if isregion=='N' or isregion=='n':  
-        cond_sc=(dfin.LOWTKCC<0)&(dfin.Z500CC>0)&(dfin.WS200PMX>30+WS200PMXadj) #SC Condition
+    Tz = zs_tree(ZSFile,lonz,latz,ConnectivityFile) #Built from the cached grid points if the ZS file is unchanged
+    #Terrain rasters of zsmax and zsper on the ZS grid (computed once and saved next to the ZS file).
+    if modenum<=2 and ConnectivityFile is None:
+        ZSMXgrid,ZSPERgrid=load_terrain_rasters(ZSFile,Tz,dszsnf.reshape(len(latz),len(lonz)),lonzdeg)
+    elif modenum<=2:
+        ZSMXgrid,ZSPERgrid=load_terrain_rasters(ZSFile,Tz,np.asarray(dszsnf),lonzdeg,ConnectivityFile,connectivity)
+    #In the time-window mode (TimeWindow), the StitchNodes (and BlobStats) files are first split into windows of whole tracks (see split_windows).
+    #Each window is then classified in turn (with the nodes of other windows at its times for blob pairing), and the outputs are streamed to the parquet files,
+    #so the memory use depends on the window length instead of the record length. The outputs are the same as those of a whole-catalog run.
+    windowed=TimeWindow is not None or AppendMode
+    if not windowed:
+        windows=[None]
+    elif AppendMode:
+        #In the append mode (AppendMode), the StitchNodes file is scanned for its tracks (see track_summary), and only the open and new tracks (see open_tracks)
+        #are read and classified, as one window. The catalog tracks that share nodes with them are replaced (see replaced_tracks), the other catalog tracks
+        #are copied with their TIDs, and the new tracks take TIDs after the last TID of the catalog.
+        print("\nFinding the open tracks ...") ;st=start_stage('split')
+        tracks,RHMAX,calendar=track_summary(TETrackFile)
+        ranges=catalog_ranges(InputFileName,calendar);appendtid=open_tracks(tracks,ranges,max_gap_hour)
+        windows=[{'tid':tracks['tid'][tracks['open']]}] if tracks['open'].any() else []
+        window=read_open_tracks(TETrackFile,SizeBlobStatFile if modenum<=1 else None,tracks,calendar) if len(windows)>0 else None
+        droptid=replaced_tracks(InputFileName,ranges,window[0],calendar) if len(windows)>0 else np.array([],dtype=np.int64)
+        print(str(tracks['open'].sum())+" open or new tracks to classify; "+str(len(droptid))+" catalog tracks to replace. Time lapsed (s): "+
+              str(end_stage(st,rows=len(window[0]) if len(windows)>0 else 0,tracks=int(tracks['open'].sum()))))
     else:
-        # The alternative criteria to replace WS200MAX criteria for SC condition in regional models (See SI text S4):
-        cond_sc=(dfin.LOWTKCC<0)&(dfin.Z500CC>0)&((dfin.WS200PMX>30+WS200PMXadj)|(dfin.DEEPSHEAR>12)) 
-        #OR (dfin.LOWTKCC<0)&(dfin.Z500CC>0)&((dfin.WS200PMX>30+WS200PMXadj)|((dfin.T850>273)&(dfin.DEEPSHEAR>14))) 
-    
-    ## High-altitude Branch Labeling
-    df_hatl=dfin[(cond_hal) & ((dfin.MIDTKCC<0)|(dfin.UPPTKCC<0))]; hatl_id=df_hatl.index.values #nodes that satisfy criteria of HATL. Check for missing values is added.
-    df_hal=dfin[(cond_hal) & ~((dfin.MIDTKCC<0)|(dfin.UPPTKCC<0))]; hal_id=df_hal.index.values #nodes that satisfy criteria of HAL. Check for missing values is added.
-    Full_Name[hatl_id]="High-altitude Thermal Low"; short_label[hatl_id]="HATHL"
-    Full_Name[hal_id]="High-altitude Low"; short_label[hal_id]="HAL"
-    
-    ## Dryness Branch Labeling
-    df_dsd=dfin[~(cond_hal) & (cond_dry) & ~(dfin.LOWTKCC<0)]; dsd_id=df_dsd.index.values #nodes that satisfy criteria of DSD
-    df_dothl=dfin[~(cond_hal) & (cond_dry) & (dfin.LOWTKCC<0) & (cond_cv)]; dothl_id=df_dothl.index.values #nodes that satisfy criteria of DOTHL
-    df_thl=dfin[~(cond_hal) & (cond_dry) & (dfin.LOWTKCC<0) & ~(cond_cv)]; thl_id=df_thl.index.values #nodes that satisfy criteria of THL
-    Full_Name[dsd_id]="Dry Disturbance"; short_label[dsd_id]="DSD"
-    Full_Name[dothl_id]="Deep (Orographic) Thermal Low"; short_label[dothl_id]="DOTHL"
-    Full_Name[thl_id]="Thermal Low"; short_label[thl_id]="THL"
-    
-    ## Tropical Branch Labeling
-    df_dst=dfin[~(cond_hal) & ~(cond_dry) & (cond_trop) & ~(cond_cv)]; dst_id=df_dst.index.values #nodes that satisfy criteria of DST
-    df_tc=dfin[~(cond_hal) & ~(cond_dry) & (cond_cv)  &(cond_trop) & (cond_tc)]; tc_id=df_tc.index.values #nodes that satisfy criteria of TC
-    df_tdmd=dfin[~(cond_hal) & ~(cond_dry) & (cond_cv) & (cond_trop)& ~(cond_tc) & (cond_td) & (cond_md)]
-    tdmd_id=df_tdmd.index.values #nodes that satisfy criteria of TD(MD)
-    df_tdew=dfin[~(cond_hal) & ~(cond_dry) & (cond_cv) & (cond_trop)& ~(cond_tc) & (cond_td) & ~(cond_md)]
-    tdew_id=df_tdew.index.values #nodes that satisfy criteria of TD
-    df_tloml=dfin[~(cond_hal) & ~(cond_dry) & (cond_cv) & (cond_trop) & ~(cond_tc) & ~(cond_td) & (cond_md)]
-    tloml_id=df_tloml.index.values #nodes that satisfy criteria of TLO(ML)
-    df_tloew=dfin[~(cond_hal) & ~(cond_dry) & (cond_cv) & (cond_trop) & ~(cond_tc) & ~(cond_td) & ~(cond_md)]
-    tloew_id=df_tloew.index.values #nodes that satisfy criteria of TLO
-    df_ms=dfin[~(cond_hal) & ~(cond_dry) & (cond_cv) & (cond_trop) & ~(cond_tc) & (cond_md)]
-    Full_Name[dst_id]="Tropical Disturbance"; short_label[dst_id]="DST"
-    Full_Name[tc_id]="Tropical Cyclone"; short_label[tc_id]="TC"
-    Full_Name[tdmd_id]="Tropical Depression(Monsoon Depression)"; short_label[tdmd_id]="TD(MD)"
-    Full_Name[tdew_id]="Tropical Depression"; short_label[tdew_id]="TD"
-    Full_Name[tloml_id]="Tropical Low (Monsoon Low)"; short_label[tloml_id]="TLO(ML)"
-    Full_Name[tloew_id]="Tropical Low"; short_label[tloew_id]="TLO"
-    
-    ## Extratropical Branch Labeling
-    df_dse=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & ~(cond_cv)]; dse_id=df_dse.index.values #nodes that satisfy criteria of DSE
-    Full_Name[dse_id]="Extratropical Disturbance"; short_label[dse_id]="DSE"
+        print("\nSplitting the catalog into time windows ...") ;st=start_stage('split')
+        tmpdir=tempfile.mkdtemp(dir=os.path.dirname(InputFileName) or '.')
+        windows,blobs,dtypes,RHMAX,calendar=split_windows(TETrackFile,SizeBlobStatFile if modenum<=1 else None,TimeWindow or 10**9,tmpdir)
+        print(str(len(windows))+" time windows. Time lapsed (s) for splitting the catalog: "+ str(end_stage(st,rows=sum(len(w['tid']) for w in windows),windows=len(windows))))
+    writers={};pending=[];qstrack=np.array([],dtype=int);tid_offset=0
+    nhalo=(round(8*convrate+1)+1)**2 #Nodes after a window that the label smoothing of its last tracks may look at
+    InputOut=InputFileName;ClassifiedOut=ClassifiedOutFile
+    #The dataset (ClassifiedDatasetDir) is written to a new directory that replaces the old dataset at the end of the run.
+    DatasetOut=ClassifiedDatasetDir+'.new' if ClassifiedDatasetDir is not None else None
+    if DatasetOut is not None:
+        shutil.rmtree(DatasetOut,ignore_errors=True)
+    #In the append mode, the catalog rows of the other tracks are copied first (the row groups without replaced tracks as they are, see copy_parquet and copy_dataset).
+    if AppendMode:
+        tid_offset=appendtid
+        InputOut=InputFileName+'.append';ClassifiedOut=ClassifiedOutFile+'.append'
+        copy_parquet(writers,InputOut,InputFileName,droptid);copy_parquet(writers,ClassifiedOut,ClassifiedOutFile,droptid)
+        if DatasetOut is not None:
+            copy_dataset(writers,DatasetOut,ClassifiedDatasetDir,ClassifiedOutFile,droptid,tracks['tstart'][tracks['open']].min() if len(windows)>0 else np.inf,calendar)
+    for k in range(len(windows)):
+        print("\nData preparation and preprocessing starts...") ;st=start_stage('prep',window=k)
+        # Conversion of the output TE csv file into the required format for classification
+        if not windowed:
+            #dfin = pd.read_csv(TETrackFile,na_values=' nan')
+            #dfin.columns = dfin.columns.str.strip()
+            dfin,calendar=read_tracks(TETrackFile) #Typed Arrow CSV reader with a parquet cache (see read_tracks)
+            rows=np.arange(0,len(dfin),1);dfhalo=None
+        elif AppendMode:
+            dfin,rows,dfhalo,dfblob=window;window=None
+            print("Open and new tracks: "+str(len(dfin))+" nodes")
+        else:
+            dfin,rows,dfhalo,dfblob=read_window(windows,blobs,dtypes,calendar,k)
+            print("Time window "+str(k+1)+" of "+str(len(windows))+": "+str(len(dfin))+" nodes")
+        #Combine four time columns to form the ISOTIME column
+        #(All time grouping and time joins below use the integer hours of the HOURS column, see track_hours.)
+        if 'HOURS' not in dfin.columns:
+            dfin=add_isotime(dfin,calendar)
     
-    if modenum==2 or modenum==3:
-        df_sc=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & (cond_sc)]; sc_id=df_sc.index.values #nodes that satisfy criteria of SC
-        df_ex=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & ~(cond_sc)]; ex_id=df_ex.index.values #nodes that satisfy criteria of EX
-        Full_Name[sc_id]="Subtropical Cyclone"; short_label[sc_id]="SC"
-        Full_Name[ex_id]="Extratropical Cyclone"; short_label[ex_id]="EX"
-    else:
-        df_tlc=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & (cond_tlc)] #nodes that satisfy TLC Condition
-        if (isregion=='Y' or isregion=='y'): 
-        # The alternative criteria to replace WS200MAX criteria for TLC condition in regional models (See SI text S4):
-            df_stlc=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & ((dfin.WS200PMX>=25+WS200PMXadj)|(dfin.DEEPSHEAR>11)) & (cond_tlc)] 
-            # OR df_stlc=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & ((dfin.WS200PMX>=25+WS200PMXadj)|((dfin.DEEPSHEAR>11)&(dfin.T850>273))) & (cond_tlc)] 
-            df_pl=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv)  & ((dfin.WS200PMX<25+WS200PMXadj)|(dfin.DEEPSHEAR<=11)) & (cond_tlc)] 
-            # OR df_stlc=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & ((dfin.WS200PMX<25+WS200PMXadj)|((dfin.DEEPSHEAR<=11)&(dfin.T850<=273))) & (cond_tlc)] 
-        else: #The default condition
-            df_stlc=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & (dfin.WS200PMX>=25+WS200PMXadj) & (cond_tlc)]
-            df_pl=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv)  & (dfin.WS200PMX<25+WS200PMXadj) & (cond_tlc)]
-        stlc_id=df_stlc.index.values #nodes that satisfy criteria of STLC
-        pl_id=df_pl.index.values #nodes that satisfy criteria of PL
-        df_sc=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & ~(cond_tlc) & (cond_sc)]
-        sc_id=df_sc.index.values #nodes that satisfy criteria of SC
-        df_ex=dfin[~(cond_hal) & ~(cond_dry) & ~(cond_trop) & (cond_cv) & ~(cond_tlc) & ~(cond_sc)]
-        ex_id=df_ex.index.values #nodes that satisfy criteria of EX
-        Full_Name[stlc_id]="Subtropical Tropical-like Cyclone (Subtropical Storm)"; short_label[stlc_id]="SS(STLC)"
-        Full_Name[pl_id]="Polar Low (Polar Tropical-like Cyclone)"; short_label[pl_id]="PL(PTLC)"
-        Full_Name[sc_id]="Subtropical Cyclone"; short_label[sc_id]="SC"
-        Full_Name[ex_id]="Extratropical Cyclone"; short_label[ex_id]="EX"
+        dfin=dfin.rename(columns={"lon": "LON", "lat": "LAT","track_id":"TID"})
+        # if 2<=modenum<=3:
+        #     dfin.to_parquet(InputFileName) #Save the final form of the input catalog
+        #Identify the start and end index of each track
+        FST = np.unique(dfin.TID.values, return_index=1)[1]
+        LST=len(dfin)-np.unique(dfin.TID.values[::-1], return_index=1)[1]-1
+        #Convert longitudes and latitudes in both the input LPS catalog and blob stats dataset to the spherical coordinates (X,Y,Z) for implementing KDTrees:
+        LAT=np.array(dfin.LAT);LON=np.array(dfin.LON)%360
+        X=np.cos(LON*(np.pi/180))*np.cos(LAT*(np.pi/180))
+        Y=np.sin(LON*(np.pi/180))*np.cos(LAT*(np.pi/180))
+        Z=np.sin(LAT*(np.pi/180))
+        if LowMemory: #One array of the coordinates for blob pairing, with X, Y and Z as its columns
+            NodeXYZ=np.column_stack((X,Y,Z));X,Y,Z=NodeXYZ.T
+        #Nodes look up their zsmax and zsper values on the terrain rasters by grid index:
+        #(On an unstructured grid, each node takes the values of its nearest cell.)
+        ZSidx=zsgrid_index(LON,LAT,lonzdeg,latzdeg) if ConnectivityFile is None else Tz.query(np.column_stack((X,Y,Z)))[1]
+        print("Time lapsed (s) for the data preparation section: "+ str(end_stage(st,rows=len(dfin))))
     
-    #Hybrid TC labeling
-    df_htc=dfin[~(cond_hal) & ~(cond_dry) & (cond_cv)  & (cond_trop_htc) & ~(cond_trop) & (cond_tc)]; htc_id=df_htc.index.values #nodes that satisfy criteria of HTC
-    df_adj_tc = dfin[~(cond_hal) & ~(cond_dry) & (cond_cv)  & (cond_trop_htc) & (cond_tc)]
-    Full_Name[htc_id]="Hybrid Tropical Cyclone"; short_label[htc_id]="HTC"
-    # If a HTC formed, it is deemed as a tropical system in the transition zone.
-    dfin.loc[cond_trop_htc & cond_tc, 'Transition_Zone']=1
-    dfin.loc[cond_trop_htc & cond_tc,'Tropical_Flag']=1
+        #--------------------LPSAREA--------------------#
+        if modenum==0 or modenum==1:
+            print("\nLPSAREA computation starts...") ;st=start_stage('lpsarea',window=k)
+            dfin['ind']=rows #Row index of each node in the StitchNodes file
+            #The results are saved as a checkpoint in CheckpointDir, keyed by the input files, the terrain and blob pairing settings (see terrain_key),
+            #the calendar, the column types (the pairing compares MSLP, see LowMemory) and the StitchNodes rows of the nodes (see stage_key).
+            key=stage_key('lpsarea',file_key(TETrackFile),file_key(SizeBlobStatFile),file_key(ZSFile),terrain_key(),BLOB_RADIUS,calendar,LowMemory,rows)
+            ckpt=load_checkpoint(key,'nodes')
+            if ckpt is not None:
+                for c in ckpt[0].columns:
+                    dfin[c]=ckpt[0][c].to_numpy()
+                print("LPSAREA is loaded from the checkpoint "+key)
+            else:
+                #Perform the functions to pair size blobs to LPS nodes and compute LPSAREA
+                #Blob pairing is done in bulk and the lower-terrain ratio (zsper) is read from the terrain raster, so this section takes seconds.
+                #Multiprocessing is only used for nodes that do not sit on the ZS grid (it may take up more physical memroy, ~ 7GB with 64 threads and 7.8 million nodes).
+                #Open and format the size blob statistics file output by TE's BlobStats
+                #(In the time-window mode, the blobs at the node times of the window are read with the window.)
+                if not windowed and LowMemory:
+                    #In the low-memory mode, the blobs are paired in chunks read from the BlobStats cache (see paired_blob_sums).
+                    sizesum,ikesum,nblob=paired_blob_sums(dfin,NodeXYZ,SizeBlobStatFile,calendar)
+                else:
+                    if not windowed:
+                        dfblob=read_blobstats(SizeBlobStatFile,calendar) #Typed Arrow reader with a parquet cache (see SyCLoPS_io.py)
+                        #dfblob=pd.read_csv(SizeBlobStatFile,index_col=0)
+                    LonB=np.array(dfblob.centlon)
+                    LatB=np.array(dfblob.centlat)
+                    Xb=np.cos(LonB*(np.pi/180))*np.cos(LatB*(np.pi/180))
+                    Yb=np.sin(LonB*(np.pi/180))*np.cos(LatB*(np.pi/180))
+                    Zb=np.sin(LatB*(np.pi/180))
+                    dfin0=dfin[['HOURS','LON','LAT','MSLP','ind']]
+                    #Pair blobs with LPS nodes in bulk:
+                    if dfhalo is None:
+                        dfblob['paired_node']=(blobpairing_batch if DaskScheduler is None else blobpairing_dask)(dfin0,dfblob,np.column_stack((X,Y,Z)),np.column_stack((Xb,Yb,Zb))) #Indices of paried nodes of each blob
+                    else:
+                        #The halo nodes of other windows compete for the blobs too, in the row order of the StitchNodes file as in a whole-catalog run.
+                        #Blobs paired with halo nodes are left unpaired here (they are counted in the windows of their nodes).
+                        dfin0=pd.concat([dfin0,dfhalo],ignore_index=True)
+                        order=np.argsort(dfin0.ind.to_numpy(),kind='stable');dfin0=dfin0.iloc[order].reset_index(drop=True)
+                        LON0=dfin0.LON.to_numpy()%360;LAT0=dfin0.LAT.to_numpy()
+                        NodeXYZ=np.column_stack((np.cos(LON0*(np.pi/180))*np.cos(LAT0*(np.pi/180)),np.sin(LON0*(np.pi/180))*np.cos(LAT0*(np.pi/180)),np.sin(LAT0*(np.pi/180))))
+                        corenode=np.append(np.where(order<len(dfin),order,-1),-1) #Window node index of each sorted node (-1 for halo nodes and unpaired blobs)
+                        dfblob['paired_node']=corenode[(blobpairing_batch if DaskScheduler is None else blobpairing_dask)(dfin0,dfblob,NodeXYZ,np.column_stack((Xb,Yb,Zb)))]
+                    sizesum,ikesum=blob_sums(dfblob,dfblob['paired_node'].to_numpy());nblob=len(dfblob)
+                zsperl=terrain_lookup(ZSPERgrid,'zsper')
+
+                #Calculate the raw size of each LPS nodes by the sizes of paired blobs:
+                sizecol=np.round(sizesum*1e-6)
+                dfin['RAWAREA']=0;dfin.loc[sizecol.index.values,'RAWAREA']=sizecol.values
+                if ikesum is not None:
+                    ikecol=np.round(ikesum*1e-12)
+                    dfin['IKE']=0; dfin.loc[ikecol.index.values,'IKE']=ikecol.values
+                #Adjust the raw LPS size to the final size (LPSAREA) according to the lower-terrain ratio:
+                zsind=np.where((np.array(zsperl) >= 0.3)&(np.array(zsperl) <= 0.7))[0]
+                adjsize=dfin.RAWAREA.copy()
+                adjsize[zsind]=dfin.RAWAREA[zsind]*2
+                dfin['LPSAREA']=adjsize
+                #dfin.to_parquet(InputFileName) #Save the final form of the input catalog
+                save_checkpoint(key,nodes=dfin[[c for c in ['RAWAREA','IKE','LPSAREA'] if c in dfin.columns]])
+            st['workers']=n_workers()
+            print("Time lapsed (s) for the LOWAREA section: "+ str(end_stage(st,rows=len(dfin),blobs=nblob if ckpt is None else 0,checkpoint=ckpt is not None)))
+            if LowMemory: #Release the blobs and the temporary arrays of the section, and keep the areas in float32
+                dfblob=dfin0=LonB=LatB=Xb=Yb=Zb=zsperl=zsind=adjsize=sizesum=ikesum=sizecol=ikecol=NodeXYZ=None
+                for c in ['RAWAREA','IKE','LPSAREA']:
+                    if c in dfin.columns:
+                        dfin[c]=dfin[c].astype(np.float32)
+                release_memory()
+
+        #----------------------QS-----------------------#
+        #This part is reserved for computing information required for quasi-stationary (QS) track classification.
+        #The track parameters of all tracks are computed in one pass with segment reductions (track_stats), which takes seconds for 380 thousands tracks.
+        if modenum==0 or modenum==2:
+            print("\nQS parameters calculation starts ...") ;st=start_stage('qs',window=k)
+            key=stage_key('qs',file_key(TETrackFile),file_key(ZSFile),terrain_key(),rows) #Checkpoint of the QS section (see the LPSAREA section)
+            ckpt=load_checkpoint(key,'nodes','tracks')
+            if ckpt is not None:
+                dfin['ZSMX']=ckpt[0].ZSMX.to_numpy();dfinfo=ckpt[1]
+                print("QS parameters are loaded from the checkpoint "+key)
+            else:
+                zmax_list=terrain_lookup(ZSMXgrid,'zsmax')
+                dfin['ZSMX']=zmax_list
+                percor_list,distspr_list,zsmx_ratio=(track_stats if DaskScheduler is None else track_stats_dask)(FST,LST,LON,LAT,X,Y,Z,dfin.ZSMX.to_numpy())
+                #To form a dataframe of track information for later use in labeling QS tracks.
+                infodic={'TID':dfin.TID.values[FST],'Track Linearity':percor_list,'Track Spread':distspr_list,'Track Inland Ratio':zsmx_ratio}
+                dfinfo=pd.DataFrame(infodic)
+                #Save QS track information to a csv file for potential future usages:
+                #dfinfo.to_csv(QStrackFileName)
+                save_checkpoint(key,nodes=dfin[['ZSMX']],tracks=dfinfo)
+            st['workers']=n_workers()
+            print("Time lapsed (s) for the QS section: "+ str(end_stage(st,rows=len(dfin),tracks=len(dfinfo),checkpoint=ckpt is not None)))
+        if LowMemory: #The node coordinates and grid indices are not used after the QS section
+            X=Y=Z=NodeXYZ=LON=LAT=ZSidx=zmax_list=percor_list=distspr_list=zsmx_ratio=None;release_memory()
+
+        #--------------Main Classification--------------#
+        ## Main Classification program starts (the whole process takes ~20 secs to complete for ~8 million nodes)
+        print("\nSyCLoPS main classification program starts ...") ;startt=time.time()
+        st=start_stage('kinematics',window=k)
+        if modenum<2 or not LowMemory: #(Only the TLC Condition uses the ratio: the low-memory mode leaves it out of the catalogs of modes 2 and 3)
+            dfin['mslcc_ratio']=dfin.MSLPCC20/dfin.MSLPCC55
     
-    #Assign all the labels to the columns:
-    dfin['Short_Label']=short_label
-    dfin['Full_Name']=Full_Name
+        ## Jumpy nodes removal and false connection track splitting
+        #Pre-conditions
+        cond_hal=hal_precondition(dfin) #High-altitude Condition
+        #Convert RH unit if necessary (checked over the whole catalog in the time-window mode)
+        rhconv=1
+        if (dfin.RH850AVG[~cond_hal].max() if not windowed else RHMAX)<2:
+            print("yes")
+            rhconv=0.01
+        if data250=='Y' or data250=='y':
+            cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<13) & (dfin.T850>280) 
+        else:
+            cond_trop=(dfin.RH100MAX>20*rhconv) & (dfin.DEEPSHEAR<18) & (dfin.T850>280)
     
-    ## Step TWO: Track labeling
-    if data250=='Y' or data250=='y':
-        tctrack=pd.unique(df_tc.TID)[df_tc.groupby('TID')['LON'].count()>=round(6*convrate)]
-        atctrack=pd.unique(df_adj_tc.TID)[df_adj_tc.groupby('TID')['LON'].count()>=round(6*convrate)]
-    else:
-        tctrack=pd.unique(df_tc.TID)[df_tc.groupby('TID')['LON'].count()>=round(8*convrate)]
-        atctrack=pd.unique(df_adj_tc.TID)[df_adj_tc.groupby('TID')['LON'].count()>=round(8*convrate)]
-    htctrack=np.setdiff1d(atctrack,tctrack) #HTC tracks that are not labeled as TC tracks
-    mstrack=pd.unique(df_ms.TID)[df_ms.groupby('TID')['LON'].count()>=round(10*convrate)]
-    tctrack_id=dfin[dfin.TID.isin(tctrack)].index.values #TC Track   
-    htctrack_id=dfin[dfin.TID.isin(htctrack)].index.values #HTC Track
-    mstrack_id=dfin[dfin.TID.isin(mstrack)].index.values #MS Track
-    # TLC tracks
-    if modenum<=1: 
-        tlctrack=pd.unique(df_tlc.TID)[df_tlc.groupby('TID')['LON'].count()>=round(2*convrate)]
-        #STLC Track
-        stlctrack=np.intersect1d(tlctrack,pd.unique(df_stlc.TID))
-        stlctrack_id=dfin[dfin.TID.isin(stlctrack)].index.values
-        #PL Track
-        pltrack=np.intersect1d(tlctrack,pd.unique(df_pl.TID))
-        pltrack_id=dfin[dfin.TID.isin(pltrack)].index.values
-    # QS Track
-    if modenum==0 or modenum==2:
-        qstrack=pd.unique(dfinfo[(dfinfo["Track Linearity"]<0.55)&(dfinfo["Track Spread"]<3)&(dfinfo["Track Inland Ratio"]>0.65)].TID)
-        qstrack_id=dfin[dfin.TID.isin(qstrack)].index.values
+        ## Denoting Binary tags for Tropical_Flag and Transition_Zone:
+        cond_trans=(cond_trop) & ((dfin.RH100MAX<55*rhconv) | (dfin.DEEPSHEAR>10)) & (abs(dfin.LAT)>15)
+        trans_flag=np.zeros(len(dfin),dtype=np.float32 if LowMemory else float)
+        trop_flag=np.zeros(len(dfin),dtype=np.float32 if LowMemory else float)
+        dfin['Transition_Zone']=trans_flag
+        dfin['Tropical_Flag']=trop_flag
+        dfin.loc[cond_trans, 'Transition_Zone']=1
+        dfin.loc[cond_trop,'Tropical_Flag']=1
+
+        ## Calculate direction and distance of each node to the previous node for jumpy track filtering and later use in track classification,
+        ## remove jumpy nodes and break up false connection tracks (see track_kinematics):
+        ## (In the low-memory mode, the tracks are processed in chunks of whole tracks.)
+        rows,newtid,distance,direction,distance_2steps=track_kinematics_chunks(dfin.TID.values,dfin.HOURS.values,dfin.LAT.values,dfin.LON.values,dfin.MSLPCC55.values,
+                                                                               dfin.Tropical_Flag.values,convrate,range_dist,max_gap_hour,LOWMEM_ROWS if LowMemory else None)
+        dfin=take_rows(dfin,rows) #The kept nodes in track order
+        if LowMemory:
+            cond_hal=cond_trop=cond_trans=trans_flag=trop_flag=None;newtid=newtid.astype(np.int32);release_memory()
+        oldtid=dfin.TID.to_numpy() if QSTrackMapping else None
+        dfin['TID']=newtid+tid_offset;tid_offset+=len(np.unique(newtid))
+        if QSTrackMapping and (modenum==0 or modenum==2):
+            #The QS parameters are of the StitchNodes tracks (track_id): each output track takes those of the track it was split from.
+            pairs=pd.DataFrame({'old':oldtid,'TID':dfin.TID.to_numpy()}).drop_duplicates()
+            dfinfo=dfinfo.rename(columns={'TID':'old'}).merge(pairs,on='old').drop(columns='old')
+        oldtid=None
+        if LowMemory:
+            distance,direction,distance_2steps=(a.astype(np.float32) for a in (distance,direction,distance_2steps))
+        dfin['distance']=distance;dfin['direction']=direction;dfin['distance_2steps']=distance_2steps
     
-    ## Identifying extratropical transition (EXT) and tropical transition (TT) Nodes
-    dftc=dfin[dfin.TID.isin(atctrack)]
-    dfhtc=dfin[dfin.TID.isin(htctrack)]
-    #EXT nodes
-    extflag_list = []
+        write_parquet(writers,InputOut,dfin.drop(columns='HOURS')) #Save the final form of the input catalog
+        end_stage(st,rows=len(rows))
     
-    for i in atctrack:
-        df0=dftc[dftc.TID==i]
-        lst_tc=df0[df0.Short_Label.str.contains('TC')].index[-1]
-        dfe=df0.loc[lst_tc+1:lst_tc+round(6*convrate)]
-        dfe=dfe[(dfe.Tropical_Flag==0) & ~(dfe.Short_Label.str.contains('DS'))]
-        if not dfe.empty:
-            if df0.loc[lst_tc-2*convrate,'Tropical_Flag']==1:
-                extflag_list.append(dfe.index[0])
-            
-    # HTC EXT nodes
-    for i in htctrack:
-        df0=dfhtc[dfhtc.TID==i]
-        lst_htc=df0[df0.Short_Label.str.contains('HTC|TC')].index[-1]
-        dfe=df0.loc[lst_htc+1:lst_htc+round(6*convrate)]
-        dfe=dfe[(dfe.Tropical_Flag==0) & ~(dfe.Short_Label.str.contains('DS'))]
-        if not dfe.empty:
-            if df0.loc[lst_htc-2*convrate,'Tropical_Flag']==1:
-                extflag_list.append(dfe.index[0])
-            
-    extflag=np.array(extflag_list)
-    #TT nodes
-    ttflag=np.zeros(len(atctrack)).astype(int)-1
-    for c, i in enumerate(atctrack):
-        df0=dftc[dftc.TID==i]
-        fst_tc=df0[(df0.Short_Label.str.contains('TC|HTC'))].index[0]
-        dftc_pre=df0.loc[:fst_tc-1]
-        if np.any(dftc_pre.Tropical_Flag==0):
-            ttflag[c]=fst_tc
-    ttflag= np.delete(ttflag, np.argwhere(ttflag==-1))
+        st=start_stage('labeling',window=k)
+        ## Conditions (see node_conditions) and node labeling with the rule table (LABEL_RULES), one int8 label code per node (LABEL_TABLE gives the label names)
+        conds=node_conditions(dfin,defaults)
+        label_code,bits,names=classify_nodes(conds)
+        dfin['Label_Code']=label_code
+        trop_flag=dfin.Tropical_Flag.values.copy()
+        # If a HTC formed, it is deemed as a tropical system in the transition zone.
+        dfin.loc[conds['trop_htc'] & conds['tc'], 'Transition_Zone']=1
+        dfin.loc[conds['trop_htc'] & conds['tc'],'Tropical_Flag']=1
+        end_stage(st,rows=len(dfin))
     
-    ## Writing information for Track_Info
-    track_label=np.array(["Track"]*len(dfin),dtype=object)
-    track_label[tctrack_id]=track_label[tctrack_id]+'_TC'
-    track_label[htctrack_id]=track_label[htctrack_id]+'_HT'
-    track_label[mstrack_id]=track_label[mstrack_id]+'_MS'
-    if modenum<=1: 
-        track_label[stlctrack_id]=track_label[stlctrack_id]+'_SS(STLC)'
-        track_label[pltrack_id]=track_label[pltrack_id]+'_PL(PTLC)'
-    track_label[extflag]=track_label[extflag]+'_EXT'
-    track_label[ttflag]=track_label[ttflag]+'_TT'
-    if modenum==0 or modenum==2:
-        track_label[qstrack_id]=track_label[qstrack_id]+'_QS'
-    dfin['Track_Info']=track_label
-    # Adjusting (smoothing) Labels for TDs in stable TC periods.
-    labels0=dfin.Short_Label.values
-    labels=dfin.Short_Label.values.copy()
-    fi=dftc.groupby('TID').head(1).index
-    li=dftc.groupby('TID').tail(1).index
-    for j in range(1,round(8*convrate+1)):
-        for k in range(len(fi)):
-            for i in range(fi[k]+j, li[k]-j+1):
-                if (
-                    all('TD' in label for label in labels0[i:i+j]) and 
-                    all('TC' in label for label in labels0[i-j:i]) and 
-                    all('TC' in label for label in labels0[i+j:i+2*j])
-                ):
-                    mslp_values= dftc.MSLP.loc[i-1:i+j].values
-                    mslp_start = mslp_values[0]
-                    mslp_end = mslp_values[-1]
-                    mslp_int = np.linspace(mslp_start, mslp_end, j+2)
-                    if abs(mslp_values-mslp_int).max() <= 500:
-                        labels[i:i+j] = 'TC'
-    dfin['Adjusted_Label'] = labels
-    #dfc_tc = dfin[(dfin['Track_Info'].str.contains('TC')) & (dfin.Adjusted_Label=='TC')].reset_index(drop=True)
-    dfms = dfin[dfin.TID.isin(mstrack)] #Select MS tracks
-    labels = dfin.Adjusted_Label.values.copy()
-    fi=dfms.groupby('TID').head(1).index
-    li=dfms.groupby('TID').tail(1).index
-    for j in range(1,round(8*convrate+1)):
-        for k in range(len(fi)):
-            for i in range(fi[k]+j, li[k]-j+1):
-                if (
-                    all((label == 'TD' or label == 'TLO') for label in labels[i:i+j]) and
-                    all('M' in label for label in labels[i-j:i]) and
-                    all('M' in label for label in labels[i+j:i+2*j])
-                ):
-                    mslp_values= dfms.MSLP.loc[i-1:i+j].values
-                    mslp_start = mslp_values[0]
-                    mslp_end = mslp_values[-1]
-                    mslp_int = np.linspace(mslp_start, mslp_end, j+2)
-                    if abs(mslp_values-mslp_int).max() <= 500:
-                        for idx in range(i, i+j):
-                            if labels[idx] == 'TD':
-                                labels[idx] = 'TD(MD)'
-                            elif labels[idx] == 'TLO':
-                                labels[idx] = 'TLO(ML)'                     
-    dfin['Adjusted_Label'] = labels
-
-    ## Output the LPS classified catalog
-    desired_columns = ['TID', 'LON', 'LAT', 'ISOTIME', 'MSLP', 'WS', 'WS925', 'ZS', 'Short_Label', 'Adjusted_Label', 'Tropical_Flag', 'Transition_Zone', 'Track_Info', 'LPSAREA', 'IKE', 'i', 'j', 'distance', 'direction']
-    available_columns = [col for col in desired_columns if col in dfin.columns]
-    dfout = dfin[available_columns]
-    dfout.to_parquet(ClassifiedOutFile)
-    ## Optionally, you can save it as a csv file:
-    #dfout.to_csv(ClassifiedOutFile_CSV)
-    endt=time.time();print("Time lapsed (s) for the main classification section: "+ str(endt-startt))
+        ## Step TWO: Track labeling (see track_labels)
+        st=start_stage('track_labeling',window=k)
+        TID=dfin.TID.values
+        track_info,atctrack,mstrack,qs=track_labels(TID,label_code,bits,names,dfin.Tropical_Flag.values,defaults,dfinfo if modenum%2==0 else None)
+        qstrack=np.append(qstrack,qs)
+        dfin['Track_Info']=track_info
+        end_stage(st,rows=len(dfin),tracks=len(np.unique(TID)))
+        ## Threshold sweep: the other threshold sets are evaluated on the same conditions and track information, changing only the TC and TLC conditions and the QS tracks.
+        sweep=[];st=start_stage('sweep',window=k)
+        for v,P in enumerate(sweepsets):
+            c=node_conditions(dfin,P,conds)
+            code_v,bits_v,names_v=classify_nodes(c)
+            info_v,atc_v,ms_v,qs_v=track_labels(TID,code_v,bits_v,names_v,np.where(c['trop_htc']&c['tc'],1,trop_flag),P,dfinfo if modenum%2==0 else None)
+            sweepqs[v]=np.append(sweepqs[v],qs_v)
+            sweep.append({'code':code_v,'track_info':info_v,'atctrack':atc_v,'mstrack':ms_v})
+        if len(sweepsets)>0:
+            end_stage(st,rows=len(dfin)*len(sweepsets),sets=len(sweepsets))
+        if LowMemory: #The node conditions and the columns that are not in the classified catalog are not used after the threshold sweep
+            conds=bits=c=code_v=bits_v=trop_flag=TID=None
+            dfin.drop(columns=[c for c in dfin.columns if c not in CLASSIFIED_COLUMNS+['Label_Code']],inplace=True);release_memory()
+        # Label smoothing, QS track tagging and output, once the windows after this one are classified (see flush_windows):
+        pending.append({'window':k,'dfin':dfin,'code':label_code,'atctrack':atctrack,'mstrack':mstrack,'sweep':sweep})
+        flush_windows(pending,qstrack,np.inf if not windowed or QSTrackMapping else windows[k]['tid'][-1],nhalo,False,writers,ClassifiedOut,sweepqs,sweepcounts if SweepFile is not None else None,DatasetOut)
+        endt=time.time();print("Time lapsed (s) for the main classification section: "+ str(endt-startt))
+    flush_windows(pending,qstrack,np.inf,nhalo,True,writers,ClassifiedOut,sweepqs,sweepcounts if SweepFile is not None else None,DatasetOut)
+    close_parquet(writers)
+    if SweepFile is not None:
+        #Threshold sweep output: the thresholds and counts of each threshold set (the first row is the default run)
+        dfcount=pd.DataFrame([defaults]+sweepsets,index=pd.Index(['default']+sweepnames,name='name'))
+        dfcount[SWEEP_COLUMNS]=sum(sweepcounts) if len(sweepcounts)>0 else 0
+        dfcount.to_csv(SweepOutFile)
+        print("Threshold sweep counts are saved to "+SweepOutFile)
+    nworkers=n_workers()
+    if pool is not None:
+        pool.close();pool.join()
+    if client is not None:
+        client.close()
+    shutil.rmtree(shmdir)
+    if AppendMode:
+        os.replace(InputOut,InputFileName);os.replace(ClassifiedOut,ClassifiedOutFile)
+    if DatasetOut is not None:
+        shutil.rmtree(ClassifiedDatasetDir,ignore_errors=True)
+        os.makedirs(DatasetOut,exist_ok=True) #An empty catalog gives an empty dataset
+        os.replace(DatasetOut,ClassifiedDatasetDir)
+    if windowed and not AppendMode:
+        shutil.rmtree(tmpdir)
+    end_stage(total,workers=nworkers) #The CPU time of the pool workers is counted in the child CPU time of the whole run (not that of dask workers)
     
     # Example data
     print ("\nReference table for LPS labels in the classified catalog:\n")
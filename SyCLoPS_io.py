@@ -0,0 +1,224 @@
+## Input/output helpers shared by the SyCLoPS scripts (SyCLoPS_main.py, SyCLoPS_Classifier.py, SyCLoPS_query.py and optional/Blob_idtag.py):
+## the integer hours time axis of the model calendars, the Track_Info bit flags, the reader of TE's BlobStats output, the memory-mapped arrays shared with pool workers,
+## and the run report of per-stage performance records.
+# Please direct any questions to the author of this script: Yushan Han (yshhan@ucdavis.edu)
+
+import os
+import re
+import itertools
+import tempfile
+import time
+import json
+import socket
+import resource
+import cProfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+#Calendar names (with the cftime aliases) and the days of the months of the calendars with years of fixed length.
+CALENDARS={'standard':'standard','gregorian':'standard','proleptic_gregorian':'standard','noleap':'noleap','365_day':'noleap','all_leap':'all_leap','366_day':'all_leap','360_day':'360_day'}
+MONTH_DAYS={'noleap':[31,28,31,30,31,30,31,31,30,31,30,31],'all_leap':[31,29,31,30,31,30,31,31,30,31,30,31],'360_day':[30]*12}
+
+#Track_Info bit flags of the track tags: the on-disk format of the integer Track_Info column of the classified catalogs, read by SyCLoPS_query.py and
+#optional/Blob_idtag.py. The Track_Info of a node is the sum of the flags of its tags, in the order below when written as strings (e.g., "Track_TC_EXT").
+#Existing catalogs are decoded with these bits, so only add new flags.
+TRACK_FLAGS={'TC':1,'HT':2,'MS':4,'SS(STLC)':8,'PL(PTLC)':16,'EXT':32,'TT':64,'QS':128}
+
+#The time_fields function below returns the year, month, day and hour of raw StitchNodes rows (from the four time columns or an ISOTIME column).
+def time_fields(df):
+    if 'ISOTIME' in df.columns:
+        return tuple(pd.Series(df.ISOTIME).astype(str).str.extract(r'(-?\d+)-(\d+)-(\d+)[ T](\d+)').astype(np.int64).to_numpy().T)
+    return tuple(df[c].to_numpy(dtype=np.int64) for c in ('year','month','day','hour'))
+
+#The track_hours function below returns the integer hours since 1970-01-01 00:00 of the dates in the calendar. This time axis is used for all
+#time grouping, time gap checks and blob/node time joins, so the non-standard calendars are handled with the same integer operations as the standard one.
+def track_hours(year,month,day,hour,calendar):
+    year,month,day,hour=(np.asarray(a,dtype=np.int64) for a in (year,month,day,hour))
+    if calendar=='standard':
+        days=(((year-1970)*12+month-1).astype('M8[M]').astype('M8[D]')-np.datetime64('1970-01-01','D')).astype(np.int64)+day-1
+    else:
+        cum=np.cumsum([0]+MONTH_DAYS[calendar])
+        days=(year-1970)*cum[-1]+cum[month-1]+day-1
+    return days*24+hour
+
+#The hours_isotime function below turns the hours since 1970-01-01 back to the ISOTIME values of the catalogs: datetime64 in the standard calendar,
+#and the strings of the cftime dates (as str(cftime.Datetime360Day(y, m, d, h))) in the other calendars.
+def hours_isotime(hours,calendar):
+    hours=np.asarray(hours,dtype=np.int64)
+    if calendar=='standard':
+        return (np.datetime64('1970-01-01T00','h')+hours.astype('m8[h]')).astype('M8[us]')
+    cum=np.cumsum([0]+MONTH_DAYS[calendar])
+    days=hours//24;doy=days%cum[-1];month=np.searchsorted(cum,doy,side='right')
+    fmt=lambda a,n:pd.Series(a).astype(str).str.zfill(n)
+    return (fmt(1970+days//cum[-1],4)+'-'+fmt(month,2)+'-'+fmt(doy-cum[month-1]+1,2)+' '+fmt(hours%24,2)+':00:00').to_numpy(dtype=object)
+
+#The isotime_hours function below returns the hours since 1970-01-01 of ISOTIME values (datetime64, or strings such as the BlobStats times).
+def isotime_hours(t,calendar):
+    t=np.asarray(t)
+    if t.dtype.kind=='M':
+        return ((t-np.datetime64('1970-01-01T00','h'))//np.timedelta64(1,'h')).astype(np.int64)
+    return track_hours(*time_fields(pd.DataFrame({'ISOTIME':t})),calendar)
+
+#Column names of TE's BlobStats output after the blob id and time index columns. The optional columns (the blob area and the IKE sum)
+#follow the six location columns in the order of the BlobStats "--out" argument used by SyCLoPS_main.py.
+BLOBSTATS_COLUMNS=["time","centlon","centlat","minlat","maxlat","minlon","maxlon","blobsize","ike"]
+
+#The blobstats_batches function below parses a BlobStats text file (from the byte offset on, at a line start) in blocks with the multithreaded Arrow CSV reader
+#and yields the blob tables with the blob times converted to hours (see track_hours), in the column layout of blobstats_schema.
+def blobstats_batches(blobfile,calendar='standard',block_size=1<<26,use_threads=True,offset=0):
+    schema,names,types=blobstats_schema(blobfile)
+    if offset>=os.path.getsize(blobfile): #(no blobs after the offset)
+        return
+    with open(blobfile,'rb') as f:
+        f.seek(offset)
+        reader=pacsv.open_csv(f,read_options=pacsv.ReadOptions(column_names=names,block_size=block_size,use_threads=use_threads),parse_options=pacsv.ParseOptions(delimiter='\t'),
+                              convert_options=pacsv.ConvertOptions(column_types=types,include_columns=schema.names))
+        for batch in reader:
+            ymdh=pc.extract_regex(batch.column('time'),r'(?P<y>-?\d+)-(?P<m>\d+)-(?P<d>\d+)[ T](?P<h>\d+)')
+            hours=track_hours(*(pc.struct_field(ymdh,[i]).cast(pa.int64()).to_numpy() for i in range(4)),calendar)
+            yield pa.Table.from_batches([batch]).set_column(1,'time',pa.array(hours)).cast(schema)
+
+#The blobstats_schema function below returns the parquet schema of a BlobStats text file (with or without blobsize and ike, detected from the first line),
+#and the names and Arrow types of its text columns.
+def blobstats_schema(blobfile):
+    with open(blobfile) as f:
+        ncol=len(f.readline().rstrip('\n').split('\t'))
+    names=['blobid','tindex']+BLOBSTATS_COLUMNS[:ncol-2]
+    types={c:pa.float64() for c in names[2:]};types.update(blobid=pa.int64(),time=pa.string())
+    return pa.schema([(c,pa.int64() if c=='time' else types[c]) for c in names if c!='tindex']),names,types
+
+#The blobstats_cache function below converts a BlobStats text file to a parquet file next to it and returns the parquet file (see blobstats_batches).
+#The parquet file is reused as long as the text file's path, size and modification time and the calendar are unchanged.
+#A smaller block_size (bytes of text per block and rows per row group) with use_threads=False bounds the memory of the conversion by one block.
+def blobstats_cache(blobfile,calendar='standard',block_size=1<<26,use_threads=True):
+    cachefile=os.path.splitext(blobfile)[0]+'_cache.parquet'
+    key=str((os.path.abspath(blobfile),os.path.getsize(blobfile),os.stat(blobfile).st_mtime_ns,calendar)).encode()
+    if os.path.exists(cachefile):
+        try:
+            if pq.read_schema(cachefile).metadata.get(b'blobkey')==key:
+                return cachefile
+        except Exception:
+            pass
+    with pq.ParquetWriter(cachefile,blobstats_schema(blobfile)[0].with_metadata({b'blobkey':key})) as writer:
+        for table in blobstats_batches(blobfile,calendar,block_size,use_threads):
+            writer.write_table(table)
+    return cachefile
+
+#The blobstats_offset function below finds the byte offset of the first line of a BlobStats text file at or after the time hour (hours, see track_hours)
+#by bisection over the file (BlobStats writes the blobs in time order), so the blobs of the last times are read without parsing the file before them.
+def blobstats_offset(blobfile,hour,calendar='standard'):
+    linetime=lambda line: track_hours(*(int(v) for v in re.match(r'\s*(-?\d+)-(\d+)-(\d+)[ T](\d+)',line.split(b'\t')[2].decode()).groups()),calendar)
+    with open(blobfile,'rb') as f:
+        lo=0;hi=f.seek(0,2)
+        while hi-lo>1<<16: #The lines that start up to lo are before hour
+            mid=(lo+hi)//2;f.seek(mid);f.readline();line=f.readline()
+            if line.strip() and linetime(line)<hour:
+                lo=mid
+            else:
+                hi=mid
+        f.seek(lo)
+        if lo>0:
+            f.readline()
+        while True:
+            pos=f.tell();line=f.readline()
+            if not line.strip() or linetime(line)>=hour:
+                return pos
+
+#The read_blobstats_after function below reads the blobs of a BlobStats text file at or after the time hour (see blobstats_offset) without its parquet cache.
+def read_blobstats_after(blobfile,hour,calendar='standard'):
+    tables=list(blobstats_batches(blobfile,calendar,offset=blobstats_offset(blobfile,hour,calendar)))
+    return (pa.concat_tables(tables) if len(tables)>0 else blobstats_schema(blobfile)[0].empty_table()).to_pandas()
+
+#The read_blobstats function below reads the columns (all if None) of a BlobStats text file through its parquet cache (see blobstats_cache).
+def read_blobstats(blobfile,calendar='standard',columns=None):
+    return pd.read_parquet(blobstats_cache(blobfile,calendar),columns=columns)
+
+#The share_arrays function below saves numpy arrays to .npy files in dirname (use a RAM-backed directory such as the one of shared_dir) and returns the file names.
+#Pool workers pass them to attach_arrays to memory-map the arrays, so all processes read the same pages instead of copying the parent's data.
+#Each call writes new files, so arrays mapped by workers are never overwritten.
+def share_arrays(dirname,**arrays):
+    files={}
+    for key,arr in arrays.items():
+        files[key]=os.path.join(dirname,f'{key}_{next(SHARE_COUNT)}.npy')
+        np.save(files[key],np.ascontiguousarray(arr))
+    return files
+
+SHARE_COUNT=itertools.count()
+MAPPED={} #Arrays mapped by this process, by file name
+
+#The attach_arrays function below memory-maps (read-only, without copying) the arrays saved by share_arrays, once per process and file.
+def attach_arrays(files):
+    for f in files.values():
+        if f not in MAPPED:
+            MAPPED[f]=np.load(f,mmap_mode='r')
+    return {key:MAPPED[f] for key,f in files.items()}
+
+#The shared_dir function below creates a directory for share_arrays in /dev/shm (memory-backed) if it exists, or in the system temporary directory otherwise.
+def shared_dir():
+    return tempfile.mkdtemp(prefix='syclops_',dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+#Run report state: the JSONL report file, the stages to profile with cProfile, and the run ID shared by SyCLoPS_main.py and the classifier it starts
+#(passed on through the SYCLOPS_RUN_ID environment variable).
+REPORT={'file':None,'profile':(),'program':None,'profiler':None}
+RUN_ID=os.environ.setdefault('SYCLOPS_RUN_ID',time.strftime('%Y%m%dT%H%M%S')+'-'+str(os.getpid()))
+
+#The open_report function below starts the run report of a program: the stage records (see start_stage/end_stage) are appended as JSON lines to reportfile
+#(None writes no report), and the stages named in profile are run under cProfile. A 'run' record with info (e.g., the run settings) is written first.
+#It returns the record of the whole run, to be ended with end_stage.
+def open_report(reportfile,program,profile=(),**info):
+    REPORT.update(file=reportfile,profile=tuple(profile),program=program)
+    write_record({'stage':'run','start':time.strftime('%Y-%m-%dT%H:%M:%S'),'host':socket.gethostname(),'pid':os.getpid(),**info})
+    return start_stage('total')
+
+#The start_stage function below starts the record of a stage: wall time, CPU time of this process and of its finished child processes, and peak RSS
+#are measured from here to end_stage. info (e.g., the time window) is written with the record.
+def start_stage(stage,workers=1,**info):
+    rec={'stage':stage,'workers':workers,**info,'_t':(time.perf_counter(),resource.getrusage(resource.RUSAGE_SELF),resource.getrusage(resource.RUSAGE_CHILDREN))}
+    if stage in REPORT['profile'] and REPORT['profiler'] is None:
+        REPORT['profiler']=rec['_prof']=cProfile.Profile()
+        rec['_prof'].enable()
+    return rec
+
+#The end_stage function below ends and writes the record of a stage with the counts of processed items (e.g., rows=nodes, blobs=blobs).
+#The throughput is rows per second of wall time. Child CPU time only includes child processes that have exited (TE commands, or pool workers once closed),
+#and peak RSS is the peak of the process (and of its exited children) so far. It returns the wall time in seconds.
+def end_stage(rec,rows=None,**counts):
+    t0,self0,child0=rec.pop('_t')
+    wall=time.perf_counter()-t0
+    prof=rec.pop('_prof',None)
+    if prof is not None:
+        prof.disable();REPORT['profiler']=None
+        if REPORT['file'] is not None:
+            rec['profile']=os.path.splitext(REPORT['file'])[0]+'_'+RUN_ID+'_'+rec['stage']+('_'+str(rec['window']) if 'window' in rec else '')+'.prof'
+            prof.dump_stats(rec['profile'])
+    self1=resource.getrusage(resource.RUSAGE_SELF);child1=resource.getrusage(resource.RUSAGE_CHILDREN)
+    rss=1/1024 if os.uname().sysname!='Darwin' else 1/1024**2 #ru_maxrss is in KiB on Linux and in bytes on macOS
+    rec.update(wall_s=round(wall,4),cpu_s=round(max(self1.ru_utime+self1.ru_stime-self0.ru_utime-self0.ru_stime,0),4),
+               child_cpu_s=round(max(child1.ru_utime+child1.ru_stime-child0.ru_utime-child0.ru_stime,0),4),
+               peak_rss_mb=round(self1.ru_maxrss*rss,1),child_peak_rss_mb=round(child1.ru_maxrss*rss,1))
+    if rows is not None:
+        rec.update(rows=int(rows),rows_per_s=round(rows/wall,1) if wall>0 else None)
+    rec.update({k:int(v) for k,v in counts.items()})
+    write_record(rec)
+    return wall
+
+#The write_record function below appends a record with the run ID and program name to the run report.
+def write_record(rec):
+    if REPORT['file'] is None:
+        return
+    if os.path.dirname(REPORT['file']):
+        os.makedirs(os.path.dirname(REPORT['file']),exist_ok=True)
+    with open(REPORT['file'],'a') as f:
+        f.write(json.dumps({'run':RUN_ID,'program':REPORT['program'],**rec},default=str)+'\n')
+
+#The count_lines function below counts the lines of a text file (e.g., the rows of a StitchNodes or BlobStats output file) for the run report.
+def count_lines(path):
+    n=0
+    with open(path,'rb') as f:
+        for block in iter(lambda: f.read(1<<24),b''):
+            n+=block.count(b'\n')
+    return n
@@ -6,6 +6,7 @@ import os
 import subprocess
 import glob
 import time
+from SyCLoPS_io import open_report,start_stage,end_stage,count_lines #Run report of per-stage performance records (shared with SyCLoPS_Classifier.py)
 
 print("Please remember to review the code and comments in this file and modify accordingly before running. \n\
 Activate an appropriate Python environment that has Xarray, Pandas, PyArrow, multiprocess, and Scipy installed.\n")
@@ -43,6 +44,9 @@ z_level_value = "250hPa" if use_250hPa_only else "300hPa"
 # Create a log directory if it doesn't exist (for storing temporary logs of TempestExtremes). You may change the path and name of this log directory.
 log_dir= "./TE_log2"
 os.makedirs(log_dir, exist_ok=True)
+# The run report: one JSON line per TE command with its wall time, CPU time, peak memory and rows written. The classifier started below adds its records to the same run.
+# Set it to None to write no report.
+report_file = f"other_info/{model_data_name}_run_report.jsonl"
 
 # Mode choice by user
 while True:
@@ -221,17 +225,19 @@ if use_connect:
     detect_blobs_cmd.extend(["--in_connect", connectivity_file])
     blobstats_cmd.extend(["--in_connect", connectivity_file])
     
+total=open_report(report_file,'SyCLoPS_main',model_data_name=model_data_name,timefilter=timefilter,mode=mode,step=step,use_srun=use_srun,srun_n=srun_n,use_connect=use_connect)
 try:
     if step == 1:
-        t0 = time.time()
+        st=start_stage('DetectNodes',workers=int(srun_n) if use_srun else 1)
         # Check if outputfile_DN has only one row. If true then a different check for TE errors is needed.
         with open(outputfile_DN, 'r') as f:
             lines = f.readlines()
             linelen=len(lines)
         if linelen > 1 and use_srun:
             print("Running DetectNodes...")
+            started=time.time() #The logs of this command are newer than this time
             subprocess.run(detect_nodes_cmd, check=True)
-            check_log_dir(log_dir,t0)
+            check_log_dir(log_dir,started)
         else:
             print("Running DetectNodes with a single line of inputfiles...")
             result=subprocess.run(detect_nodes_cmd, capture_output=True, check=True)
@@ -241,29 +247,28 @@ try:
             if "EXCEPTION" in last_line:
                 print("Error in DetectNodes command:", last_line)
                 exit(1)
-        t1 = time.time()
-        print(f"DetectNodes command executed successfully in {t1 - t0:.2f} seconds.")
+        print(f"DetectNodes command executed successfully in {end_stage(st,files=linelen):.2f} seconds.")
 
     if step <= 2:
-        t0 = time.time()
+        st=start_stage('StitchNodes')
         print("Running StitchNodes...")
         subprocess.run(stitch_nodes_cmd, check=True)
         mod_time = os.path.getmtime(outputfile_SN)
         if not os.path.isfile(outputfile_SN) or time.time() - mod_time > 10:
             print(f"Error: Output file {outputfile_SN} was not correctly created by StitchNodes. Please check if StitchNodes ran correctly.")
             exit(1)
-        t1 = time.time()
-        print(f"StitchNodes command executed successfully in {t1 - t0:.2f} seconds.")
+        print(f"StitchNodes command executed successfully in {end_stage(st,rows=count_lines(outputfile_SN)-1):.2f} seconds.")
 
     if mode.lower() == 'y' and step <= 5:
         print("You chose to classify tropical-like cyclones. The program will now run additional steps for calculating LPSAREA.\n")
         
         if step <= 3:
-            t0 = time.time()
+            st=start_stage('VariableProcessor',workers=int(srun_n) if use_srun else 1)
             print("Running VariableProcessor...")
             if use_srun:
+                started=time.time()
                 subprocess.run(variable_processor_cmd, check=True)
-                check_log_dir(log_dir)   
+                check_log_dir(log_dir,started)
             else:    
                 result=subprocess.run(variable_processor_cmd, capture_output=True, check=True)
                 # Capture the output and check for errors
@@ -272,15 +277,15 @@ try:
                 if "EXCEPTION" in last_line:
                     print("Error in VariableProcessor command:", last_line)
                     exit(1)
-            t1 = time.time()
-            print(f"VariableProcessor command executed successfully in {t1 - t0:.2f} seconds.")
+            print(f"VariableProcessor command executed successfully in {end_stage(st,files=count_lines(inputfile_VP)):.2f} seconds.")
             
         if step <= 4:
-            t0 = time.time()
+            st=start_stage('DetectBlobs',workers=int(srun_n) if use_srun else 1)
             print("Running DetectBlobs...")
             if use_srun:
+                started=time.time()
                 subprocess.run(detect_blobs_cmd, check=True)
-                check_log_dir(log_dir)   
+                check_log_dir(log_dir,started)
             else:    
                 result=subprocess.run(detect_blobs_cmd, capture_output=True, check=True)
                 # Capture the output and check for errors
@@ -289,11 +294,10 @@ try:
                 if "EXCEPTION" in last_line:
                     print("Error in DetectBlobs command:", last_line)
                     exit(1)
-            t1 = time.time()
-            print(f"DetectBlobs command executed successfully in {t1 - t0:.2f} seconds.")
+            print(f"DetectBlobs command executed successfully in {end_stage(st,files=count_lines(outputfile_VP)):.2f} seconds.")
 
         if step <= 5:
-            t0 = time.time()
+            st=start_stage('BlobStats')
             print("Running BlobStats...")
             result=subprocess.run(blobstats_cmd, capture_output=True, check=True)
             # Capture the output and check for errors
@@ -302,8 +306,7 @@ try:
             if "EXCEPTION" in last_line:
                 print("Error in BlobStats command:", last_line)
                 exit(1)
-            t1 = time.time()
-            print(f"BlobStats command executed successfully in {t1 - t0:.2f} seconds.")
+            print(f"BlobStats command executed successfully in {end_stage(st,rows=count_lines(outputfile_BS)):.2f} seconds.")
 
     elif mode.lower() != 'y' and step <= 5:
         print("You chose not to classify tropical-like cyclones. The program will skip the additional steps for calculating LPSAREA.")
@@ -316,10 +319,13 @@ print("\nAll TempestExtremes commands executed successfully (double check to mak
 confirm=input("Please review the code and comments in SyCLoPS_classifier.py and modify accordingly before running. Are you ready to run SyCLoPS_classifier.py now? (y/n). Default is 'n': ")
 if confirm.lower() != 'y':
     print("You chose not to run SyCLoPS_classifier.py now. you can always run it later by entering step '6' when prompted at the beginning of this program or just executing 'python SyCLoPS_classifier.py' in the terminal.")
+    end_stage(total)
     exit()
     
 try:
+    st=start_stage('Classifier')
     subprocess.run(["python", "SyCLoPS_Classifier.py"], check=True) 
+    end_stage(st);end_stage(total) #The classifier writes the records of its sections to the same run report
     print("\nSyCLoPS_classifier.py executed successfully.")
 except subprocess.CalledProcessError as e:
     print("\nError running SyCLoPS_classifier.py:", e)
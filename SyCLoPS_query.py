@@ -0,0 +1,294 @@
+## Spatiotemporal queries over the SyCLoPS classified catalogs (ClassifiedOutFile or the hive-partitioned dataset ClassifiedDatasetDir of SyCLoPS_Classifier.py)
+## without reading the whole catalog: a persistent index of the nodes in time buckets and spatial cells on the unit sphere, and of the track bounding boxes.
+# Please direct any questions to the author of this script: Yushan Han (yshhan@ucdavis.edu)
+# Example:
+#   from SyCLoPS_query import open_index,query_nodes,query_tracks,read_nodes
+#   index=open_index('classified_track/SyCLoPS_classified_ERA5.parquet') #Built on the first call and reused while the catalog is unchanged
+#   nodes=query_nodes(index,time=('2005-09-01','2005-09-30'),center=(-30,35),radius_km=500,labels=['SS(STLC)'])
+#   tracks=query_tracks(index,box=(260,300,20,35),tags=['TC'])
+#   full=read_nodes(index,nodes.row) #All the columns of the selected nodes (only the row groups that hold them are read)
+
+import os
+import glob
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from SyCLoPS_io import CALENDARS,TRACK_FLAGS,isotime_hours,hours_isotime #Track_Info is an integer bitmask of track tags (TRACK_FLAGS)
+
+#--------Constants--------#
+CellSize=0.02 #Edge length of the spatial cells in X/Y/Z on the unit sphere (~1.1 degrees or ~130 km)
+BucketHours=24*7 #Length of the time buckets in hours
+EarthRadius=6371.0 #km, as in SyCLoPS_Classifier.py
+
+INDEX_VERSION=2 #Version of the index contents (indexes of other versions are rebuilt; 2: the track Track_Info is the bitwise OR of its nodes)
+INDEX_ARRAYS=['key','row','HOURS','LON','LAT','X','Y','Z','TID','Short_Label','Adjusted_Label','Track_Info']
+CELL_ARRAYS=['cell','cx','cy','cz','latmin','latmax','lonmin','lonmax']
+TRACK_ARRAYS=['TID','first','last','nodes','tmin','tmax','latmin','latmax','lonmin','lonmax','Track_Info']
+
+#------------------Functions--------------------#
+#The catalog_parts function below lists the row groups of a catalog file, or of all the files of a dataset directory (in sorted path order),
+#as (file, row group, number of rows). The row numbers of the index count the nodes in this order.
+def catalog_parts(catalog):
+    files=sorted(glob.glob(os.path.join(catalog,'**','*.parquet'),recursive=True)) if os.path.isdir(catalog) else [catalog]
+    parts=[]
+    for f in files:
+        meta=pq.ParquetFile(f).metadata
+        parts+=[(f,g,meta.row_group(g).num_rows) for g in range(meta.num_row_groups)]
+    return parts
+
+#The index_key function below identifies a catalog version and the index settings (the index is rebuilt when any of them changes).
+def index_key(catalog,cell_size,bucket_hours,calendar):
+    files=sorted(set(f for f,g,n in catalog_parts(catalog)))
+    return json.dumps([[os.path.abspath(f),os.path.getsize(f),os.stat(f).st_mtime_ns] for f in files]+[cell_size,bucket_hours,calendar,INDEX_VERSION])
+
+#The xyz function below converts longitudes and latitudes (degrees) to the spherical coordinates (X,Y,Z) as in SyCLoPS_Classifier.py.
+def xyz(lon,lat):
+    lon=np.asarray(lon,dtype=float)*(np.pi/180);lat=np.asarray(lat,dtype=float)*(np.pi/180)
+    return np.cos(lon)*np.cos(lat),np.sin(lon)*np.cos(lat),np.sin(lat)
+
+#The cell_of function below returns the id of the spatial cell (a cube of edge cell_size in X/Y/Z) of each point.
+def cell_of(X,Y,Z,cell_size):
+    n=int(np.ceil(2/cell_size))+1
+    i,j,k=(np.floor((np.asarray(a)+1)/cell_size).astype(np.int64) for a in (X,Y,Z))
+    return (i*n+j)*n+k
+
+#The track_info_bits function below returns the Track_Info bitmask of Track_Info values (bitmasks, or strings such as "Track_TC_EXT").
+def track_info_bits(v):
+    v=pd.Series(v)
+    if pd.api.types.is_integer_dtype(v):
+        return v.to_numpy(dtype=np.uint8)
+    vals,inv=np.unique(v.astype(str).to_numpy(),return_inverse=True)
+    bits=np.array([sum(TRACK_FLAGS.get(t,0) for t in s.split('_')[1:]) for s in vals],dtype=np.uint8)
+    return bits[inv]
+
+#The track_bits function below returns the Track_Info bitmask of each track (in TID order): the bitwise OR of the Track_Info of its nodes,
+#since the EXT and TT bits are only set on the nodes in the transitions.
+def track_bits(TID,track_info):
+    order=np.argsort(TID,kind='stable');tid=TID[order]
+    if len(tid)==0:
+        return np.zeros(0,dtype=np.uint8)
+    return np.bitwise_or.reduceat(track_info[order],np.flatnonzero(np.append(True,tid[1:]!=tid[:-1])))
+
+#The build_index function below reads the columns of the catalog needed by the queries (row group by row group) and saves the index in indexdir:
+#the nodes sorted by (time bucket, spatial cell), the occupied cells with their centers and the lat/lon ranges of their nodes, and the tracks with
+#their time spans and bounding boxes. Longitudes are kept in [0, 360); a track bounding box that crosses 0E has lonmin > lonmax.
+def build_index(catalog,indexdir,calendar=None,cell_size=CellSize,bucket_hours=BucketHours):
+    cols=['TID','ISOTIME','LON','LAT','Short_Label','Adjusted_Label','Track_Info']
+    df=[]
+    for f,g,n in catalog_parts(catalog):
+        df.append(pq.ParquetFile(f).read_row_group(g,columns=cols).to_pandas())
+    df=pd.concat(df,ignore_index=True) if len(df)>0 else pd.DataFrame(columns=cols)
+    if calendar is None:
+        calendar='standard' if pd.api.types.is_datetime64_any_dtype(df.ISOTIME) else '360_day'
+    calendar=CALENDARS[calendar]
+    a={'row':np.arange(len(df),dtype=np.int64),'HOURS':isotime_hours(df.ISOTIME.to_numpy(),calendar) if len(df)>0 else np.zeros(0,dtype=np.int64),
+       'LON':df.LON.to_numpy(dtype=float)%360,'LAT':df.LAT.to_numpy(dtype=float),'TID':df.TID.to_numpy(dtype=np.int64),'Track_Info':track_info_bits(df.Track_Info)}
+    labels=sorted(set(df.Short_Label.astype(str))|set(df.Adjusted_Label.astype(str)))
+    for c in ['Short_Label','Adjusted_Label']:
+        a[c]=np.searchsorted(labels,df[c].astype(str).to_numpy()).astype(np.int8)
+    a['X'],a['Y'],a['Z']=xyz(a['LON'],a['LAT'])
+    cell=cell_of(a['X'],a['Y'],a['Z'],cell_size)
+    cells,crank=np.unique(cell,return_inverse=True)
+    #Occupied cells: the center of the cube and the lat/lon ranges of the nodes in it
+    n=int(np.ceil(2/cell_size))+1
+    c={'cell':cells}
+    c['cx'],c['cy'],c['cz']=((cells//(n*n))+0.5)*cell_size-1,((cells//n%n)+0.5)*cell_size-1,((cells%n)+0.5)*cell_size-1
+    g=pd.DataFrame({'c':crank,'LAT':a['LAT'],'LON':a['LON']}).groupby('c')
+    c['latmin'],c['latmax'],c['lonmin'],c['lonmax']=(g.LAT.min().to_numpy(),g.LAT.max().to_numpy(),g.LON.min().to_numpy(),g.LON.max().to_numpy())
+    #Tracks: the time span and the bounding box (the narrower of the longitude ranges in [0, 360) and in [-180, 180))
+    g=pd.DataFrame({'TID':a['TID'],'row':a['row'],'HOURS':a['HOURS'],'LAT':a['LAT'],'LON':a['LON'],'LONW':(a['LON']+180)%360-180,
+                    'Track_Info':a['Track_Info']}).groupby('TID',sort=True)
+    t={'TID':np.array(list(g.groups.keys()),dtype=np.int64),'first':g.row.min().to_numpy(),'last':g.row.max().to_numpy(),'nodes':g.row.size().to_numpy(),
+       'tmin':g.HOURS.min().to_numpy(),'tmax':g.HOURS.max().to_numpy(),'latmin':g.LAT.min().to_numpy(),'latmax':g.LAT.max().to_numpy(),
+       'Track_Info':track_bits(a['TID'],a['Track_Info'])}
+    lo,hi,low,hiw=g.LON.min().to_numpy(),g.LON.max().to_numpy(),g.LONW.min().to_numpy(),g.LONW.max().to_numpy()
+    wrap=(hiw-low)<(hi-lo)
+    t['lonmin']=np.where(wrap,low%360,lo);t['lonmax']=np.where(wrap,hiw%360,hi)
+    #Nodes sorted by (time bucket, cell)
+    a['key']=a['HOURS']//bucket_hours*len(cells)+crank
+    order=np.argsort(a['key'],kind='stable')
+    a={k:v[order] for k,v in a.items()}
+    os.makedirs(indexdir,exist_ok=True)
+    for name,arrs in (('node',a),('cell',c),('track',t)):
+        for k,v in arrs.items():
+            np.save(os.path.join(indexdir,name+'_'+k+'.npy'),np.asarray(v))
+    meta={'key':index_key(catalog,cell_size,bucket_hours,calendar),'catalog':os.path.abspath(catalog),'calendar':calendar,'cell_size':cell_size,
+          'bucket_hours':bucket_hours,'labels':labels,'ncell':len(cells)}
+    with open(os.path.join(indexdir,'index.json'),'w') as f: #Written last: an index without it is incomplete
+        json.dump(meta,f)
+    return meta
+
+#The open_index function below loads the index of a catalog from indexdir (by default next to the catalog, "<catalog>_index"), memory-mapping its arrays,
+#and builds it first if it is missing or the catalog or the settings have changed. calendar is that of the model data (None: 'standard' for datetime ISOTIME, else '360_day').
+def open_index(catalog,indexdir=None,calendar=None,cell_size=CellSize,bucket_hours=BucketHours):
+    indexdir=indexdir or os.path.splitext(catalog.rstrip('/'))[0]+'_index'
+    metafile=os.path.join(indexdir,'index.json')
+    meta=None
+    if os.path.exists(metafile):
+        with open(metafile) as f:
+            meta=json.load(f)
+        if meta['key']!=index_key(catalog,cell_size,bucket_hours,meta['calendar'] if calendar is None else CALENDARS[calendar]):
+            meta=None
+    if meta is None:
+        meta=build_index(catalog,indexdir,calendar,cell_size,bucket_hours)
+    load=lambda name,keys:{k:np.load(os.path.join(indexdir,name+'_'+k+'.npy'),mmap_mode='r') for k in keys}
+    return {'meta':meta,'catalog':catalog,'nodes':load('node',INDEX_ARRAYS),'cells':load('cell',CELL_ARRAYS),'tracks':load('track',TRACK_ARRAYS)}
+
+#The query_hours function below converts query times (strings such as '2005-09-01' or '2005-09-01 06:00', or datetime64) to hours in the calendar of the index.
+def query_hours(t,calendar):
+    if isinstance(t,str):
+        t=t.strip()+(' 00' if len(t.strip())<=10 else '')
+        return int(isotime_hours(np.array([t],dtype=object),calendar)[0])
+    return int(isotime_hours(np.array([np.datetime64(t,'h')]),calendar)[0])
+
+#The in_lon function below tests whether longitudes lie in the range lonmin to lonmax (degrees east, crossing 0E if lonmin > lonmax after wrapping to [0, 360)).
+def in_lon(lon,lonmin,lonmax):
+    return (np.asarray(lon)-lonmin)%360<=(lonmax-lonmin)%360
+
+#The query_cells function below returns the ranks of the occupied cells that may hold nodes in the box (lonmin, lonmax, latmin, latmax) and
+#within radius_km of center (lon, lat), or None if there is no spatial filter.
+def query_cells(index,box=None,center=None,radius_km=None):
+    c=index['cells'];keep=np.ones(len(c['cell']),dtype=bool)
+    if box is not None:
+        lonmin,lonmax,latmin,latmax=box
+        keep&=(c['latmax']>=latmin)&(c['latmin']<=latmax)
+        if lonmax-lonmin<360:
+            lonmin%=360;lonmax%=360
+            keep&=in_lon(lonmin,c['lonmin'],c['lonmax'])|in_lon(c['lonmin'],lonmin,lonmax)
+    if center is not None and radius_km is not None:
+        px,py,pz=xyz(center[0],center[1])
+        chord=2*np.sin(min(radius_km/EarthRadius,np.pi)/2)
+        keep&=np.sqrt((c['cx']-px)**2+(c['cy']-py)**2+(c['cz']-pz)**2)<=chord+index['meta']['cell_size']*np.sqrt(3)/2
+    if box is None and (center is None or radius_km is None):
+        return None
+    return np.flatnonzero(keep)
+
+#The query_rows function below returns the positions (in the index order) of the nodes in the time buckets of time and in the cells (None for all cells).
+def query_rows(index,time=None,cells=None):
+    key=index['nodes']['key'];ncell=index['meta']['ncell'];bh=index['meta']['bucket_hours']
+    if len(key)==0:
+        return np.zeros(0,dtype=np.int64)
+    b0=key[0]//ncell;b1=key[-1]//ncell
+    if time is not None:
+        b0=max(b0,query_hours(time[0],index['meta']['calendar'])//bh) if time[0] is not None else b0
+        b1=min(b1,query_hours(time[1],index['meta']['calendar'])//bh) if time[1] is not None else b1
+    if b1<b0:
+        return np.zeros(0,dtype=np.int64)
+    if cells is None:
+        return np.arange(np.searchsorted(key,b0*ncell),np.searchsorted(key,(b1+1)*ncell))
+    keys=(np.arange(b0,b1+1)[:,None]*ncell+cells[None,:]).ravel()
+    start=np.searchsorted(key,keys,side='left');end=np.searchsorted(key,keys,side='right')
+    n=end-start;start=start[n>0];n=n[n>0]
+    return np.repeat(start-np.cumsum(n)+n,n)+np.arange(n.sum())
+
+#The node_filter function below applies the exact filters to the nodes at the positions pos of the index and returns the positions that pass.
+def node_filter(index,pos,time=None,box=None,center=None,radius_km=None,labels=None,adjusted=False,tags=None):
+    a=index['nodes'];meta=index['meta'];ok=np.ones(len(pos),dtype=bool)
+    if time is not None:
+        h=a['HOURS'][pos]
+        if time[0] is not None: ok&=h>=query_hours(time[0],meta['calendar'])
+        if time[1] is not None: ok&=h<=query_hours(time[1],meta['calendar'])
+    if box is not None:
+        lonmin,lonmax,latmin,latmax=box
+        lat=a['LAT'][pos];ok&=(lat>=latmin)&(lat<=latmax)
+        if lonmax-lonmin<360:
+            ok&=in_lon(a['LON'][pos],lonmin%360,lonmax%360)
+    if center is not None and radius_km is not None:
+        px,py,pz=xyz(center[0],center[1])
+        chord=2*np.sin(min(radius_km/EarthRadius,np.pi)/2)
+        ok&=(a['X'][pos]-px)**2+(a['Y'][pos]-py)**2+(a['Z'][pos]-pz)**2<=chord**2
+    if labels is not None:
+        codes=[i for i,s in enumerate(meta['labels']) if s in set(labels)]
+        ok&=np.isin(a['Adjusted_Label' if adjusted else 'Short_Label'][pos],codes)
+    if tags is not None:
+        mask=sum(TRACK_FLAGS[t] for t in tags)
+        ok&=(a['Track_Info'][pos]&mask)==mask
+    return pos[ok]
+
+#The query_nodes function below returns the nodes that pass all the given filters, in the row order of the catalog:
+#  time=(start, end): node times in the range (inclusive; either end may be None), e.g., ('2005-09-01','2005-09-30 21:00')
+#  box=(lonmin, lonmax, latmin, latmax): nodes in the box (degrees; crossing 0E if lonmin > lonmax, e.g., (350, 10, -5, 5))
+#  center=(lon, lat) and radius_km: nodes within the great-circle distance of center
+#  labels: nodes with these short labels (Adjusted_Label instead of Short_Label if adjusted=True)
+#  tags: nodes with all these tags in their own Track_Info (see TRACK_FLAGS), e.g., ['TC']. The track tags (TC, HT, MS, SS(STLC), PL(PTLC) and QS) are set
+#        on all the nodes of a track, while EXT and TT are set only on the nodes in the extratropical or tropical transition of a track.
+#The row column is the row number of a node in the catalog (see read_nodes).
+def query_nodes(index,time=None,box=None,center=None,radius_km=None,labels=None,adjusted=False,tags=None):
+    pos=query_rows(index,time,query_cells(index,box,center,radius_km))
+    pos=node_filter(index,pos,time,box,center,radius_km,labels,adjusted,tags)
+    a=index['nodes'];meta=index['meta'];lab=np.array(meta['labels'],dtype=object)
+    pos=pos[np.argsort(a['row'][pos])]
+    return pd.DataFrame({'row':a['row'][pos],'TID':a['TID'][pos],'ISOTIME':hours_isotime(a['HOURS'][pos],meta['calendar']),'LON':a['LON'][pos],'LAT':a['LAT'][pos],
+                         'Short_Label':lab[a['Short_Label'][pos]] if len(lab)>0 else [],'Adjusted_Label':lab[a['Adjusted_Label'][pos]] if len(lab)>0 else [],
+                         'Track_Info':a['Track_Info'][pos]})
+
+#The query_tracks function below returns the tracks (with their time spans and bounding boxes) that have at least one node passing the filters
+#of query_nodes (e.g., tracks passing through a box). The track bounding boxes and time spans rule out most tracks before the nodes are checked.
+#Unlike query_nodes, tags are tested on the track: the Track_Info of a track has the tags of all its nodes (e.g., ['EXT'] gives the tracks with an extratropical transition).
+def query_tracks(index,time=None,box=None,center=None,radius_km=None,labels=None,adjusted=False,tags=None):
+    t=index['tracks'];meta=index['meta'];ok=np.ones(len(t['TID']),dtype=bool)
+    if time is not None:
+        if time[0] is not None: ok&=t['tmax']>=query_hours(time[0],meta['calendar'])
+        if time[1] is not None: ok&=t['tmin']<=query_hours(time[1],meta['calendar'])
+    if box is not None:
+        lonmin,lonmax,latmin,latmax=box
+        ok&=(t['latmax']>=latmin)&(t['latmin']<=latmax)
+        if lonmax-lonmin<360:
+            ok&=in_lon(lonmin%360,t['lonmin'],t['lonmax'])|in_lon(t['lonmin'],lonmin%360,lonmax%360)
+    if tags is not None:
+        mask=sum(TRACK_FLAGS[g] for g in tags)
+        ok&=(t['Track_Info']&mask)==mask
+    tid=t['TID'][ok]
+    if box is not None or (center is not None and radius_km is not None) or labels is not None:
+        nodes=query_nodes(index,time,box,center,radius_km,labels,adjusted) #(The tags are tested on the tracks above)
+        tid=np.intersect1d(tid,nodes.TID.to_numpy())
+    k=np.searchsorted(t['TID'],tid)
+    out=pd.DataFrame({c:t[c][k] for c in TRACK_ARRAYS})
+    out['start']=hours_isotime(out.pop('tmin'),meta['calendar']);out['end']=hours_isotime(out.pop('tmax'),meta['calendar'])
+    return out
+
+#The read_nodes function below reads the columns (None for all) of the catalog rows, only from the row groups that hold them, in the order of rows.
+def read_nodes(index,rows,columns=None):
+    rows=np.asarray(rows,dtype=np.int64)
+    parts=catalog_parts(index['catalog'])
+    start=np.cumsum([0]+[n for f,g,n in parts])
+    part=np.searchsorted(start,rows,side='right')-1
+    out=[];where=[]
+    for p in np.unique(part):
+        f,g,n=parts[p]
+        df=pq.ParquetFile(f).read_row_group(g,columns=columns).to_pandas()
+        sel=np.flatnonzero(part==p)
+        out.append(df.iloc[rows[sel]-start[p]]);where.append(sel)
+    if len(out)==0:
+        return pd.DataFrame(columns=columns)
+    out=pd.concat(out,ignore_index=True)
+    return out.iloc[np.argsort(np.concatenate(where),kind='stable')].reset_index(drop=True)
+
+#The check_index function below checks the index and the queries on a small catalog written in tmpdir: a track with both tropical transition (TT)
+#and extratropical transition (EXT) nodes, a TC track and a track that crosses 0E. It raises AssertionError if a query gives a wrong answer.
+def check_index(tmpdir):
+    TC,EXT,TT=TRACK_FLAGS['TC'],TRACK_FLAGS['EXT'],TRACK_FLAGS['TT']
+    df=pd.DataFrame({'TID':[0,0,0,0,1,1,2,2],'ISOTIME':pd.date_range('2005-09-01',periods=8,freq='3h').values[[0,1,2,3,0,1,4,5]],
+                     'LON':[300.,302,305,310,120,121,359,1],'LAT':[20.,25,30,40,15,16,-5,-5],
+                     'Short_Label':['TC','TC','TC','EX','TC','TC','DSD','DSD'],'Adjusted_Label':['TC','TC','TC','EX','TC','TC','DSD','DSD'],
+                     'Track_Info':np.array([TC|TT,TC,TC,TC|EXT,TC,TC,0,0],dtype=np.uint8)})
+    catalog=os.path.join(tmpdir,'check_catalog.parquet');df.to_parquet(catalog)
+    index=open_index(catalog)
+    t=index['tracks']
+    assert list(t['Track_Info'])==[TC|TT|EXT,TC,0],"Track_Info of the tracks must be the bitwise OR of their nodes"
+    assert list(query_tracks(index,tags=['EXT']).TID)==[0] and list(query_tracks(index,tags=['TT','EXT']).TID)==[0]
+    assert list(query_tracks(index,tags=['TC']).TID)==[0,1]
+    assert list(query_tracks(index,box=(290,320,35,45),tags=['TT']).TID)==[0] #The TT node is outside the box, but the track has the tag
+    assert list(query_nodes(index,tags=['EXT']).row)==[3] and list(query_nodes(index,tags=['TT']).row)==[0] #Node tags are tested on the nodes
+    assert list(query_tracks(index,box=(355,5,-10,0)).TID)==[2]
+    assert list(query_nodes(index,center=(120,15),radius_km=200).row)==[4,5]
+    assert list(read_nodes(index,[6,3]).LON)==[359.,310.]
+
+#---------------Main Program Starts----------------#
+#Running this script checks the index and the queries on a small catalog (see check_index).
+if __name__ == '__main__':
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmpdir:
+        check_index(tmpdir)
+    print("The query index passed the checks.")
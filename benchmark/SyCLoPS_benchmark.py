@@ -0,0 +1,132 @@
+## SyCLoPS benchmark: times the classifier sections and helper functions on synthetic inputs at several scales (no ERA5 data, TE or network needed)
+# Please direct any questions to the author of this script: Yushan Han (yshhan@ucdavis.edu)
+# For each scale (number of LPS nodes), the benchmark:
+#   (1) writes synthetic inputs with SyCLoPS_synthetic.py (reused if they exist),
+#   (2) runs a copy of SyCLoPS_Classifier.py on them with the constants below (caches and checkpoints are removed first, so every run is a cold run),
+#   (3) times blob pairing (blobpairing_batch), the QS track statistics (track_stats) and the track kinematics (track_kinematics) on their own,
+#   (4) runs a copy of optional/NodeFile_to_csv.py on the synthetic DetectNodes files (up to NodeFileMaxNodes nodes).
+# All timings go to one run report (see start_stage in SyCLoPS_io.py). The wall time of each stage at each scale and its scaling exponent
+# (the slope of log(wall time) against log(nodes); 1 is linear) are printed and saved to ScalingFile.
+
+import os
+import sys
+import re
+import glob
+import json
+import subprocess
+import numpy as np
+import pandas as pd
+RepoDir=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..')
+sys.path.append(RepoDir);sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from SyCLoPS_io import RUN_ID,open_report,start_stage,end_stage,read_blobstats
+from SyCLoPS_synthetic import synthetic_inputs
+
+#--------Constants (Change Accordingly)--------#
+Scales=[10000,100000,1000000] #Numbers of LPS nodes (e.g., up to 10000000 with enough memory and disk space, ~5 GB per 10 million nodes)
+BenchDir='bench' #Directory of the synthetic inputs (one subdirectory per scale) and the benchmark outputs
+nprocess=4 #Number of processors for the classifier
+Answers="0\n\nN\nN\n3\n" #Answers to the classifier prompts: mode 0, geopotential unit, no 250 hPa data, global data, 3-hourly tracks
+ClassifierSettings={'TimeWindow':None} #Other constants of SyCLoPS_Classifier.py to set for the benchmark (e.g., {'TimeWindow':12})
+NodeFileMaxNodes=1000000 #Largest scale to run NodeFile_to_csv.py at (it parses the DetectNodes files line by line). None runs it at all scales.
+Seed=0
+ReportFile=os.path.join(BenchDir,'benchmark_report.jsonl')
+ScalingFile=os.path.join(BenchDir,'benchmark_scaling.csv')
+
+#------------------Functions--------------------#
+#The script_copy function below writes a copy of a script with the assignments of the given top-level names replaced (values are Python source code).
+def script_copy(src,dst,**assignments):
+    with open(src) as f:
+        code=f.read()
+    for name,value in assignments.items():
+        code,n=re.subn(r'^'+name+r'\s*=.*$',lambda m: name+'='+value,code,count=1,flags=re.M)
+        if n==0:
+            raise ValueError(name+" is not assigned in "+src)
+    with open(dst,'w') as f:
+        f.write(code)
+
+#The run_classifier function below runs the classifier on the synthetic inputs in rundir, with its section records in ReportFile under runid.
+def run_classifier(rundir,runid):
+    for f in glob.glob(os.path.join(rundir,'*','*_cache.parquet')):
+        os.remove(f)
+    settings={'nprocess':repr(nprocess),'ReportFile':repr(os.path.abspath(ReportFile)),'CheckpointDir':'None','ProfileStages':'[]'}
+    settings.update({k:repr(v) for k,v in ClassifierSettings.items()})
+    script_copy(os.path.join(RepoDir,'SyCLoPS_Classifier.py'),os.path.join(rundir,'bench_classifier.py'),**settings)
+    env=dict(os.environ,SYCLOPS_RUN_ID=runid,PYTHONPATH=os.pathsep.join([os.path.abspath(RepoDir),os.environ.get('PYTHONPATH','')]))
+    with open(os.path.join(rundir,'bench_classifier.log'),'w') as log:
+        subprocess.run([sys.executable,'bench_classifier.py'],cwd=rundir,input=Answers.encode(),stdout=log,stderr=subprocess.STDOUT,env=env,check=True)
+
+#The bench_helpers function below times the bulk helper functions of the classifier on the synthetic inputs in rundir.
+def bench_helpers(cls,rundir,n):
+    dfin,calendar=cls.read_tracks(os.path.join(rundir,'out_track','ERA5_lpstracks.csv'))
+    dfblob=read_blobstats(os.path.join(rundir,'blobstats','ERA5_size_blob_stats.txt'),calendar)
+    xyz=lambda lon,lat: np.column_stack((np.cos(lon*(np.pi/180))*np.cos(lat*(np.pi/180)),np.sin(lon*(np.pi/180))*np.cos(lat*(np.pi/180)),np.sin(lat*(np.pi/180))))
+    LON=dfin.LON.to_numpy()%360;LAT=dfin.LAT.to_numpy()
+    NodeXYZ=xyz(LON,LAT)
+    dfin['ind']=np.arange(len(dfin))
+    st=start_stage('blobpairing',nodes=n)
+    cls.blobpairing_batch(dfin[['HOURS','LON','LAT','MSLP','ind']],dfblob,NodeXYZ,xyz(dfblob.centlon.to_numpy(),dfblob.centlat.to_numpy()))
+    end_stage(st,rows=len(dfin),blobs=len(dfblob))
+    FST=np.unique(dfin.TID.values,return_index=1)[1]
+    LST=len(dfin)-np.unique(dfin.TID.values[::-1],return_index=1)[1]-1
+    st=start_stage('track_stats',nodes=n)
+    cls.track_stats(FST,LST,LON,LAT,NodeXYZ[:,0],NodeXYZ[:,1],NodeXYZ[:,2],dfin.ZS.to_numpy()) #ZS stands in for ZSMX
+    end_stage(st,rows=len(dfin),tracks=len(FST))
+    st=start_stage('track_kinematics',nodes=n)
+    cls.track_kinematics(dfin.TID.values,dfin.HOURS.values,LAT,dfin.LON.values,dfin.MSLPCC55.values,(dfin.T850.values>280).astype(float),1.0,4.0,12)
+    end_stage(st,rows=len(dfin))
+
+#The bench_nodefile function below runs NodeFile_to_csv.py on the synthetic DetectNodes files in rundir.
+def bench_nodefile(rundir,n):
+    script_copy(os.path.join(RepoDir,'optional','NodeFile_to_csv.py'),os.path.join(rundir,'bench_nodefile.py'),
+                input_file_list="sorted(glob.glob('detectnodes/*.txt'))",output_file="'detectnodes_lpsnodes.csv'")
+    st=start_stage('NodeFile_to_csv',nodes=n)
+    with open(os.path.join(rundir,'bench_nodefile.log'),'w') as log:
+        subprocess.run([sys.executable,'bench_nodefile.py'],cwd=rundir,stdout=log,stderr=subprocess.STDOUT,check=True)
+    end_stage(st,rows=n)
+
+#The scaling_table function below sums the wall time of each stage (over the time windows) at each scale from the records of the runs (run ID -> scale)
+#and the benchmark's own records, and fits the scaling exponent of each stage.
+def scaling_table(reportfile,runs):
+    with open(reportfile) as f:
+        recs=pd.DataFrame([json.loads(l) for l in f])
+    recs=recs[recs.run.isin(list(runs)+[RUN_ID])&(recs.stage!='run')].copy()
+    recs['nodes']=recs.run.map(runs).fillna(recs.get('nodes',pd.Series(np.nan,index=recs.index)))
+    recs=recs[recs.nodes.notna()&(recs.stage!='total')]
+    table=recs.pivot_table(index=['program','stage'],columns='nodes',values='wall_s',aggfunc='sum',sort=False)
+    table.columns=[f'wall_s_{int(c)}' for c in table.columns]
+    slope=[]
+    for key,row in table.iterrows():
+        ok=row.notna()&(row>0)
+        x=np.log(np.array([float(c.split('_')[-1]) for c in row.index])[ok.values])
+        slope.append(np.polyfit(x,np.log(row[ok].astype(float)),1)[0] if ok.sum()>=2 else np.nan)
+    table['scaling_exponent']=np.round(slope,2)
+    return table
+
+#---------------Main Program Starts----------------#
+if __name__ == '__main__':
+    os.makedirs(BenchDir,exist_ok=True)
+    total=open_report(ReportFile,'SyCLoPS_benchmark',scales=Scales,nprocess=nprocess,answers=Answers,settings=ClassifierSettings,seed=Seed)
+    import SyCLoPS_Classifier as cls #Helper functions of the classifier (its main program does not run on import)
+    runs={}
+    for n in Scales:
+        rundir=os.path.join(BenchDir,f'n{n}')
+        if not os.path.exists(os.path.join(rundir,'out_track','ERA5_lpstracks.csv')):
+            print(f"\nWriting synthetic inputs of {n} nodes ...")
+            st=start_stage('synthetic_inputs',nodes=n)
+            nn,nb=synthetic_inputs(rundir,n,seed=Seed)
+            end_stage(st,rows=nn,blobs=nb)
+        print(f"Running the classifier on {n} nodes ...")
+        runs[RUN_ID+f'-n{n}']=n
+        run_classifier(rundir,RUN_ID+f'-n{n}')
+        print(f"Timing the helper functions on {n} nodes ...")
+        bench_helpers(cls,rundir,n)
+        if NodeFileMaxNodes is None or n<=NodeFileMaxNodes:
+            print(f"Running NodeFile_to_csv.py on {n} nodes ...")
+            bench_nodefile(rundir,n)
+    end_stage(total)
+    table=scaling_table(ReportFile,runs)
+    table.to_csv(ScalingFile)
+    pd.set_option('display.width',200)
+    print("\nWall time (s) of each stage by the number of LPS nodes, and the scaling exponent:\n")
+    print(table.to_string())
+    print("\nThe records of all stages (CPU time, peak memory, throughput) are in "+ReportFile+". The table is saved to "+ScalingFile)
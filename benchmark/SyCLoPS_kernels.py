@@ -0,0 +1,438 @@
+## SyCLoPS kernel checks: compares the array kernels of SyCLoPS_Classifier.py with the loops of the original classifier on small edge-case tracks
+# Please direct any questions to the author of this script: Yushan Han (yshhan@ucdavis.edu)
+# Each check runs a kernel and a transcription of the original per-node/groupby code (the baseline_* functions) on hand-made tracks that hit the
+# edge cases (single-node tracks, tracks at the dateline, runs at the track ends, no matching nodes) and on random tracks (Seed), and raises
+# AssertionError if they differ. Running this script runs all checks (no input files are needed).
+
+import os
+import sys
+import contextlib
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+RepoDir=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..')
+sys.path.append(RepoDir)
+with contextlib.redirect_stdout(None): #The classifier prints its introduction on import
+    import SyCLoPS_Classifier as C
+
+#--------Constants (Change Accordingly)--------#
+Seed=0
+NumRandomTracks=300 #Number of random tracks of each check
+ConvRates=[1,0.5,0.125] #convrate of 3-hourly, 6-hourly and daily tracks (with daily tracks, single-node tracks are kept)
+max_gap_hour=12
+
+#------------------Functions--------------------#
+#The random_tracks function below returns ntrack random-walk tracks of 1 to maxlen nodes (3-hourly, with a few jumps, gaps and dateline crossings),
+#with the rows in a random order.
+def random_tracks(rng,ntrack,maxlen=15):
+    n=rng.integers(1,maxlen+1,ntrack)
+    tid=np.repeat(np.arange(ntrack),n)
+    pos=np.arange(len(tid))-np.repeat(np.cumsum(n)-n,n)
+    step=rng.normal(0,1.5,(len(tid),2))*np.where(rng.random(len(tid))<0.05,8,1)[:,None] #(about 5% jumpy steps)
+    step[pos==0]=np.column_stack((rng.uniform(0,360,ntrack),rng.uniform(-70,70,ntrack)))
+    lonlat=np.concatenate([np.cumsum(s,axis=0) for s in np.split(step,np.cumsum(n)[:-1])])
+    hours=np.concatenate([np.cumsum(np.where(rng.random(k)<0.05,18,3)) for k in n]) #(about 5% gaps longer than max_gap_hour)
+    df=pd.DataFrame({'TID':tid,'HOURS':hours,'LON':lonlat[:,0]%360,'LAT':np.clip(lonlat[:,1],-89,89),
+                     'MSLPCC55':np.where(rng.random(len(tid))<0.8,200.,50.),'Tropical_Flag':(rng.random(len(tid))<0.5).astype(float)})
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+#The xyz function below converts longitudes and latitudes (degrees) to the spherical coordinates (X,Y,Z) of the KD-trees.
+def xyz(lon,lat):
+    lon=np.asarray(lon,dtype=float)*(np.pi/180);lat=np.asarray(lat,dtype=float)*(np.pi/180)
+    return np.column_stack((np.cos(lon)*np.cos(lat),np.sin(lon)*np.cos(lat),np.sin(lat)))
+
+#The baseline_pairing function below is the per-timestep blob pairing of the original classifier (a KD-tree per timestep, blob by blob).
+#It returns the paired node index of each blob (-1 if unpaired).
+def baseline_pairing(dfin0,dfblob):
+    X,Y,Z=xyz(dfin0.LON,dfin0.LAT).T;Xb,Yb,Zb=xyz(dfblob.centlon,dfblob.centlat).T
+    NodeTimeidx=dfin0.groupby(dfin0['HOURS'])['ind'].apply(list)
+    paired=np.full(len(dfblob),-1)
+    for t,BlobTimeidx in dfblob.groupby('time').groups.items():
+        if t not in NodeTimeidx.index:
+            continue
+        NodeTimeArr=np.array(NodeTimeidx.loc[t])
+        T=cKDTree(list(zip(X[NodeTimeArr],Y[NodeTimeArr],Z[NodeTimeArr])))
+        dft=dfin0.iloc[NodeTimeArr]
+        for i2 in BlobTimeidx:
+            idx=T.query_ball_point((Xb[i2],Yb[i2],Zb[i2]),r=5*(np.pi/180))
+            if len(idx)>1:
+                paired[i2]=dfin0.MSLP.iloc[NodeTimeArr[idx]].idxmin()
+            elif len(idx)==1:
+                paired[i2]=NodeTimeArr[idx[0]]
+            else:
+                if dfblob.maxlon[i2]-dfblob.minlon[i2]>180:
+                    nid=dft[((dft.LON>=350)&(dft.LON<360))|((dft.LON>=0)&(dft.LON<=10))\
+                        &(dft.LAT>=dfblob.minlat[i2])&(dft.LAT<=dfblob.maxlat[i2])].index.values
+                else:
+                    nid=dft[(dft.LON>=dfblob.minlon[i2])&(dft.LON<=dfblob.maxlon[i2])\
+                        &(dft.LAT>=dfblob.minlat[i2])&(dft.LAT<=dfblob.maxlat[i2])].index.values
+                if len(nid)>0:
+                    paired[i2]=dfin0.MSLP.iloc[nid].idxmin()
+    return paired
+
+#The check_blobpairing function below checks blobpairing_batch against baseline_pairing: no nodes or no blobs, timesteps with blobs but no nodes,
+#a blob and a node on either side of 0E, a blob across 0E paired by its extent (the 350-360E band of the original is not bounded by latitude)
+#and random nodes and blobs. Ties in MSLP (a known difference from the original) are checked to go to the smaller node index.
+def check_blobpairing(rng):
+    node=lambda h,lon,lat,mslp: pd.DataFrame({'HOURS':h,'LON':lon,'LAT':lat,'MSLP':mslp})
+    blob=lambda t,lon,lat,ext: pd.DataFrame({'time':t,'centlon':lon,'centlat':lat,'minlat':np.asarray(lat)-ext,'maxlat':np.asarray(lat)+ext,
+                                               'minlon':np.asarray(lon)-ext,'maxlon':np.asarray(lon)+ext})
+    cases=[(node([],[],[],[]),blob([0],[10.],[10.],1.)),
+           (node([0],[10.],[10.],[1e5]),blob([],[],[],1.)),
+           (node([0,0,3],[10.,12,10],[10.,10,10],[1e5,99000,98000]),blob([0,3,6],[11.,10.5,10],[10.,10,10],1.)), #No nodes at hour 6
+           (node([0,0],[359.5,20],[0.,0],[1e5,99000]),blob([0,0],[0.5,20],[0.,40],1.)), #Across 0E by distance
+           (node([0,0,0],[352.,3,180],[60.,-20,-20],[99000,1e5,98000]),
+            pd.DataFrame({'time':[0],'centlon':[180.],'centlat':[40.],'minlat':[-30.],'maxlat':[-10.],'minlon':[0.],'maxlon':[359.75]}))] #Across 0E by extent
+    nt=40;ut=np.arange(nt)*3
+    nn=rng.integers(0,12,nt);nb=rng.integers(0,30,nt)
+    lon=rng.uniform(0,360,nn.sum());lat=rng.uniform(-80,80,nn.sum())
+    near=np.concatenate([rng.integers(a,b,k) if b>a else np.full(k,-1) for a,b,k in zip(np.cumsum(nn)-nn,np.cumsum(nn),nb)]) #A node of the blob's timestep
+    blon=np.where(near>=0,lon[near]+rng.normal(0,6,nb.sum()),rng.uniform(0,360,nb.sum()))%360
+    blat=np.clip(np.where(near>=0,lat[near]+rng.normal(0,6,nb.sum()),0),-89,89)
+    cases.append((node(np.repeat(ut,nn),lon,lat,rng.uniform(95000,102000,nn.sum())),blob(np.repeat(ut,nb),blon,blat,rng.uniform(0.5,20,nb.sum()))))
+    for i,(dfn,dfb) in enumerate(cases):
+        dfn=dfn.assign(ind=np.arange(len(dfn)));dfb=dfb.reset_index(drop=True)
+        got=C.blobpairing_batch(dfn,dfb,xyz(dfn.LON,dfn.LAT),xyz(dfb.centlon,dfb.centlat))
+        np.testing.assert_array_equal(got,baseline_pairing(dfn,dfb),err_msg=f"blobpairing_batch, case {i}: paired nodes")
+    dfn=node([0,0,0],[10.,11,12],[0.,0,0],[99000,98000,98000]).assign(ind=np.arange(3));dfb=blob([0],[11.],[0.],1.)
+    assert list(C.blobpairing_batch(dfn,dfb,xyz(dfn.LON,dfn.LAT),xyz(dfb.centlon,dfb.centlat)))==[1],"Ties in MSLP must go to the smaller node index"
+
+#The baseline_kinematics function below is the jumpy node removal and track splitting of the original classifier (groupby shifts on the sorted table).
+#It returns the rows of df of the kept nodes in order, their TIDs, distance, direction and distance_2steps.
+def baseline_kinematics(df,convrate,range_dist):
+    dfin=df.copy();dfin['row']=np.arange(len(dfin))
+    dfin['ISOTIME']=pd.to_datetime(dfin.HOURS,unit='h')
+    dfin = dfin.sort_values(by=['TID', 'ISOTIME'])
+    dfin['prev_lat'] = dfin.groupby('TID')['LAT'].shift(1)
+    dfin['prev_lon'] = dfin.groupby('TID')['LON'].shift(1)
+    dfin['distance'] = C.haversine(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
+    dfin['direction'] = C.calculate_bearing(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
+    dfin['prev_lat'] = dfin.groupby('TID')['LAT'].shift(2)
+    dfin['prev_lon'] = dfin.groupby('TID')['LON'].shift(2)
+    dfin['distance_2steps'] = C.haversine(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
+    dist_shift1 = dfin.groupby('TID')['distance'].shift(1)
+    dir_shift1 = dfin.groupby('TID')['direction'].shift(1)
+    dist_shift_s1 = dfin.groupby('TID')['distance_2steps'].shift(-1)
+    dist_shift_n1 = dfin.groupby('TID')['distance'].shift(-1)
+    dist_shift_n2 = dfin.groupby('TID')['distance'].shift(-2)
+    jumpy_mask = (dfin['distance'] > 3 * dist_shift_s1) & (dfin['distance'] > 333)| \
+    (dist_shift_n1 > 3 * dist_shift_s1) & (dist_shift_n1 > 333)| \
+    (dfin['distance'] > 3 * dist_shift1) & ((dfin['direction'] - dir_shift1).abs() > 90) & (dfin['distance'] > 333) | \
+    ((dfin['distance'] > 3 * dist_shift1) & (dist_shift_n1 > 3 * dist_shift_n2) & (dfin['distance'] > 333))| \
+    ((dfin['distance'] > 5 * dist_shift1) & (dfin['distance'] > 5 * dist_shift_n1) & (dfin['distance'] > 333/convrate))
+    dfin = dfin[~jumpy_mask].copy()
+    dfin = dfin.sort_values(by=['TID', 'ISOTIME'])
+    dfin['prev_lat'] = dfin.groupby('TID')['LAT'].shift(1)
+    dfin['prev_lon'] = dfin.groupby('TID')['LON'].shift(1)
+    dfin['distance'] = C.haversine(dfin['prev_lat'], dfin['prev_lon'], dfin['LAT'], dfin['LON'])
+    time_shift1 = dfin.groupby('TID')['ISOTIME'].shift(1)
+    time_gap = (dfin['ISOTIME'] - time_shift1).dt.total_seconds() / 3600
+    dfin['split'] = (((dfin['distance'] > 333/convrate) & (dfin['Tropical_Flag'] == 1)) | (time_gap > max_gap_hour) | (dfin['distance'] > range_dist*111)).astype(int)
+    dfin['sub_tid'] = dfin.groupby('TID')['split'].cumsum()
+    dfin['TID'] = dfin.groupby(['TID', 'sub_tid']).ngroup()
+    track_counts = dfin[dfin['MSLPCC55'] > 100].groupby('TID').size()
+    valid_tids = track_counts[track_counts >= round(7*convrate+0.01)].index
+    dfin = dfin[dfin['TID'].isin(valid_tids)].copy()
+    dfin['TID'] = dfin.groupby('TID').ngroup()
+    return tuple(dfin[c].to_numpy() for c in ['row','TID','distance','direction','distance_2steps'])
+
+#The check_track_kinematics function below checks track_kinematics against baseline_kinematics: an empty catalog, a single-node track, a track that
+#crosses 0E, a jumpy node, a gap longer than max_gap_hour, a tropical jump that splits a track, a track with too few MSLPCC55>100 nodes and random tracks.
+def check_track_kinematics(rng):
+    n=10;hours=3.*np.arange(n)
+    cases=[pd.DataFrame({'TID':np.array([],dtype=int),'HOURS':[],'LON':[],'LAT':[],'MSLPCC55':[],'Tropical_Flag':[]}),
+           pd.DataFrame({'TID':[0,1,1,1,1,1],'HOURS':[0.,0,3,6,9,12],'LON':[10.,20,21,22,23,24],'LAT':10.,'MSLPCC55':200.,'Tropical_Flag':0.}),
+           pd.DataFrame({'TID':0,'HOURS':hours,'LON':(355+np.arange(n))%360,'LAT':-5.,'MSLPCC55':200.,'Tropical_Flag':1.}), #Across 0E
+           pd.DataFrame({'TID':0,'HOURS':hours,'LON':100+np.arange(n)+np.where(np.arange(n)==5,12,0),'LAT':30.,'MSLPCC55':200.,'Tropical_Flag':0.}), #Jumpy node
+           pd.DataFrame({'TID':0,'HOURS':hours+np.where(np.arange(n)>=5,12,0),'LON':100+np.arange(n),'LAT':30.,'MSLPCC55':200.,'Tropical_Flag':0.}), #Gap
+           pd.DataFrame({'TID':0,'HOURS':hours,'LON':100+np.arange(n)+np.where(np.arange(n)>=5,3.5,0),'LAT':10.,'MSLPCC55':200.,'Tropical_Flag':1.}), #Tropical jump
+           pd.DataFrame({'TID':0,'HOURS':hours,'LON':100+np.arange(n),'LAT':10.,'MSLPCC55':np.where(np.arange(n)<6,200.,50.),'Tropical_Flag':0.})] #Few MSLPCC55>100
+    cases.append(random_tracks(rng,NumRandomTracks))
+    for convrate in ConvRates:
+        range_dist=4.0/convrate
+        for i,df in enumerate(cases):
+            got=C.track_kinematics(df.TID.to_numpy(),df.HOURS.to_numpy(),df.LAT.to_numpy(),df.LON.to_numpy(),df.MSLPCC55.to_numpy(),
+                                   df.Tropical_Flag.to_numpy(),convrate,range_dist,max_gap_hour)
+            want=baseline_kinematics(df,convrate,range_dist)
+            for name,a,b in zip(['rows','TID','distance','direction','distance_2steps'],got,want):
+                np.testing.assert_array_equal(a,b,err_msg=f"track_kinematics, case {i}, convrate {convrate}: {name}")
+
+#The random_labels function below returns random short labels and Tropical_Flag values for the nodes of ntrack tracks of 1 to maxlen nodes
+#(TID sorted), drawn from labels with runs of about runlen nodes, so that the tracks have TC periods, breaks and transitions.
+def random_labels(rng,ntrack,labels,maxlen=20,runlen=3):
+    n=rng.integers(1,maxlen+1,ntrack)
+    tid=np.repeat(np.arange(ntrack),n)
+    change=rng.random(len(tid))<1/runlen
+    lab=np.array(labels,dtype=object)[rng.integers(0,len(labels),len(tid))]
+    lab=lab[np.maximum.accumulate(np.where(change,np.arange(len(tid)),0))] #(runs of labels)
+    trop=(rng.random(len(tid))<0.6).astype(float)
+    return tid,lab,trop
+
+#The baseline_transitions function below is the EXT and TT node identification of the original classifier (track by track on the node table).
+#Where the original raised KeyError (the node 2*convrate steps before the last TC node is before the track start), no EXT node is given.
+def baseline_transitions(tid,labels,trop,atctrack,htctrack,convrate):
+    dfin=pd.DataFrame({'TID':tid,'Short_Label':labels,'Tropical_Flag':trop})
+    dftc=dfin[dfin.TID.isin(atctrack)]
+    dfhtc=dfin[dfin.TID.isin(htctrack)]
+    extflag_list = []
+    for i in atctrack:
+        df0=dftc[dftc.TID==i]
+        lst_tc=df0[df0.Short_Label.str.contains('TC')].index[-1]
+        dfe=df0.loc[lst_tc+1:lst_tc+round(6*convrate)]
+        dfe=dfe[(dfe.Tropical_Flag==0) & ~(dfe.Short_Label.str.contains('DS'))]
+        if not dfe.empty and lst_tc-2*convrate in df0.index:
+            if df0.loc[lst_tc-2*convrate,'Tropical_Flag']==1:
+                extflag_list.append(dfe.index[0])
+    for i in htctrack:
+        df0=dfhtc[dfhtc.TID==i]
+        lst_htc=df0[df0.Short_Label.str.contains('HTC|TC')].index[-1]
+        dfe=df0.loc[lst_htc+1:lst_htc+round(6*convrate)]
+        dfe=dfe[(dfe.Tropical_Flag==0) & ~(dfe.Short_Label.str.contains('DS'))]
+        if not dfe.empty and lst_htc-2*convrate in df0.index:
+            if df0.loc[lst_htc-2*convrate,'Tropical_Flag']==1:
+                extflag_list.append(dfe.index[0])
+    extflag=np.array(extflag_list,dtype=int) #(The original np.array(extflag_list) is float if it is empty, so its track_label[extflag] raised IndexError)
+    ttflag=np.zeros(len(atctrack)).astype(int)-1
+    for c, i in enumerate(atctrack):
+        df0=dftc[dftc.TID==i]
+        fst_tc=df0[(df0.Short_Label.str.contains('TC|HTC'))].index[0]
+        dftc_pre=df0.loc[:fst_tc-1]
+        if np.any(dftc_pre.Tropical_Flag==0):
+            ttflag[c]=fst_tc
+    ttflag= np.delete(ttflag, np.argwhere(ttflag==-1))
+    return extflag,ttflag
+
+#The check_transition_flags function below checks transition_flags against baseline_transitions: no TC-like tracks, TC-like tracks without EXT
+#nodes (the extflag array must be an integer array that can index the nodes), a last TC node at the start or at the end of its track,
+#a lookahead window that would run into the next track, HTC tracks (their EXT nodes are listed twice) and random tracks.
+def check_transition_flags(rng):
+    T='TC';X='EX';D='DSE'
+    cases=[([],[],[],[],[]),
+           ([0,0,0,1,1],['EX','TC','TC','EX','DSD'],[0,1,1,0,0],[],[]), #No TC-like tracks
+           ([0]*6,[T,T,T,T,T,'TD'],[1]*6,[0],[]), #No EXT node (all tropical)
+           ([0]*5+[1]*5,[T,X,X,X,X]+[X,X,X,X,X],[1,0,0,0,0]+[0]*5,[0],[]), #Last TC node at the track start
+           ([0]*5+[1]*5,[X,T,T,T,T]+[X,X,X,X,X],[0,1,1,1,1]+[0]*5,[0],[]), #Last TC node at the track end (the window would run into the next track)
+           ([0]*8,[X,'HTC',T,'HTC','HTC',D,X,X],[0,1,1,1,1,0,0,0],[0],[0]), #HTC track with a DS node in the window
+           ([0]*6+[1]*6,[T,T,T,D,D,X]+['HTC']*3+[X]*3,[1]*3+[0]*3+[1]*3+[0]*3,[0,1],[1])]
+    tid,lab,trop=random_labels(rng,NumRandomTracks,['TC','HTC','TD','EX','DSE','DSD','TLO'])
+    tc=pd.Series(lab).str.contains('TC').to_numpy()
+    withtc=np.unique(tid[tc])
+    atc=np.sort(rng.choice(withtc,len(withtc)//2,replace=False));cases.append((tid,lab,trop,atc,atc[rng.random(len(atc))<0.3]))
+    for convrate in ConvRates[:2]: #(With daily tracks, 2*convrate is not a whole number of nodes, and the original loop raised KeyError at every EXT candidate)
+        for i,(tid,lab,trop,atc,htc) in enumerate(cases):
+            tid=np.asarray(tid,dtype=int);lab=np.asarray(lab,dtype=object);trop=np.asarray(trop,dtype=float)
+            atc=np.asarray(atc,dtype=int);htc=np.asarray(htc,dtype=int)
+            istc=pd.Series(lab,dtype=object).str.contains('TC').to_numpy(dtype=bool)
+            isds=pd.Series(lab,dtype=object).str.contains('DS').to_numpy(dtype=bool)
+            ext,tt=C.transition_flags(tid,istc,isds,trop,atc,htc,convrate)
+            want=baseline_transitions(tid,lab,trop,atc,htc,convrate)
+            assert ext.dtype.kind=='i' and tt.dtype.kind=='i',"EXT and TT nodes must be integer node indices (also when there are none)"
+            np.zeros(len(tid),dtype=np.uint8)[ext]|=C.TRACK_FLAGS['EXT'] #(the Track_Info update of track_labels)
+            np.testing.assert_array_equal(ext,want[0],err_msg=f"transition_flags, case {i}, convrate {convrate}: EXT nodes")
+            np.testing.assert_array_equal(tt,want[1],err_msg=f"transition_flags, case {i}, convrate {convrate}: TT nodes")
+
+#The baseline_smoothing function below is the label smoothing of the original classifier (window by window over the nodes of each TC-like and MS track).
+#It returns the adjusted short labels.
+def baseline_smoothing(tid,labels,mslp,atctrack,mstrack,convrate):
+    dfin=pd.DataFrame({'TID':tid,'Short_Label':labels,'MSLP':mslp})
+    dftc=dfin[dfin.TID.isin(atctrack)]
+    labels0=dfin.Short_Label.values
+    labels=dfin.Short_Label.values.copy()
+    fi=dftc.groupby('TID').head(1).index
+    li=dftc.groupby('TID').tail(1).index
+    for j in range(1,round(8*convrate+1)):
+        for k in range(len(fi)):
+            for i in range(fi[k]+j, li[k]-j+1):
+                if (
+                    all('TD' in label for label in labels0[i:i+j]) and
+                    all('TC' in label for label in labels0[i-j:i]) and
+                    all('TC' in label for label in labels0[i+j:i+2*j])
+                ):
+                    mslp_values= dftc.MSLP.loc[i-1:i+j].values
+                    mslp_int = np.linspace(mslp_values[0], mslp_values[-1], j+2)
+                    if abs(mslp_values-mslp_int).max() <= 500:
+                        labels[i:i+j] = 'TC'
+    dfms = dfin[dfin.TID.isin(mstrack)]
+    fi=dfms.groupby('TID').head(1).index
+    li=dfms.groupby('TID').tail(1).index
+    for j in range(1,round(8*convrate+1)):
+        for k in range(len(fi)):
+            for i in range(fi[k]+j, li[k]-j+1):
+                if (
+                    all((label == 'TD' or label == 'TLO') for label in labels[i:i+j]) and
+                    all('M' in label for label in labels[i-j:i]) and
+                    all('M' in label for label in labels[i+j:i+2*j])
+                ):
+                    mslp_values= dfms.MSLP.loc[i-1:i+j].values
+                    mslp_int = np.linspace(mslp_values[0], mslp_values[-1], j+2)
+                    if abs(mslp_values-mslp_int).max() <= 500:
+                        for idx in range(i, i+j):
+                            if labels[idx] == 'TD':
+                                labels[idx] = 'TD(MD)'
+                            elif labels[idx] == 'TLO':
+                                labels[idx] = 'TLO(ML)'
+    return np.asarray(labels,dtype=object)
+
+#The check_smooth_labels function below checks smooth_labels against baseline_smoothing: no TC-like or MS tracks, runs at the start and at the end
+#of a track (with the right-hand nodes in the next track or past the last node), a run of round(8*convrate) nodes, an MSLP deviation over 500 Pa,
+#HTC and monsoonal nodes around the runs and random tracks.
+def check_smooth_labels(rng):
+    T='TC';D='TD';M='TD(MD)';L='TLO';E='EX'
+    flat=lambda k: [100000.]*k
+    cases=[([],[],[],[],[]),
+           ([0]*5,[T,D,T,E,E],flat(5),[],[]), #No TC-like or MS tracks
+           ([0]*5+[1]*3,[D,T,T,D,T]+[T,T,E],flat(8),[0],[]), #Run at the track start, and a run whose right-hand node is the last of its track
+           ([0]*5+[1]*3,[T,T,D,D,T]+[T,E,E],flat(8),[0],[]), #The right-hand nodes of a run of two continue into the next track
+           ([0]*6,[T,T,T,D,D,D],flat(6),[0],[]), #Run at the end of the nodes
+           ([0]*6,[E,T,D,D,T,T],flat(6),[0],[]), #Run of two sandwiched by the track's own nodes
+           ([0]*18,[T]*8+[D]*8+[T,T],flat(18),[0],[]), #Run of eight nodes (only the shorter lookahead of the last nodes)
+           ([0]*5,[T,D,D,T,T],[100000.,99000,100200,100000,100000],[0],[]), #MSLP deviation over 500 Pa
+           ([0]*7,['HTC',D,'HTC',M,L,M,'TLO(ML)'],flat(7),[0],[0]), #HTC nodes around a TD run, and a TLO run in an MS track
+           ([0]*7,[M,D,L,M,M,'TLO(ML)',L],flat(7),[],[0])] #TD/TLO runs of one and two nodes in an MS track
+    tid,lab,trop=random_labels(rng,NumRandomTracks,['TC','TD','HTC','TD(MD)','TLO','TLO(ML)','EX'],maxlen=30,runlen=2)
+    mslp=100000+np.cumsum(rng.normal(0,150,len(tid)))
+    ut=np.unique(tid);cases.append((tid,lab,mslp,ut[rng.random(len(ut))<0.5],ut[rng.random(len(ut))<0.5]))
+    for convrate in ConvRates:
+        for i,(tid,lab,mslp,atc,ms) in enumerate(cases):
+            tid=np.asarray(tid,dtype=int);lab=np.asarray(lab,dtype=object);mslp=np.asarray(mslp,dtype=float)
+            code=np.array([C.LABEL_CODE[l] for l in lab],dtype=np.int8)
+            got=C.SHORT_LABELS[C.smooth_labels(code,tid,mslp,np.asarray(atc,dtype=int),np.asarray(ms,dtype=int),convrate)]
+            want=baseline_smoothing(tid,lab,mslp,atc,ms,convrate)
+            np.testing.assert_array_equal(got,want,err_msg=f"smooth_labels, case {i}, convrate {convrate}: Adjusted_Label")
+
+#The baseline_labels function below is the decision tree of the original classifier (node masks assigned branch by branch, later ones overwriting
+#earlier ones) on the boolean node conditions c (keyed by the condition names of LABEL_RULES). tlc=False is the extratropical branch of modes 2 and 3.
+#It returns the short labels and the full names.
+def baseline_labels(c,tlc=True):
+    Full_Name=np.array(["Non-labeled"]*len(c['hal']),dtype=object)
+    short_label=np.array(["NLB"]*len(c['hal']),dtype=object)
+    hal,dry,cv,trop,trop_htc,tc,td,md,sc=(c[k] for k in ['hal','dry','cv','trop','trop_htc','tc','td','md','sc'])
+    lowtk=c['lowtk'];midupptk=c['midupptk']
+    def assign(mask,short,full):
+        Full_Name[mask]=full;short_label[mask]=short
+    ## High-altitude Branch Labeling
+    assign(hal & midupptk,"HATHL","High-altitude Thermal Low")
+    assign(hal & ~midupptk,"HAL","High-altitude Low")
+    ## Dryness Branch Labeling
+    assign(~hal & dry & ~lowtk,"DSD","Dry Disturbance")
+    assign(~hal & dry & lowtk & cv,"DOTHL","Deep (Orographic) Thermal Low")
+    assign(~hal & dry & lowtk & ~cv,"THL","Thermal Low")
+    ## Tropical Branch Labeling
+    assign(~hal & ~dry & trop & ~cv,"DST","Tropical Disturbance")
+    assign(~hal & ~dry & cv & trop & tc,"TC","Tropical Cyclone")
+    assign(~hal & ~dry & cv & trop & ~tc & td & md,"TD(MD)","Tropical Depression(Monsoon Depression)")
+    assign(~hal & ~dry & cv & trop & ~tc & td & ~md,"TD","Tropical Depression")
+    assign(~hal & ~dry & cv & trop & ~tc & ~td & md,"TLO(ML)","Tropical Low (Monsoon Low)")
+    assign(~hal & ~dry & cv & trop & ~tc & ~td & ~md,"TLO","Tropical Low")
+    ## Extratropical Branch Labeling
+    assign(~hal & ~dry & ~trop & ~cv,"DSE","Extratropical Disturbance")
+    if not tlc:
+        assign(~hal & ~dry & ~trop & cv & sc,"SC","Subtropical Cyclone")
+        assign(~hal & ~dry & ~trop & cv & ~sc,"EX","Extratropical Cyclone")
+    else:
+        assign(~hal & ~dry & ~trop & cv & c['stlc'] & c['tlc'],"SS(STLC)","Subtropical Tropical-like Cyclone (Subtropical Storm)")
+        assign(~hal & ~dry & ~trop & cv & c['pl'] & c['tlc'],"PL(PTLC)","Polar Low (Polar Tropical-like Cyclone)")
+        assign(~hal & ~dry & ~trop & cv & ~c['tlc'] & sc,"SC","Subtropical Cyclone")
+        assign(~hal & ~dry & ~trop & cv & ~c['tlc'] & ~sc,"EX","Extratropical Cyclone")
+    #Hybrid TC labeling
+    assign(~hal & ~dry & cv & trop_htc & ~trop & tc,"HTC","Hybrid Tropical Cyclone")
+    return short_label,Full_Name
+
+#The check_classify_nodes function below checks classify_nodes against baseline_labels on every combination of the node conditions
+#(with the TLC Condition, and with it all False as in modes 2 and 3) and on an empty catalog.
+def check_classify_nodes(rng):
+    names=sorted({c.lstrip('~') for lab,cs in C.LABEL_RULES for c in cs})
+    combos=np.arange(2**len(names))
+    for tlc in [True,False]:
+        for n in [0,len(combos)]:
+            c={k:((combos[:n]>>i)&1).astype(bool) for i,k in enumerate(names)}
+            if not tlc:
+                c['tlc']=np.zeros(n,dtype=bool)
+            code,bits,cnames=C.classify_nodes(c)
+            short,full=baseline_labels(c,tlc)
+            assert code.dtype==np.int8 and len(code)==n
+            np.testing.assert_array_equal(C.SHORT_LABELS[code],short,err_msg=f"classify_nodes, TLC Condition {tlc}: Short_Label")
+            np.testing.assert_array_equal(C.FULL_NAMES[code],full,err_msg=f"classify_nodes, TLC Condition {tlc}: full names")
+
+#The baseline_track_info function below is the track labeling of the original classifier: TC, HTC, MS, STLC, PL and QS tracks from grouped node
+#counts, and the Track_Info strings of the nodes with the EXT and TT nodes of baseline_transitions. tlc and qs tell whether the mode has TLC and QS tracks.
+def baseline_track_info(tid,c,trop,dfinfo,convrate,tlc,qs):
+    dfin=pd.DataFrame({'TID':tid,'LON':0.})
+    short,full=baseline_labels(c,tlc)
+    base=~c['hal'] & ~c['dry'] & c['cv']
+    df_tc=dfin[base & c['trop'] & c['tc']]
+    df_adj_tc=dfin[base & c['trop_htc'] & c['tc']]
+    df_ms=dfin[base & c['trop'] & ~c['tc'] & c['md']]
+    tctrack=pd.unique(df_tc.TID)[df_tc.groupby('TID')['LON'].count()>=round(8*convrate)]
+    atctrack=pd.unique(df_adj_tc.TID)[df_adj_tc.groupby('TID')['LON'].count()>=round(8*convrate)]
+    htctrack=np.setdiff1d(atctrack,tctrack)
+    mstrack=pd.unique(df_ms.TID)[df_ms.groupby('TID')['LON'].count()>=round(10*convrate)]
+    track_label=np.array(["Track"]*len(dfin),dtype=object)
+    track_label[dfin.TID.isin(tctrack).to_numpy()]+='_TC'
+    track_label[dfin.TID.isin(htctrack).to_numpy()]+='_HT'
+    track_label[dfin.TID.isin(mstrack).to_numpy()]+='_MS'
+    if tlc:
+        df_tlc=dfin[~c['hal'] & ~c['dry'] & ~c['trop'] & c['cv'] & c['tlc']]
+        tlctrack=pd.unique(df_tlc.TID)[df_tlc.groupby('TID')['LON'].count()>=round(2*convrate)]
+        track_label[dfin.TID.isin(np.intersect1d(tlctrack,pd.unique(df_tlc[c['stlc'][df_tlc.index]].TID))).to_numpy()]+='_SS(STLC)'
+        track_label[dfin.TID.isin(np.intersect1d(tlctrack,pd.unique(df_tlc[c['pl'][df_tlc.index]].TID))).to_numpy()]+='_PL(PTLC)'
+    extflag,ttflag=baseline_transitions(tid,short,trop,np.asarray(atctrack,dtype=int),htctrack.astype(int),convrate)
+    track_label[np.unique(extflag)]+='_EXT'
+    track_label[ttflag]+='_TT'
+    if qs:
+        qstrack=pd.unique(dfinfo[(dfinfo["Track Linearity"]<0.55)&(dfinfo["Track Spread"]<3)&(dfinfo["Track Inland Ratio"]>0.65)].TID)
+        track_label[dfin.TID.isin(qstrack).to_numpy()]+='_QS'
+    return track_label
+
+#The random_conditions function below returns the TIDs (sorted) and the boolean node conditions of ntrack tracks of 1 to maxlen nodes. Each track
+#draws its conditions with its own probabilities, so that some tracks have enough TC, HTC, MS or TLC nodes to be tagged.
+def random_conditions(rng,ntrack,maxlen=30):
+    names=sorted({c.lstrip('~') for lab,cs in C.LABEL_RULES for c in cs})
+    n=rng.integers(1,maxlen+1,ntrack)
+    tid=np.repeat(np.arange(ntrack),n)
+    prob=rng.choice([0.05,0.5,0.95],(ntrack,len(names)),p=[0.4,0.2,0.4])
+    for k in ['hal','dry']: #(fewer high-altitude and dry tracks)
+        prob[:,names.index(k)]=np.minimum(prob[:,names.index(k)],0.05)
+    c=dict(zip(names,(rng.random((len(tid),len(names)))<prob[tid]).T))
+    return tid,c
+
+#The check_track_labels function below checks track_labels (with the QS tags of flush_windows) against baseline_track_info in the four modes:
+#an empty catalog, single-node tracks, tracks with one node fewer than and exactly the TC track threshold, no TC-like tracks (so no EXT node)
+#and random tracks. The Track_Info bitmask must give the strings of the original (track_info_strings), and the strings must give the bitmask back.
+def check_track_labels(rng):
+    names=sorted({c.lstrip('~') for lab,cs in C.LABEL_RULES for c in cs})
+    def tracks(tid,on):
+        tid=np.asarray(tid,dtype=int)
+        return tid,{k:np.asarray(on.get(k,np.zeros(len(tid),dtype=bool)),dtype=bool) for k in names}
+    tcnode=lambda m: {'cv':m,'trop':m,'trop_htc':m,'tc':m}
+    cases=[tracks([],{}),
+           tracks([0,1,2],tcnode(np.ones(3,dtype=bool))), #Single-node tracks
+           tracks([0]*7+[1]*8,tcnode(np.ones(15,dtype=bool))), #7 and 8 TC nodes
+           tracks([0]*10+[1]*3,{'cv':np.ones(13,dtype=bool),'trop':np.ones(13,dtype=bool),'md':np.ones(13,dtype=bool)})] #MS nodes, no TC-like tracks
+    cases.append(random_conditions(rng,NumRandomTracks))
+    C.data250='N'
+    for convrate in ConvRates[:2]:
+        for modenum in range(4):
+            C.convrate=convrate;C.modenum=modenum
+            for i,(tid,c) in enumerate(cases):
+                c=dict(c,tlc=c['tlc'] if modenum<2 else np.zeros(len(tid),dtype=bool))
+                ut=np.unique(tid)
+                dfinfo=pd.DataFrame({'TID':ut,'Track Linearity':rng.uniform(0,1,len(ut)),'Track Spread':rng.uniform(0,6,len(ut)),'Track Inland Ratio':rng.uniform(0,1,len(ut))})
+                trop=np.where(c['trop']|(c['trop_htc']&c['tc']),1.,0.) #(HTC nodes are tropical, see the main classification)
+                code,bits,cnames=C.classify_nodes(c)
+                info,atctrack,mstrack,qstrack=C.track_labels(tid,code,bits,cnames,trop,dict(C.THRESHOLDS),dfinfo if modenum%2==0 else None)
+                if modenum==0 or modenum==2: #(QS tags are added by flush_windows)
+                    info=info|(C.TRACK_FLAGS['QS']*np.isin(tid,qstrack)).astype(np.uint8)
+                want=baseline_track_info(tid,c,trop,dfinfo,convrate,modenum<2,modenum%2==0)
+                assert info.dtype==np.uint8
+                np.testing.assert_array_equal(C.track_info_strings(info),want,err_msg=f"track_labels, case {i}, mode {modenum}, convrate {convrate}: Track_Info")
+                back=sum(pd.Series(want,dtype=object).str.contains('_'+tag,regex=False).to_numpy()*flag for tag,flag in C.TRACK_FLAGS.items())
+                np.testing.assert_array_equal(np.asarray(back,dtype=np.uint8).reshape(-1),info,err_msg=f"TRACK_FLAGS, case {i}: Track_Info strings to bitmask")
+
+#---------------Main Program Starts----------------#
+#Running this script runs all checks.
+if __name__ == '__main__':
+    rng=np.random.default_rng(Seed)
+    for check in [check_blobpairing,check_track_kinematics,check_transition_flags,check_smooth_labels,check_classify_nodes,check_track_labels]:
+        check(rng)
+        print(check.__name__+" passed.")
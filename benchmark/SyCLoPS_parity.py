@@ -0,0 +1,223 @@
+## SyCLoPS parity: checks that a candidate version of SyCLoPS_Classifier.py reproduces the catalogs of a reference version on the same inputs
+# Please direct any questions to the author of this script: Yushan Han (yshhan@ucdavis.edu)
+# The reference and the candidate are git revisions of the repository (e.g., 'HEAD~1' or a tag) or paths to classifier scripts;
+# Candidate=None is the classifier in the working tree. Both are run on the same StitchNodes/BlobStats inputs (DataDir, or synthetic inputs
+# written by SyCLoPS_synthetic.py), and their input and classified catalogs are compared node by node (matched by KeyColumns).
+# Short_Label, Adjusted_Label, Track_Info and LPSAREA (GoldenColumns) and the StitchNodes input columns must match exactly. Other float columns may be
+# given a tolerance in Tolerances.
+# To switch in a faster implementation one stage at a time (e.g., blob pairing, zsper, jumpy filtering or label smoothing), commit the stage and run
+# this script with the previous revision as the reference (python SyCLoPS_parity.py <reference revision> sets Reference). Mismatches are printed per column with node and track context and saved to MismatchFile.
+# With AppendTime, the candidate classifies the tracks cut at that time and then extends its catalogs in the append mode (AppendMode) with the whole
+# inputs, and the extended catalogs are compared with a whole run of the reference (e.g., Reference=Candidate=None to check the append mode itself).
+# The append mode reproduces the QS tags (Track_Info) of a whole run only with QSTrackMapping=True in both ReferenceSettings and CandidateSettings.
+# The script exits with status 1 if any column mismatches.
+# Known differences from the original per-node classifier (expected mismatches against it, none between later revisions):
+# blob pairing breaks ties in MSLP by the smaller node index, where the original per-timestep loop took the first node in the KD-tree ball query order.
+# QSTrackMapping=True (off by default) moves the QS tags in Track_Info onto the tracks split from the QS tracks of StitchNodes.
+# LowMemory=True in only one of ReferenceSettings and CandidateSettings: the float columns are float32 in the low-memory mode, so they differ by float32
+# rounding (and labels may differ where a value lies within rounding of a threshold). Such mismatches are counted and noted as 'float32 rounding (LowMemory)'.
+
+import os
+import re
+import sys
+import glob
+import shutil
+import subprocess
+import contextlib
+import numpy as np
+import pandas as pd
+RepoDir=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..')
+sys.path.append(RepoDir);sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from SyCLoPS_synthetic import synthetic_inputs
+from SyCLoPS_benchmark import script_copy
+
+#--------Constants (Change Accordingly)--------#
+Reference='HEAD~1' #A git revision (branch, tag or commit) or the path of a classifier script: the version before the change to check. The first argument of the script overrides it.
+Candidate=None #A git revision or the path of a classifier script. None is SyCLoPS_Classifier.py in the working tree.
+ReferenceSettings={'nprocess':4} #Constants of the reference script to set for the run (e.g., {'nprocess':4})
+CandidateSettings={'nprocess':4} #Constants of the candidate script to set for the run (e.g., {'nprocess':4,'TimeWindow':12})
+DataDir=None #A directory with out_track/, blobstats/ and ZSfile_general.nc (e.g., a sample of a real catalog). None writes synthetic inputs.
+NumNodes=20000 #Number of LPS nodes of the synthetic inputs
+Seed=0
+model_data_name='ERA5' #model_data_name of the input files in DataDir (the file names in both scripts)
+Answers="0\n\nN\nN\n3\n" #Answers to the classifier prompts: mode 0, geopotential unit, no 250 hPa data, global data, 3-hourly tracks
+ParityDir='parity' #Directory of the runs and the mismatch file
+Catalogs={'classified':f'classified_track/SyCLoPS_classified_{model_data_name}.parquet','input':f'input_track/SyCLoPS_input_{model_data_name}.parquet'}
+KeyColumns=['TID','ISOTIME'] #Columns that identify a node in both catalogs
+SkipColumns=[] #Columns that are not compared
+GoldenColumns=['Short_Label','Adjusted_Label','Track_Info','LPSAREA'] #Columns that must match exactly (a column that only one of the classified catalogs has is a mismatch; one that neither has is skipped)
+#Absolute and relative tolerances of float columns computed by the classifier, e.g., {'distance':(1e-9,0)}. Other columns must match exactly.
+#Do not give tolerances to the StitchNodes input columns: the classification compares them with thresholds, so any change in their values is a regression.
+Tolerances={}
+AppendTime=None #A time (e.g., '1990-07-01') to check the append mode of the candidate (see above). The nodes are then matched by ISOTIME, LON, LAT and MSLP, as the TIDs differ.
+MaxShow=5 #Number of mismatched nodes to print for each column
+MismatchFile=os.path.join(ParityDir,'parity_mismatches.csv')
+
+#------------------Functions--------------------#
+#The classifier_source function below returns the classifier script and its SyCLoPS_io.py (None if the version has none) of a git revision or a script path.
+def classifier_source(version):
+    if version is None:
+        version=os.path.join(RepoDir,'SyCLoPS_Classifier.py')
+    if os.path.isfile(version):
+        with open(version) as f:
+            return f.read(),None
+    show=lambda f: subprocess.run(['git','-C',RepoDir,'show',version+':'+f],capture_output=True,text=True)
+    code=show('SyCLoPS_Classifier.py')
+    if code.returncode!=0:
+        raise ValueError(str(version)+" is neither a classifier script nor a git revision with SyCLoPS_Classifier.py")
+    io=show('SyCLoPS_io.py')
+    return code.stdout,(io.stdout if io.returncode==0 else None)
+
+#The truncated_inputs function below writes the inputs of datadir with the StitchNodes nodes before time only (as if the record ended there) to a directory of ParityDir.
+def truncated_inputs(datadir,time):
+    out=os.path.join(ParityDir,'data_before_'+re.sub(r'\W','',time))
+    shutil.rmtree(out,ignore_errors=True);os.makedirs(os.path.join(out,'out_track'))
+    for f in ['blobstats','ZSfile_general.nc']:
+        os.symlink(os.path.abspath(os.path.join(datadir,f)),os.path.join(out,f))
+    cut=tuple(int(v) for v in (re.findall(r'\d+',time)+['0']*3)[:4])
+    for f in glob.glob(os.path.join(datadir,'out_track','*.csv')):
+        with open(f) as src,open(os.path.join(out,'out_track',os.path.basename(f)),'w') as dst:
+            header=src.readline();dst.write(header)
+            names=[c.strip() for c in header.split(',')]
+            if 'year' in names:
+                k=[names.index(c) for c in ('year','month','day','hour')];when=lambda v: tuple(int(v[i]) for i in k)
+            else:
+                k=names.index('ISOTIME');when=lambda v: tuple(int(x) for x in re.findall(r'\d+',v[k])[:4])
+            for line in src:
+                if when(line.split(','))<cut:
+                    dst.write(line)
+    return out
+
+#The run_version function below runs a classifier version in its own directory (linked to the inputs in datadir) with the given constants.
+#The catalogs of the run directory catalogs (if given) are copied in first (the catalogs extended in the append mode).
+def run_version(name,version,settings,datadir,catalogs=None):
+    rundir=os.path.join(ParityDir,name)
+    shutil.rmtree(rundir,ignore_errors=True)
+    for d in ['input_track','classified_track','other_info']:
+        os.makedirs(os.path.join(rundir,d))
+        for f in glob.glob(os.path.join(catalogs,d,'*.parquet')) if catalogs is not None and d!='other_info' else []:
+            shutil.copy(f,os.path.join(rundir,d))
+    for f in ['out_track','blobstats','ZSfile_general.nc']:
+        os.symlink(os.path.abspath(os.path.join(datadir,f)),os.path.join(rundir,f))
+    for f in glob.glob(os.path.join(datadir,'*','*_cache.parquet')): #Cold runs: no cached track tables
+        os.remove(f)
+    code,io=classifier_source(version)
+    with open(os.path.join(rundir,'parity_source.py'),'w') as f:
+        f.write(code)
+    if io is not None: #The script directory comes first on sys.path, so a revision runs with its own SyCLoPS_io.py
+        with open(os.path.join(rundir,'SyCLoPS_io.py'),'w') as f:
+            f.write(io)
+    script_copy(os.path.join(rundir,'parity_source.py'),os.path.join(rundir,'parity_classifier.py'),**{k:repr(v) for k,v in settings.items()})
+    env=dict(os.environ,PYTHONPATH=os.pathsep.join([os.path.abspath(RepoDir),os.environ.get('PYTHONPATH','')]))
+    print(f"Running the {name} ({version if version is not None else 'working tree'}) ...")
+    with open(os.path.join(rundir,'parity_classifier.log'),'w') as log:
+        subprocess.run([sys.executable,'parity_classifier.py'],cwd=rundir,input=Answers.encode(),stdout=log,stderr=subprocess.STDOUT,env=env,check=True)
+    return rundir
+
+#The normalize function below makes a catalog column comparable across versions: labels as strings and Track_Info as the strings of its track tags.
+def normalize(col,v):
+    if col=='Track_Info' and v.dtype.kind in 'iuf': #(float after the outer merge if a side has unmatched nodes)
+        with contextlib.redirect_stdout(None): #The classifier prints its introduction on import
+            from SyCLoPS_Classifier import track_info_strings
+        return pd.Series(track_info_strings(v.to_numpy(dtype=np.int64)),index=v.index).astype(object)
+    if v.dtype.kind not in 'iufbM':
+        return v.astype(object).where(v.notna(),None)
+    return v
+
+#The lowmemory_differs function below tells whether only one of the reference and the candidate runs in the low-memory mode (see the known differences above).
+def lowmemory_differs():
+    return bool(ReferenceSettings.get('LowMemory',False))!=bool(CandidateSettings.get('LowMemory',False))
+
+#The compare_catalogs function below matches the nodes of two catalogs by KeyColumns and returns the mismatches of each column
+#(with the node and track context) and a summary row per column.
+def compare_catalogs(catalog,ref,cand,golden):
+    for df in (ref,cand):
+        df['node_in_track']=df.groupby('TID').cumcount() #Position of the node in its track (for the context)
+    both=ref.merge(cand,on=KeyColumns,how='outer',suffixes=('_ref','_cand'),indicator=True)
+    if 'TID' not in both.columns: #The TIDs are not compared when the nodes are matched without them (AppendTime)
+        both['TID']=both.TID_ref.fillna(both.TID_cand)
+    context=KeyColumns+(['TID'] if 'TID' not in KeyColumns else [])+[c+'_ref' for c in ['LON','LAT','node_in_track'] if c in ref.columns and c not in KeyColumns]
+    mismatches=[];summary=[]
+    unmatched=both._merge!='both'
+    if unmatched.any():
+        m=both.loc[unmatched,context].copy()
+        m['column']='(node)';m['reference']=np.where(both._merge[unmatched]=='left_only','present','missing')
+        m['candidate']=np.where(both._merge[unmatched]=='right_only','present','missing')
+        mismatches.append(m)
+        summary.append({'catalog':catalog,'column':'(node)','mismatches':int(unmatched.sum()),'tracks':both.TID[unmatched].nunique(),'max_abs_diff':np.nan})
+    both=both[~unmatched]
+    cols=[c for c in ref.columns if c not in KeyColumns+SkipColumns+['node_in_track','TID']]
+    for c in [g for g in golden if g not in ref.columns and g in cand.columns]: #(Golden columns that neither catalog has, e.g., LPSAREA in modes 2 and 3, are not compared.)
+        summary.append({'catalog':catalog,'column':c,'mismatches':len(both),'tracks':both.TID.nunique(),'max_abs_diff':np.nan,'note':'missing in the reference'})
+    for c in cols:
+        if c not in cand.columns:
+            summary.append({'catalog':catalog,'column':c,'mismatches':len(both) if c in golden else 0,'tracks':both.TID.nunique() if c in golden else 0,'max_abs_diff':np.nan,'note':'missing in the candidate'})
+            continue
+        a=normalize(c,both[c+'_ref']);b=normalize(c,both[c+'_cand'])
+        diff=np.nan
+        if a.dtype.kind in 'iuf' and b.dtype.kind in 'iuf':
+            x=a.to_numpy(dtype=float);y=b.to_numpy(dtype=float)
+            atol,rtol=Tolerances.get(c,(0,0)) if c not in golden else (0,0)
+            with np.errstate(invalid='ignore'):
+                bad=~((np.abs(x-y)<=atol+rtol*np.abs(x))|(np.isnan(x)&np.isnan(y))|(x==y))
+                diff=np.nanmax(np.abs(x-y)[bad]) if bad.any() and not np.all(np.isnan(np.abs(x-y)[bad])) else np.nan
+        else:
+            bad=~((a.to_numpy()==b.to_numpy())|(a.isna().to_numpy()&b.isna().to_numpy()))
+        summary.append({'catalog':catalog,'column':c,'mismatches':int(bad.sum()),'tracks':both.TID[bad].nunique(),'max_abs_diff':diff})
+        if bad.any() and lowmemory_differs() and a.dtype.kind=='f' and b.dtype.kind=='f': #(within a few float32 units in the last place, e.g., ratios of float32 columns)
+            if np.all(np.abs(x-y)[bad]<=8*np.finfo(np.float32).eps*np.maximum(np.abs(x),np.abs(y))[bad]):
+                summary[-1]['note']='float32 rounding (LowMemory)'
+        if bad.any():
+            m=both.loc[bad,context].copy()
+            m['column']=c;m['reference']=a[bad].to_numpy();m['candidate']=b[bad].to_numpy()
+            mismatches.append(m)
+    mismatches=pd.concat(mismatches,ignore_index=True) if mismatches else pd.DataFrame(columns=context+['column','reference','candidate'])
+    mismatches.insert(0,'catalog',catalog)
+    return mismatches.rename(columns={c+'_ref':c for c in ['LON','LAT','node_in_track']}),pd.DataFrame(summary)
+
+#---------------Main Program Starts----------------#
+if __name__ == '__main__':
+    if len(sys.argv)>1:
+        Reference=sys.argv[1]
+    os.makedirs(ParityDir,exist_ok=True)
+    with contextlib.redirect_stdout(None): #The classifier prints its introduction on import
+        from SyCLoPS_Classifier import TRACK_DTYPES
+    inputs={{'lon':'LON','lat':'LAT','track_id':'TID'}.get(c,c) for c in TRACK_DTYPES} #The StitchNodes columns in the catalogs
+    bad=set(Tolerances)&(set(GoldenColumns)|inputs)
+    if bad:
+        raise ValueError("The golden and StitchNodes input columns must match exactly. Remove the tolerances of: "+', '.join(sorted(bad)))
+    datadir=DataDir
+    if datadir is None:
+        datadir=os.path.join(ParityDir,'data')
+        if not os.path.exists(os.path.join(datadir,'out_track',f'{model_data_name}_lpstracks.csv')):
+            print(f"Writing synthetic inputs of {NumNodes} nodes ...")
+            synthetic_inputs(datadir,NumNodes,model_data_name=model_data_name,detectnodes=False,seed=Seed)
+    refdir=run_version('reference',Reference,ReferenceSettings,datadir)
+    if AppendTime is None:
+        canddir=run_version('candidate',Candidate,CandidateSettings,datadir)
+    else:
+        KeyColumns=['ISOTIME','LON','LAT','MSLP'];SkipColumns=SkipColumns+['ind'] #(ind is the row of a node in the StitchNodes file of its run)
+        firstdir=run_version('candidate_before',Candidate,CandidateSettings,truncated_inputs(datadir,AppendTime))
+        canddir=run_version('candidate',Candidate,dict(CandidateSettings,AppendMode=True),datadir,catalogs=firstdir)
+    mismatches=[];summary=[]
+    for catalog,f in Catalogs.items():
+        ref=pd.read_parquet(os.path.join(refdir,f));cand=pd.read_parquet(os.path.join(canddir,f))
+        m,s=compare_catalogs(catalog,ref,cand,GoldenColumns if catalog=='classified' else [])
+        mismatches.append(m);summary.append(s)
+    mismatches=pd.concat(mismatches,ignore_index=True);summary=pd.concat(summary,ignore_index=True)
+    mismatches.to_csv(MismatchFile,index=False)
+    pd.set_option('display.width',200)
+    failed=summary[summary.mismatches>0]
+    print("\nColumns compared:",len(summary),"| Columns mismatched:",len(failed))
+    if lowmemory_differs():
+        notes=failed['note'] if 'note' in failed.columns else pd.Series(dtype=object)
+        print("LowMemory differs between the reference and the candidate (a known difference):",int((notes=='float32 rounding (LowMemory)').sum()),
+              "columns differ by float32 rounding only")
+    if len(failed)>0:
+        print("\n"+failed.to_string(index=False))
+        for (catalog,c),m in mismatches.groupby(['catalog','column'],sort=False):
+            print(f"\n{catalog} catalog, {c}: first {min(MaxShow,len(m))} of {len(m)} mismatched nodes")
+            print(m.drop(columns=['catalog','column']).head(MaxShow).to_string(index=False))
+        print("\nAll mismatched nodes are saved to "+MismatchFile)
+        sys.exit(1)
+    print("The candidate reproduces the reference catalogs.")
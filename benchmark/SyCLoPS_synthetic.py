@@ -0,0 +1,160 @@
+## Synthetic SyCLoPS inputs for benchmarking (no ERA5 data or TempestExtremes needed)
+# Please direct any questions to the author of this script: Yushan Han (yshhan@ucdavis.edu)
+# The synthetic_inputs function below writes, for a given number of LPS nodes:
+#   (1) a StitchNodes CSV file with the "--in_fmt" columns of SyCLoPS_main.py (out_track/{name}_lpstracks.csv),
+#   (2) a BlobStats file of size blobs around the nodes with the BlobStats output columns (blobstats/{name}_size_blob_stats.txt),
+#   (3) a small global ZS (surface geopotential) file on the grid that the nodes sit on (ZSfile_general.nc),
+#   (4) DetectNodes output files of the same nodes, one per month, for optional/NodeFile_to_csv.py (detectnodes/{name}_nodes_YYYYMM.txt).
+# The tracks mix tropical, extratropical, dry/thermal and high-altitude regimes with drifting random-walk paths, time gaps and jumpy nodes,
+# so all branches of the classification and the track filters are exercised. The data are random and carry no meteorological meaning.
+
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+#--------Constants (Change Accordingly)--------#
+OutDir='synthetic' #Output directory
+NumNodes=100000 #Number of LPS nodes (e.g., 1e4 to 1e7)
+model_data_name="ERA5" #Dataset name in the output file names (as in SyCLoPS_Classifier.py)
+GridRes=1.0 #Resolution of the ZS grid (degrees); nodes sit on its grid points
+NodesPerStep=32 #Average number of LPS nodes per time step (ERA5 at 3-hourly interval has ~30)
+Seed=0
+
+#The StitchNodes columns (the "--in_fmt" columns of SyCLoPS_main.py), with their noise scales along a track:
+NODE_COLUMNS=['MSLP','MSLPCC20','MSLPCC55','WS','DEEPSHEAR','UPPTKCC','MIDTKCC','LOWTKCC','Z500CC','VO500AVG','RH100MAX','RH850AVG','T850','Z850','ZS','U850DIFF','WS200PMX']
+NOISE={'MSLP':600,'MSLPCC20':60,'MSLPCC55':80,'WS':3,'DEEPSHEAR':3,'UPPTKCC':40,'MIDTKCC':30,'LOWTKCC':30,'Z500CC':30,'RH100MAX':10,'RH850AVG':6,'T850':2,'U850DIFF':4,'WS200PMX':5}
+#Ranges of the track means of each regime (tropical, extratropical, dry/thermal and high-altitude tracks), and the regime frequencies:
+REGIMES=[
+    {'MSLP':(92000,100500),'MSLPCC20':(150,600),'MSLPCC55':(150,900),'WS':(10,45),'DEEPSHEAR':(2,14),'UPPTKCC':(-250,-60),'MIDTKCC':(-100,20),'LOWTKCC':(-80,-1),
+     'Z500CC':(-50,100),'RH100MAX':(30,90),'RH850AVG':(70,100),'T850':(282,300),'U850DIFF':(-5,20),'WS200PMX':(10,40),'lat':(5,30)},
+    {'MSLP':(96000,101500),'MSLPCC20':(50,500),'MSLPCC55':(100,1200),'WS':(5,35),'DEEPSHEAR':(8,30),'UPPTKCC':(-150,100),'MIDTKCC':(-100,80),'LOWTKCC':(-100,80),
+     'Z500CC':(-50,200),'RH100MAX':(0,40),'RH850AVG':(50,100),'T850':(260,285),'U850DIFF':(-20,20),'WS200PMX':(20,70),'lat':(30,75)},
+    {'MSLP':(99000,101500),'MSLPCC20':(40,250),'MSLPCC55':(90,400),'WS':(3,15),'DEEPSHEAR':(5,25),'UPPTKCC':(-50,100),'MIDTKCC':(-50,80),'LOWTKCC':(-80,40),
+     'Z500CC':(-50,150),'RH100MAX':(0,60),'RH850AVG':(10,65),'T850':(285,310),'U850DIFF':(-10,10),'WS200PMX':(10,50),'lat':(10,40)},
+    {'MSLP':(99000,102500),'MSLPCC20':(40,300),'MSLPCC55':(90,500),'WS':(3,20),'DEEPSHEAR':(5,25),'UPPTKCC':(-100,100),'MIDTKCC':(-80,80),'LOWTKCC':(-80,80),
+     'Z500CC':(-50,150),'RH100MAX':(0,60),'RH850AVG':(20,90),'T850':(250,290),'U850DIFF':(-10,10),'WS200PMX':(10,50),'lat':(25,45)},
+]
+REGIME_FREQ=[0.25,0.45,0.2,0.1]
+
+#The zs_grid function below returns the longitudes, latitudes and a surface geopotential field (m**2 s**-2) with a few mountain ranges.
+def zs_grid(res,rng):
+    lat=np.arange(90,-90-res/2,-res);lon=np.arange(0,360,res)
+    LL,LT=np.meshgrid(lon,lat)
+    zs=np.zeros(LL.shape)
+    for lo,la,h,w in ((90,33,50000,150),(260,40,25000,80),(290,-20,40000,40),(20,46,20000,20),(30,0,12000,300)):
+        zs+=h*np.exp(-((LL-lo)**2+(LT-la)**2)/w)
+    zs=np.clip(zs+rng.normal(0,300,LL.shape)*(zs>1000),0,None)
+    return lon,lat,zs.astype(np.float32)
+
+#The synthetic_tracks function below builds the node table of nnodes LPS nodes (track_id, time, i, j, lon, lat and the NODE_COLUMNS) with array operations.
+def synthetic_tracks(nnodes,lon,lat,zs,rng,res,nodes_per_step=32):
+    L=rng.integers(7,45,size=nnodes//7+1)
+    L=L[:np.searchsorted(np.cumsum(L),nnodes)+1];L[-1]-=L.sum()-nnodes
+    L=L[L>0];ntr=len(L)
+    tid=np.repeat(np.arange(ntr),L)
+    pos=np.arange(nnodes)-np.repeat(np.cumsum(L)-L,L) #Node position along its track
+    ntime=max(int(np.ceil(nnodes/nodes_per_step)),60)
+    gap=np.where(rng.random(nnodes)<0.02,rng.integers(1,4,size=nnodes),0)*(pos>0) #Occasional missing time steps
+    gap=np.cumsum(gap)-np.repeat(np.cumsum(gap)[np.cumsum(L)-L]-gap[np.cumsum(L)-L],L)
+    step=rng.integers(0,np.maximum(ntime-L,1))[tid]+pos+gap
+    regime=rng.choice(len(REGIMES),size=ntr,p=REGIME_FREQ)
+    #Paths: a drift and a random walk from a start point in the latitude band of the regime, with a few jumpy nodes
+    latlo,lathi=np.array([REGIMES[r]['lat'] for r in range(len(REGIMES))]).T
+    lat0=rng.uniform(latlo[regime],lathi[regime])*rng.choice([-1,1],size=ntr)
+    lon0=rng.uniform(0,360,size=ntr)
+    drift_lat=np.where(regime==0,rng.normal(0.3,0.3,size=ntr)*np.sign(lat0),rng.normal(0,0.3,size=ntr))
+    drift_lon=np.where(regime==0,-rng.uniform(0.5,1.5,size=ntr),np.where(regime==1,rng.uniform(0.5,2.0,size=ntr),rng.normal(0,0.2,size=ntr)))
+    walk=rng.normal(0,0.3,size=(2,nnodes))
+    walk=np.cumsum(walk,axis=1)-np.repeat(np.cumsum(walk,axis=1)[:,np.cumsum(L)-L]-walk[:,np.cumsum(L)-L],L,axis=1)
+    la=lat0[tid]+drift_lat[tid]*pos+walk[0];lo=lon0[tid]+drift_lon[tid]*pos+walk[1]
+    jumpy=rng.random(nnodes)<0.02
+    la=la+jumpy*rng.uniform(-8,8,size=nnodes);lo=lo+jumpy*rng.uniform(-8,8,size=nnodes)
+    la=np.clip(la,-85,85)
+    j=np.round((90-la)/res).astype(np.int64);i=np.round(lo/res).astype(np.int64)%len(lon)
+    df=pd.DataFrame({'track_id':tid,'step':step,'i':i,'j':j,'lon':lon[i],'lat':lat[j]})
+    #Diagnostics: a mean per track drawn from the ranges of its regime, plus noise along the track
+    for c in NOISE:
+        lo_,hi_=np.array([REGIMES[r][c] for r in range(len(REGIMES))]).T
+        df[c]=rng.uniform(lo_[regime],hi_[regime])[tid]+rng.normal(0,NOISE[c],size=nnodes)
+    df['MSLPCC55']=df.MSLPCC55.clip(lower=60);df['MSLPCC20']=df.MSLPCC20.clip(lower=0)
+    df['RH100MAX']=df.RH100MAX.clip(0,100);df['RH850AVG']=df.RH850AVG.clip(0,100)
+    df['VO500AVG']=np.sign(df.lat.to_numpy()+1e-9)*rng.uniform(-2e-5,1e-4,size=nnodes) #Mostly cyclonic
+    df['ZS']=zs[j,i].astype(np.float64)
+    df['Z850']=df.ZS+np.where(rng.random(nnodes)<0.05,rng.uniform(-2000,900,size=nnodes),rng.uniform(1000,15000,size=nnodes))
+    return df[['track_id','step','i','j','lon','lat']+NODE_COLUMNS]
+
+#The synthetic_blobs function below builds the BlobStats table of size blobs: zero to two blobs near each node, plus blobs away from any node.
+def synthetic_blobs(df,rng):
+    nb=rng.choice([0,1,1,2],size=len(df))
+    k=np.repeat(np.arange(len(df)),nb)
+    n=len(k);nbg=len(df)//20
+    off=rng.uniform(0,8,size=n);ang=rng.uniform(0,2*np.pi,size=n)
+    clat=np.concatenate((np.clip(df.lat.to_numpy()[k]+off*np.sin(ang),-89,89),rng.uniform(-80,80,size=nbg)))
+    clon=np.concatenate(((df.lon.to_numpy()[k]+off*np.cos(ang))%360,rng.uniform(0,360,size=nbg)))
+    step=np.concatenate((df.step.to_numpy()[k],rng.choice(df.step.to_numpy(),size=nbg)))
+    hw=rng.uniform(1,6,size=n+nbg)
+    minlon=(clon-hw)%360;maxlon=(clon+hw)%360
+    wrap=minlon>maxlon
+    minlon[wrap],maxlon[wrap]=maxlon[wrap].copy(),minlon[wrap].copy() #Blobs across the prime meridian span more than 180 degrees of longitude (as in the BlobStats output)
+    dfb=pd.DataFrame({'step':step,'centlon':clon,'centlat':clat,'minlat':np.maximum(clat-hw,-90),'maxlat':np.minimum(clat+hw,90),
+                      'minlon':minlon,'maxlon':maxlon,'area':rng.uniform(1e10,1e12,size=n+nbg),'ike':rng.uniform(1e13,1e15,size=n+nbg)})
+    dfb=dfb.sort_values('step',kind='stable').reset_index(drop=True)
+    dfb.insert(0,'blobid',np.arange(1,len(dfb)+1));dfb.insert(1,'tindex',0)
+    return dfb
+
+#The write_table function below writes a data frame as delimited text without a header, chunk by chunk (sep is placed after each delimiter, e.g., ', ').
+def write_table(f,df,delimiter,sep='',chunk=1000000):
+    for s in range(0,len(df),chunk):
+        sink=pa.BufferOutputStream()
+        pacsv.write_csv(pa.Table.from_pandas(df.iloc[s:s+chunk],preserve_index=False),sink,pacsv.WriteOptions(include_header=False,delimiter=delimiter,quoting_style='none'))
+        f.write(sink.getvalue().to_pybytes().replace(delimiter.encode(),(delimiter+sep).encode()))
+
+#The synthetic_inputs function below writes the synthetic inputs of nnodes LPS nodes to outdir (see the top of this file) and returns the numbers of nodes and blobs.
+def synthetic_inputs(outdir,nnodes,model_data_name="ERA5",res=1.0,nodes_per_step=32,seed=0,detectnodes=True):
+    rng=np.random.default_rng(seed)
+    for d in ['out_track','blobstats','input_track','classified_track','other_info']+(['detectnodes'] if detectnodes else []):
+        os.makedirs(os.path.join(outdir,d),exist_ok=True)
+    lon,lat,zs=zs_grid(res,rng)
+    xr.Dataset({'ZS':(('latitude','longitude'),zs)},coords={'latitude':lat,'longitude':lon}).to_netcdf(os.path.join(outdir,'ZSfile_general.nc'))
+    df=synthetic_tracks(nnodes,lon,lat,zs,rng,res,nodes_per_step)
+    dfb=synthetic_blobs(df,rng)
+    t0=np.datetime64('1990-01-01T00','h')
+    #StitchNodes CSV (", "-separated like the StitchNodes output)
+    t=pd.DatetimeIndex(t0+3*df.step.to_numpy().astype('m8[h]'))
+    out=pd.DataFrame({'track_id':df.track_id,'year':t.year,'month':t.month,'day':t.day,'hour':t.hour,'i':df.i,'j':df.j,'lon':df.lon,'lat':df.lat})
+    for c in NODE_COLUMNS:
+        out[c]=df[c].round(10 if c=='VO500AVG' else 4)
+    with open(os.path.join(outdir,'out_track',f'{model_data_name}_lpstracks.csv'),'wb') as f:
+        f.write((', '.join(out.columns)+'\n').encode())
+        write_table(f,out,',',' ')
+    #BlobStats file (tab-separated, with the time as "YYYY-MM-DD HH:MM:SS")
+    tb=t0+3*dfb.step.to_numpy().astype('m8[h]')
+    dfb['step']=pd.Series(np.datetime_as_string(tb,unit='s')).str.replace('T',' ',regex=False)
+    with open(os.path.join(outdir,'blobstats',f'{model_data_name}_size_blob_stats.txt'),'wb') as f:
+        write_table(f,dfb.rename(columns={'step':'time'}),'\t')
+    #DetectNodes files, one per month: a "year month day count hour" line for each time step, followed by its nodes
+    if detectnodes:
+        order=np.argsort(df.step.to_numpy(),kind='stable')
+        nodes=out.iloc[order][['i','j','lon','lat']+NODE_COLUMNS].reset_index(drop=True)
+        steps=df.step.to_numpy()[order]
+        tn=pd.DatetimeIndex(t0+3*steps.astype('m8[h]'))
+        month=tn.year*100+tn.month
+        for m in np.unique(month):
+            sel=np.flatnonzero(month==m)
+            sink=pa.BufferOutputStream()
+            pacsv.write_csv(pa.Table.from_pandas(nodes.iloc[sel],preserve_index=False),sink,pacsv.WriteOptions(include_header=False,delimiter='\t',quoting_style='none'))
+            lines=sink.getvalue().to_pybytes().split(b'\n')
+            us,start,count=np.unique(steps[sel],return_index=True,return_counts=True)
+            with open(os.path.join(outdir,'detectnodes',f'{model_data_name}_nodes_{m}.txt'),'wb') as f:
+                for s,a,c in zip(us,start,count):
+                    ts=tn[sel[a]]
+                    f.write(f"{ts.year}\t{ts.month}\t{ts.day}\t{c}\t{ts.hour}\n".encode())
+                    f.write(b'\t'+b'\n\t'.join(lines[a:a+c])+b'\n')
+    return len(df),len(dfb)
+
+if __name__ == '__main__':
+    nn,nb=synthetic_inputs(OutDir,int(NumNodes),model_data_name,GridRes,NodesPerStep,Seed)
+    print(f"Synthetic inputs of {nn} LPS nodes and {nb} size blobs are saved to {OutDir}")
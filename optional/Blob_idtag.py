@@ -3,12 +3,17 @@
 # Version: 2024-12-10
 
 import os
+import sys
 import numpy as np
 import xarray as xr
 import pandas as pd
 import multiprocessing as ma
 from scipy.spatial import cKDTree
 import time
+import shutil
+#The BlobStats reader and the time axis shared with SyCLoPS_Classifier.py (SyCLoPS_io.py in the parent directory of this script):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from SyCLoPS_io import CALENDARS,TRACK_FLAGS,isotime_hours,read_blobstats,share_arrays,attach_arrays,shared_dir
 
 #-----------Additional TE commands-----------#
 #Optional: exercute the additional TE commands in Python. One can also run these commands in a terminal.
@@ -17,9 +22,11 @@ os.system(TEcommand)
 
 #---------Constants and File Names----------#
 nthread=64 # Number of threads to use for parallel computing in this program
-ClassCatalog="SyCLoPS_classified.parquet" #The SyCLoPS classified catalog output by SyCLoPS_classifier.py
-SizeBlobStat="Size_blob_stats.parquet" #The size blob statistics previously saved by SyCLoPS_classifier.py
+ClassCatalog="SyCLoPS_classified.parquet" #The SyCLoPS classified catalog output by SyCLoPS_classifier.py (ClassifiedOutFile, or the directory of its hive-partitioned dataset, ClassifiedDatasetDir)
+CatalogFilters=None #Only tag the blobs of the nodes that pass these filters, e.g., [('year','>=',2005),('year','<=',2010)] with the partitioned dataset (only the files and row groups that may pass are read). None reads all nodes.
+SizeBlobStat="Size_blob_stats.parquet" #The size blob statistics previously saved by SyCLoPS_classifier.py. None tags only the preci blobs.
 PreciBlobStat="ERA5_preci_blob_stats.txt"  #The preci blob statistics file output by BlobStats
+Calendar=None #Calendar of the model data as in SyCLoPS_Classifier.py ('standard', 'noleap', 'all_leap' or '360_day'). None uses 'standard', or '360_day' if ISOTIME is a string column.
 
 #The filename of the size blob outputfile of TE's StitchBlobs (the first TE command in "TE_optional.sh"):
 SizeStitchFile="StitchBlobs_size_output.txt" 
@@ -27,48 +34,67 @@ SizeStitchFile="StitchBlobs_size_output.txt"
 PreciStitchFile="StitchBlobs_preci_output.txt"#The filename of the preci blob outputfile of TE's StitchBlobs
 
 #------------------Functions----------------#
-#The blobpairing function below outputs a blob index and a node index in tuples
+#The blobpairing function below outputs a blob index and a node index in tuples.
+#The arrays it reads are memory-mapped from the files in SharedFiles (see share_arrays in SyCLoPS_io.py), so the pool workers share one copy of them.
+#The nodes and blobs of the k-th timestep are NodeIdx[NodePtr[k]:NodePtr[k+1]] and BlobIdx[BlobPtr[k]:BlobPtr[k+1]].
 def blobpairing(k):
+    A=attach_arrays(SharedFiles)
     nodepair=[]
-    T=cKDTree(list(zip(X[NodeTime[k]],Y[NodeTime[k]],Z[NodeTime[k]])))
-    dft=dfc.iloc[NodeTime[k]] #At the same timestep for blobs and nodes
-    for i2 in BlobTime[k]: 
+    if k+1>=len(A['NodePtr']):
+        return nodepair
+    nodes=A['NodeIdx'][A['NodePtr'][k]:A['NodePtr'][k+1]]
+    T=cKDTree(np.column_stack((A['X'][nodes],A['Y'][nodes],A['Z'][nodes])))
+    lont=A['LON'][nodes];latt=A['LAT'][nodes] #At the same timestep for blobs and nodes
+    for i2 in A['BlobIdx'][A['BlobPtr'][k]:A['BlobPtr'][k+1]]:
         #First pair blobs with nodes that are within 5 degrees GCD of their centroids:
-        idx=T.query_ball_point((x[i2],y[i2],z[i2]),r=5*(np.pi/180))
-        if len(idx)>1:        
-            node=dfc.MSLP.iloc[np.array(NodeTime[k])[idx]].idxmin()
+        idx=T.query_ball_point((A['x'][i2],A['y'][i2],A['z'][i2]),r=5*(np.pi/180))
+        if len(idx)>1:
+            nid=nodes[idx]
+            node=nid[np.nanargmin(A['MSLP'][nid])]
             nodepair.append((i2,node))
         elif len(idx)==1:
-            node=NodeTime[k][idx[0]]
+            node=nodes[idx[0]]
             nodepair.append((i2,node))
         else:
             #If blobs are not paired with any nodes at this point, pairing nodes that are bounded by the extent of the blobs:
-            if dfblob.maxlon[i2]-dfblob.minlon[i2]>180:
-                nid=dft[((dft.LON>=350)&(dft.LON<360))|((dft.LON>=0)&(dft.LON<=10))\
-                    &(dft.LAT>=dfblob.minlat[i2])&(dft.LAT<=dfblob.maxlat[i2])].index.values
+            inlat=(latt>=A['minlat'][i2])&(latt<=A['maxlat'][i2])
+            if A['maxlon'][i2]-A['minlon'][i2]>180:
+                nid=nodes[((lont>=350)&(lont<360))|((lont>=0)&(lont<=10))&inlat]
             else:
-                nid=dft[(dft.LON>=dfblob.minlon[i2])&(dft.LON<=dfblob.maxlon[i2])\
-                    &(dft.LAT>=dfblob.minlat[i2])&(dft.LAT<=dfblob.maxlat[i2])].index.values
+                nid=nodes[(lont>=A['minlon'][i2])&(lont<=A['maxlon'][i2])&inlat]
             if len(nid)>0:
-                node=dfc.MSLP.iloc[nid].idxmin()
+                node=nid[np.nanargmin(A['MSLP'][nid])]
                 nodepair.append((i2,node))
     return nodepair
 #---------------Data Preparation----------------#
+#The paired_node column of the size blob statistics holds the row positions of the nodes in the whole classified catalog file, so it does not point to
+#the right nodes of a filtered catalog or of the partitioned dataset (sorted by ISOTIME in each file). Only the preci blobs (paired below) can be tagged with those.
+if SizeBlobStat is not None and (CatalogFilters is not None or os.path.isdir(ClassCatalog)):
+    raise ValueError("The size blobs can only be tagged with the whole classified catalog file (ClassifiedOutFile, no CatalogFilters). Set SizeBlobStat=None to tag the preci blobs only.")
 #Load the classified catalog in parquet format (PyArrow may be needed. See https://arrow.apache.org/docs/python/install.html)
-dfc=pd.read_parquet(ClassCatalog)
+dfc=pd.read_parquet(ClassCatalog,columns=['ISOTIME','LON','LAT','MSLP','Short_Label','Track_Info'],filters=CatalogFilters)
 #Load the size blob stats file previously saved in the classification process ("SyCLoPS_classifier.py")
-dfsb=pd.read_parquet(SizeBlobStat)
-
-#Open and format the preci blob statistics file output by TE's BlobStats
-dfblob=pd.read_csv(PreciBlobStat,sep="\t", header=None)
-dfblob=dfblob.drop(dfblob.columns[[1]], axis=1)
-dfblob.columns=["blobid","time","centlon","centlat","minlat","maxlat","minlon","maxlon"]
+if SizeBlobStat is not None:
+    dfsb=pd.read_parquet(SizeBlobStat)
+    if dfsb.paired_node.max()>=len(dfc):
+        raise ValueError(SizeBlobStat+" has blobs paired with nodes beyond the "+str(len(dfc))+" nodes of "+ClassCatalog+". Are they from the same run?")
+
+#Open and format the preci blob statistics file output by TE's BlobStats (blob times in hours since 1970-01-01, cached as parquet next to the file)
+calendar='standard' if pd.api.types.is_datetime64_any_dtype(dfc.ISOTIME) else CALENDARS[Calendar or '360_day']
+dfblob=read_blobstats(PreciBlobStat,calendar,columns=["blobid","time","centlon","centlat","minlat","maxlat","minlon","maxlon"])
+#dfblob=pd.read_csv(PreciBlobStat,sep="\t", header=None)
+#dfblob=dfblob.drop(dfblob.columns[[1]], axis=1)
+#dfblob.columns=["blobid","time","centlon","centlat","minlat","maxlat","minlon","maxlon"]
 #Generate a list of LPS node and preci blob index for each time step.
 temp_index1=np.arange(0,len(dfc),1);temp_index2=np.arange(0,len(dfblob),1)
 dfc['ind']=temp_index1;dfblob['ind']=temp_index2
-NodeTime=dfc.groupby(dfc['ISOTIME'])['ind'].apply(list)
-temp_index=np.arange(0,len(dfblob),1)
-BlobTime=dfblob.groupby(dfblob['time'])['ind'].apply(list)
+NodeTime=dfc.groupby(isotime_hours(dfc.ISOTIME.to_numpy(),calendar).astype(np.int64))['ind'].apply(list)
+BlobTime=dfblob.groupby(dfblob['time'].astype(np.int64))['ind'].apply(list)
+#The blobs are paired with the nodes of the same hour: BlobTime is put on the hours of NodeTime (a filtered catalog covers only some timesteps,
+#and timesteps without nodes or without blobs are missing from one of them). Blobs at hours without nodes are left unpaired.
+if len(NodeTime)>0 and not NodeTime.index.isin(BlobTime.index).any():
+    raise ValueError("None of the node times of "+ClassCatalog+" are in "+PreciBlobStat+". Do they cover the same period, and is Calendar right?")
+BlobTime=BlobTime.reindex(NodeTime.index).apply(lambda b: b if isinstance(b,list) else [])
 
 #Convert longitudes and latitudes in both the input LPS catalog and blob stats dataset to the spherical coordinates (x,y,z):
 #This is for implementing KDTrees in the function
@@ -83,17 +109,26 @@ x=np.cos(lon*(np.pi/180))*np.cos(lat*(np.pi/180))
 y=np.sin(lon*(np.pi/180))*np.cos(lat*(np.pi/180))
 z=np.sin(lat*(np.pi/180))
 
+#Node and blob indices of each timestep (the hours of NodeTime) as flat arrays:
+NodePtr=np.append(0,np.cumsum(NodeTime.map(len).to_numpy()));NodeIdx=np.concatenate(NodeTime.to_list())
+BlobPtr=np.append(0,np.cumsum(BlobTime.map(len).to_numpy()));BlobIdx=np.concatenate(BlobTime.to_list()+[[]]).astype(np.int64)
+
 #---------------Preci Blob Pairing--------------#
 #Perform the function to pair preci blobs to LPS node
 #To save time, multiprocessing is recommended. Single-threaded may take ~1.5hrs for 12.5 million blobs.
-#Multiprocessing may take up more physical memroy (~ 43GB with 64 threads)
+#The workers memory-map the arrays they read from a RAM-backed directory instead of copying the catalog (this took ~ 43GB with 64 threads).
 startt = time.time()
+shmdir=shared_dir()
+SharedFiles=share_arrays(shmdir,X=X,Y=Y,Z=Z,x=x,y=y,z=z,LON=LON,LAT=LAT,MSLP=dfc.MSLP.to_numpy(dtype=float),
+                         minlat=dfblob.minlat.to_numpy(),maxlat=dfblob.maxlat.to_numpy(),minlon=dfblob.minlon.to_numpy(),maxlon=dfblob.maxlon.to_numpy(),
+                         NodePtr=NodePtr,NodeIdx=NodeIdx,BlobPtr=BlobPtr,BlobIdx=BlobIdx)
 pool_obj = ma.Pool(nthread)
-nodepair_list=pool_obj.map(blobpairing,range(len(BlobTime)))
+nodepair_list=pool_obj.map(blobpairing,range(len(NodeTime)))
 pool_obj.close()
+shutil.rmtree(shmdir)
 
 #processing the output tuple list and pair LSP nodes to preci blobs.
-nodepair_list=np.concatenate(nodepair_list)
+nodepair_list=np.concatenate([np.reshape(pairs,(-1,2)) for pairs in nodepair_list]).astype(np.int64) #(Timesteps without pairs give empty lists)
 dfblob['paired_node']=-1
 blobidx=[i[0] for i in nodepair_list] 
 nodematched=[i[1] for i in nodepair_list]
@@ -103,18 +138,26 @@ print("Time lapsed (s) for the preci blob pairing section: "+ str(endt-startt))
 #----------------Blob Tagging-------------------#
 #This is the default blob tagging system used in the SyCLoPS manuscript. 
 # Users may alter this arrangement to assign LPS tags of their choice.
-tcid=dfc[(dfc.Short_Label=='TC') & (dfc.Track_Info.str.contains('TC'))].index.values 
-msid=dfc[((dfc.Short_Label.str.contains('TLO'))|(dfc.Short_Label.str.contains('TD'))) & (dfc.Track_Info.str.contains('MS'))].index.values 
-ssid=dfc[(dfc.Short_Label=='SS(STLC)')&(dfc.Track_Info.str.contains('SS'))].index.values 
-plid=dfc[(dfc.Short_Label=='PL(PTLC)')&(dfc.Track_Info.str.contains('PL'))].index.values 
+#Track_Info is an integer bitmask of track tags in the classified catalog (TRACK_FLAGS in SyCLoPS_io.py).
+#Catalogs written with Track_Info strings (e.g., "Track_TC_EXT") are converted to the bitmask first.
+if pd.api.types.is_integer_dtype(dfc.Track_Info):
+    trackinfo=dfc.Track_Info.to_numpy()
+else:
+    trackinfo=sum(dfc.Track_Info.str.contains('_'+tag,regex=False).to_numpy()*flag for tag,flag in TRACK_FLAGS.items())
+slabel=dfc.Short_Label.to_numpy()
+tcid=np.flatnonzero((slabel=='TC') & ((trackinfo&TRACK_FLAGS['TC'])>0))
+msid=np.flatnonzero(np.isin(slabel,['TLO','TLO(ML)','TD','TD(MD)']) & ((trackinfo&TRACK_FLAGS['MS'])>0))
+ssid=np.flatnonzero((slabel=='SS(STLC)') & ((trackinfo&TRACK_FLAGS['SS(STLC)'])>0))
+plid=np.flatnonzero((slabel=='PL(PTLC)') & ((trackinfo&TRACK_FLAGS['PL(PTLC)'])>0))
 blobtag=np.ones(len(dfc))*5 #5= Other systems
 blobtag[tcid]=1 #1=TC tags
 blobtag[msid]=2 #2=MS tags
 blobtag[ssid]=3 #3=SS tags
 blobtag[plid]=4 #4=PL tags
 #Generate a new column in both the size and preci blob dataframe for assigning LPS tags defined above
-dfsb['blobtag']=0
-dfsb.loc[dfsb.paired_node>=0,'blobtag']=blobtag[[dfsb[dfsb.paired_node>=0].paired_node.to_numpy()]][0]
+if SizeBlobStat is not None:
+    dfsb['blobtag']=0
+    dfsb.loc[dfsb.paired_node>=0,'blobtag']=blobtag[[dfsb[dfsb.paired_node>=0].paired_node.to_numpy()]][0]
 dfblob['blobtag']=0
 dfblob.loc[dfblob.paired_node>=0,'blobtag']=blobtag[[dfblob[dfblob.paired_node>=0].paired_node.to_numpy()]][0]
 
@@ -125,9 +168,10 @@ dfblob.to_parquet("Preci_blob_stats.parquet")
 preciblob_class=dfblob.groupby('blobtag')['blobid'].apply(list)
 print('precipitation blob tag groups:')
 print(preciblob_class)
-sizeblob_class=dfsb.groupby('blobtag')['blobid'].apply(list)
-print('size blob tag groups:')
-print(sizeblob_class)
+if SizeBlobStat is not None:
+    sizeblob_class=dfsb.groupby('blobtag')['blobid'].apply(list)
+    print('size blob tag groups:')
+    print(sizeblob_class)
 #exit()
 
 #---------------Blob Mask Tagging---------------#
@@ -161,7 +205,7 @@ client
 #See the comment section above for initializing dask in Python script
 #Read the stitchblob outputfile list in parallel using dask:
 dfpreci=xr.open_mfdataset(PreciStitchFile,parallel=True).object_id
-dfsize=xr.open_mfdataset(SizeStitchFile,parallel=True).object_id
+dfsize=xr.open_mfdataset(SizeStitchFile,parallel=True).object_id if SizeBlobStat is not None else None
 
 #If SizeStitchFile or PreciStitchFile is a single nc file, use:
 #dfpreci=xr.open_mfdataset(PreciStitchFile).object_id
@@ -175,12 +219,13 @@ dfpreci=dfpreci.where(~(dfpreci.isin(preciblob_class[3])),3)
 dfpreci=dfpreci.where(~(dfpreci.isin(preciblob_class[4])),4)
 dfpreci=dfpreci.where(~(dfpreci.isin(preciblob_class[5])),5)
 
-dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[0])),0)
-dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[1])),1)
-dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[2])),2)
-dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[3])),3)
-dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[4])),4)
-dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[5])),5)
+if SizeBlobStat is not None:
+    dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[0])),0)
+    dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[1])),1)
+    dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[2])),2)
+    dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[3])),3)
+    dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[4])),4)
+    dfsize=dfsize.where(~(dfsize.isin(sizeblob_class[5])),5)
 
 
 #Then output the altered StitchBlobs files (by year):